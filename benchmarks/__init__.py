@@ -0,0 +1,9 @@
+#-*- coding: utf-8 -*-
+"""
+Benchmarks de los motores de inferencia.
+
+    * generators: redes noisy-or sintéticas por capas
+    * run: mide tiempos y memoria, y compara contra baseline.json
+
+Se ejecuta con `python -m benchmarks.run` (ver `python -m benchmarks.run -h`).
+"""
@@ -0,0 +1,31 @@
+#-*- coding: utf-8 -*-
+import json
+from benchmarks import generators, run
+
+
+def test_layered_network():
+    layers = generators.layered_network((2, 3, 4), fan_in=2, seed=1)
+    assert [len(layer) for layer in layers] == [2, 3, 4]
+    assert all(not ev.deps for ev in layers[0])
+    for previous, layer in zip(layers, layers[1:]):
+        for ev in layer:
+            assert len(ev.deps) == 2
+            assert set(ev.deps) <= set(previous)
+
+    evidence = generators.evidence(layers, 3, seed=1)
+    assert len(evidence) == 3 and set(evidence) <= set(layers[-1])
+
+
+def test_run(tmpdir, monkeypatch):
+    "Guarda el baseline y marca las regresiones."
+    monkeypatch.setitem(run.SERIES, 'chica',
+                        ([2], lambda v: run.Case((v, v), 1, 1)))
+    path = str(tmpdir.join('baseline.json'))
+    args = ['--series', 'chica', '--repeat', '1', '--baseline', path]
+    assert run.main(args + ['--save']) == 0
+    baseline = json.load(open(path))
+    assert sorted(baseline) == ['chica=2/binary', 'chica=2/joint',
+                                'chica=2/query']
+
+    json.dump(dict((k, 1e-12) for k in baseline), open(path, 'w'))
+    assert run.main(args) == 1
@@ -0,0 +1,56 @@
+#-*- coding: utf-8 -*-
+"""
+Generadores de redes noisy-or sintéticas.
+
+Las redes tienen la estructura por capas de ejercicio.py (condiciones
+ambientales -> enfermedades -> síntomas): cada evento de una capa depende de
+fan_in eventos de la capa anterior, elegidos al azar.
+"""
+from __future__ import print_function, division, unicode_literals
+import random
+
+import ib
+
+
+def layered_network(widths=(3, 3, 3), fan_in=2, gamma=(0.01, 0.3),
+                    alpha=(0.1, 0.9), seed=None):
+    """
+    Crea una red por capas.
+
+    Args:
+        widths: cantidad de eventos de cada capa, desde las raíces
+        fan_in: cantidad de dependencias de cada evento que no es raíz (como
+            máximo el ancho de la capa anterior)
+        gamma, alpha: intervalos de donde se sortean los gamma y las
+            influencias
+        seed: semilla del generador
+
+    Returns:
+        lista con los eventos de cada capa
+    """
+    rnd = random.Random(seed)
+    layers = []
+    for depth, width in enumerate(widths):
+        layer = []
+        for k in range(width):
+            deps = {}
+            if layers:
+                previous = layers[-1]
+                for p in rnd.sample(previous, min(fan_in, len(previous))):
+                    deps[p] = rnd.uniform(*alpha)
+            layer.append(ib.BinaryEvent(deps, gamma=rnd.uniform(*gamma),
+                                        name='L{}_{}'.format(depth, k)))
+        layers.append(layer)
+    return layers
+
+
+def evidence(layers, size, seed=None):
+    """
+    Evidencia al azar sobre eventos de la última capa (síntomas).
+
+    Returns:
+        diccionario evento -> bool con min(size, len(layers[-1])) eventos
+    """
+    rnd = random.Random(seed)
+    findings = rnd.sample(layers[-1], min(size, len(layers[-1])))
+    return dict([(f, rnd.random() < 0.5) for f in findings])
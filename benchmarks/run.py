@@ -0,0 +1,242 @@
+#-*- coding: utf-8 -*-
+"""
+Mide el tiempo y la memoria de las consultas sobre redes sintéticas.
+
+Para cada serie se varía un parámetro de la red (ancho de las capas,
+profundidad, cantidad de dependencias o de evidencia) y se mide:
+
+    * binary: BinaryEvent.prob_pos de un síntoma
+    * joint: JointProbability.prob_pos de los síntomas observados
+    * query: Network.query de una enfermedad dada la evidencia
+
+El tiempo por llamada es el mínimo de varias repeticiones, con las memorias
+de los eventos vacías en cada llamada. La memoria es el pico medido con tracemalloc en
+una ejecución aparte. Los tiempos se comparan contra un archivo de baseline y
+se marcan las regresiones; con --save se reescribe el baseline.
+
+Ej:
+    python -m benchmarks.run > bench_output.txt
+    python -m benchmarks.run --series ancho --save
+"""
+from __future__ import print_function, division, unicode_literals
+import argparse
+import collections
+import io
+import json
+import os
+import sys
+import timeit
+from decimal import Decimal
+
+import numpy as np
+
+import ib
+import ib_network
+from benchmarks import generators
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'baseline.json')
+
+Case = collections.namedtuple('Case', ['widths', 'fan_in', 'evidence'])
+
+# Serie -> (valores, función valor -> Case)
+SERIES = collections.OrderedDict([
+    ('ancho', ([4, 8, 16, 32], lambda v: Case((v, v, v), 3, 4))),
+    ('profundidad', ([2, 4, 6, 8], lambda v: Case((6,) * v, 3, 4))),
+    ('fan_in', ([1, 2, 4, 6], lambda v: Case((8, 8, 8), v, 4))),
+    ('evidencia', ([2, 4, 6, 8, 10], lambda v: Case((4, 8, 12), 3, v))),
+])
+
+OPERATIONS = ('binary', 'joint', 'query')
+
+# Duración mínima de cada medición, para que el tiempo sea estable
+MIN_TIME = 0.02
+
+# Cantidad de veces que se vuelven a medir las posibles regresiones
+RETRIES = 2
+
+Result = collections.namedtuple('Result', ['seconds', 'peak'])
+
+
+def _operations(case, seed):
+    """
+    Funciones sin argumentos que ejecutan cada operación medida sobre una red
+    generada para case.
+    """
+    layers = generators.layered_network(case.widths, case.fan_in, seed=seed)
+    events = [ev for layer in layers for ev in layer]
+    evidence = generators.evidence(layers, case.evidence, seed=seed)
+    symptom = layers[-1][0]
+    disease = layers[1][0] if len(layers) > 2 else layers[0][0]
+    joint = ib.JointProbability(*evidence)
+    net = ib_network.Network(events)
+
+    def clear():
+        for ev in events:
+            ev.cache_clear()
+        joint.cache_clear()
+
+    def binary():
+        clear()
+        symptom.prob_pos()
+
+    def joint_prob():
+        clear()
+        joint.prob_pos()
+
+    def query():
+        net.query(disease, evidence)
+
+    return {'binary': binary, 'joint': joint_prob, 'query': query}
+
+
+def _time(func, repeat):
+    """
+    Segundos por llamada a func: mínimo de repeat mediciones, cada una de
+    suficientes llamadas como para durar al menos MIN_TIME.
+    """
+    number = 1
+    while timeit.timeit(func, number=number) < MIN_TIME:
+        number *= 2
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def _calibration():
+    """
+    Tiempo de una carga fija de referencia. Los tiempos del baseline se
+    guardan divididos por este valor, para poder compararlos entre máquinas
+    o con la CPU a distinta velocidad.
+    """
+    def work():
+        total = Decimal(0)
+        for k in range(200):
+            total += Decimal(k) / Decimal(7)
+        np.multiply.reduce(np.linspace(0.5, 1, 64))
+    return _time(work, 5)
+
+
+def _peak(func):
+    "Pico de memoria (bytes) asignada por func."
+    import tracemalloc
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(series, repeat=5, memory=True, seed=0, only=None):
+    """
+    Ejecuta las series de benchmarks.
+
+    Args:
+        series: nombres de las series (ver SERIES)
+        repeat: repeticiones de cada medición
+        memory: si es True mide también el pico de memoria
+        seed: semilla de las redes generadas
+        only: si no es None, conjunto de claves a medir
+
+    Returns:
+        diccionario ordenado 'serie=valor/operación' -> Result
+    """
+    ret = collections.OrderedDict()
+    for name in series:
+        values, make_case = SERIES[name]
+        for value in values:
+            keys = dict([(op, '{}={}/{}'.format(name, value, op))
+                         for op in OPERATIONS])
+            if only is not None and not only & set(keys.values()):
+                continue
+            operations = _operations(make_case(value), seed)
+            for op in OPERATIONS:
+                if only is not None and keys[op] not in only:
+                    continue
+                func = operations[op]
+                seconds = _time(func, repeat)
+                peak = _peak(func) if memory else None
+                ret[keys[op]] = Result(seconds, peak)
+    return ret
+
+
+def compare(results, baseline, unit):
+    """
+    Compara los tiempos contra el baseline.
+
+    Args:
+        unit: tiempo de la carga de referencia (ver _calibration)
+
+    Returns:
+        diccionario clave -> tiempo / tiempo del baseline, sólo para las
+        claves presentes en el baseline
+    """
+    return dict([(k, r.seconds / unit / baseline[k])
+                 for k, r in results.items() if baseline.get(k)])
+
+
+def report(results, ratios, threshold, out=sys.stdout):
+    "Imprime una tabla por serie y marca las regresiones."
+    current = None
+    for key, r in results.items():
+        name, rest = key.split('=', 1)
+        value, op = rest.split('/')
+        if name != current:
+            current = name
+            print('\nSerie: {}'.format(name), file=out)
+            print('{:>8} {:>8} {:>12} {:>12} {:>9}'.format(
+                'valor', 'op', 'tiempo[ms]', 'memoria[KiB]', 'vs base'),
+                file=out)
+        ratio = ratios.get(key)
+        print('{:>8} {:>8} {:>12.3f} {:>12} {:>9}{}'.format(
+            value, op, r.seconds * 1e3,
+            '-' if r.peak is None else '{:.1f}'.format(r.peak / 1024),
+            '-' if ratio is None else 'x{:.2f}'.format(ratio),
+            '  REGRESIÓN' if ratio is not None and ratio > threshold else ''),
+            file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--series', nargs='+', choices=list(SERIES),
+                        default=list(SERIES))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--no-memory', dest='memory', action='store_false')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--threshold', type=float, default=2.0,
+                        help='cociente contra el baseline a partir del cual '
+                             'se marca una regresión')
+    parser.add_argument('--save', action='store_true',
+                        help='guarda los tiempos medidos como baseline')
+    args = parser.parse_args(argv)
+
+    unit = _calibration()
+    results = measure(args.series, args.repeat, args.memory)
+    unit = min(unit, _calibration())
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with io.open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    ratios = compare(results, baseline, unit)
+
+    # Las mediciones marcadas se repiten para descartar ruido pasajero
+    for _ in range(RETRIES):
+        flagged = set(k for k, r in ratios.items() if r > args.threshold)
+        if not flagged:
+            break
+        again = measure(args.series, args.repeat, False, only=flagged)
+        for k, r in again.items():
+            if r.seconds < results[k].seconds:
+                results[k] = results[k]._replace(seconds=r.seconds)
+        ratios = compare(results, baseline, unit)
+    report(results, ratios, args.threshold)
+
+    if args.save:
+        baseline.update((k, r.seconds / unit) for k, r in results.items())
+        with io.open(args.baseline, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(baseline, indent=4, sort_keys=True) + '\n')
+        return 0
+    return 1 if any(r > args.threshold for r in ratios.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,22 +1,36 @@
 #-*- coding: utf-8 -*-
 from __future__ import print_function, division, unicode_literals
 import io
+import os
+import sys
 import pandas as pd
 import json
 
-with open('ejercicio.wppl.json', 'r') as f:
-    wppl = json.load(f)
-
-with open('ejercicio.py.json', 'r') as f:
+# Uso: python comp_py_wppl.py [referencia.json] [py.json] [salida.txt]
+# La referencia puede ser la salida de webppl (ejercicio.wppl.json) o la de
+# ib_reference.py (ejercicio.ref.json); la columna toma el nombre del archivo
+# (la última extensión antes de .json, o el nombre entero si no la hay).
+args = sys.argv[1:]
+ref_path = args[0] if len(args) > 0 else 'ejercicio.wppl.json'
+py_path = args[1] if len(args) > 1 else 'ejercicio.py.json'
+out_path = args[2] if len(args) > 2 else 'comp.txt'
+ref_stem, ref_ext = os.path.splitext(
+    os.path.splitext(os.path.basename(ref_path))[0])
+ref_name = ref_ext[1:] or ref_stem
+
+with open(ref_path, 'r') as f:
+    ref = json.load(f)
+
+with open(py_path, 'r') as f:
     py = json.load(f)
 
-assert set(wppl.keys()) == set(py.keys())
+assert set(ref.keys()) == set(py.keys())
 
-df = pd.DataFrame.from_records([py, wppl], index=['py', 'wppl'])
+df = pd.DataFrame.from_records([py, ref], index=['py', ref_name])
 df = df.T
-df['Diff'] = df['wppl'] - df['py'] 
+df['Diff'] = df[ref_name] - df['py']
 
-with io.open('comp.txt', 'w', encoding='utf8') as f:
+with io.open(out_path, 'w', encoding='utf8') as f:
     print(u'Probabilidad de las enfermedades dados los síntomas', file=f)
     df_enfermedades = df.loc[['tb_dado_sintomas', 'cancer_dado_sintomas']]
     print(df_enfermedades.to_string(), file=f)
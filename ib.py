@@ -12,12 +12,79 @@ En el módulo también se encuentra definida la clase JointProbability que model
 una variable aleatoria que es conjunción de varios BinaryEvents. Esta clase
 también tiene ciertas restricciones respecto a qué puede modelar (ver
 documentación).
+
+Las cuentas se realizan por defecto con decimal.Decimal. Todos los métodos de
+consulta aceptan además un backend numérico alternativo (float64 o float64 en
+espacio logarítmico), ver ib_numeric. El backend por defecto de una red puede
+cambiarse con set_backend.
 """
 from __future__ import print_function, division, unicode_literals
+import collections
 import itertools
+import weakref
 from decimal import Decimal
 
-class BinaryEvent:
+import ib_numeric
+from ib_numeric import DECIMAL, LOG
+
+# Métodos de marginalización (ver BinaryEvent.prob_pos)
+FACTORIZED = 'factorized'
+ENUMERATE = 'enumerate'
+
+CacheInfo = collections.namedtuple('CacheInfo', ['hits', 'misses', 'size'])
+
+# Cantidad máxima de dependencias para las que JointProbability materializa
+# su tabla condicional (ver JointProbability._table)
+MAX_TABLE_DEPS = 16
+
+
+class _Dependencies(dict):
+    """
+    Diccionario BinaryEvent -> Decimal con las influencias de un evento.
+
+    Se comporta como un diccionario común pero convierte los valores a Decimal
+    y avisa al evento dueño cada vez que se modifica, para que este pueda
+    invalidar las probabilidades que tenga memorizadas.
+    """
+
+    def __init__(self, owner, deps):
+        dict.__init__(self, [(k, Decimal(v)) for k, v in deps.items()])
+        self._owner = owner
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, Decimal(value))
+        self._owner._deps_changed()
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._owner._deps_changed()
+
+    def update(self, *args, **kwargs):
+        for k, v in dict(*args, **kwargs).items():
+            dict.__setitem__(self, k, Decimal(v))
+        self._owner._deps_changed()
+
+    def setdefault(self, key, default=0):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, *args):
+        ret = dict.pop(self, *args)
+        self._owner._deps_changed()
+        return ret
+
+    def popitem(self):
+        ret = dict.popitem(self)
+        self._owner._deps_changed()
+        return ret
+
+    def clear(self):
+        dict.clear(self)
+        self._owner._deps_changed()
+
+
+class BinaryEvent(object):
     """
     Esta clase modela un evento binario en una red bayesiana.
 
@@ -49,7 +116,19 @@ class BinaryEvent:
     Se asume que el grafo de dependencias entre eventos binarios no tiene
     ciclos y además no tiene conexiones "horizontales". Esto es, si X <- (A, B)
     (X depende de A y B) entonces no pasa que A <- B o B <- A.
+
+    Las probabilidades calculadas por _prob_pos se memorizan en cada evento,
+    indexadas por las condiciones impuestas sobre sus dependencias. Modificar
+    gamma o deps (en el evento o en cualquiera de sus ancestros) invalida
+    automáticamente lo memorizado en el evento y en sus descendientes. Ver
+    cache_info y cache_clear.
+
+    Para redes grandes conviene compilar los eventos en un ib_network.Network
+    y consultar sobre esa representación compacta.
     """
+    __slots__ = ('_gamma', '_deps', 'deps_keys', 'name', 'backend', '_linked',
+                 '_cache', '_params', '_cache_hits', '_cache_misses',
+                 '_children', '__weakref__')
     
     def __init__(self, deps={}, gamma=0, name=None):
         """
@@ -60,13 +139,119 @@ class BinaryEvent:
                 influencias en deps
             deps: diccionario de BinaryEvent -> [0, 1] que describe la
                 influencia de cada evento.
+
+        El atributo backend es el backend con el que se calculan las
+        consultas que no indican uno (None es Decimal). Ver set_backend.
         """
-        self.gamma = Decimal(gamma)
-        self.deps = dict([(k, Decimal(v)) for k, v in deps.items()])
-        self.deps_keys = self.deps.keys()
+        self._init_cache()
+        self.backend = None
+        self._linked = set()
+        self._gamma = Decimal(gamma)
+        self.deps = deps
         self.name = name
 
-    def _p_neg_fw_full(self, full_config):
+    def _init_cache(self):
+        "Inicializa la memoria de probabilidades y sus estadísticas."
+        self._cache = {}
+        self._params = {}
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self._children = weakref.WeakSet()
+
+    @property
+    def gamma(self):
+        "Probabilidad de éxito si no sucede ninguna de las influencias."
+        return self._gamma
+
+    @gamma.setter
+    def gamma(self, value):
+        self._gamma = Decimal(value)
+        self._invalidate()
+
+    @property
+    def deps(self):
+        "Diccionario BinaryEvent -> Decimal con la influencia de cada evento."
+        return self._deps
+
+    @deps.setter
+    def deps(self, value):
+        self._deps = _Dependencies(self, value)
+        self._deps_changed()
+
+    def _deps_changed(self):
+        """
+        Actualiza los enlaces con las dependencias luego de modificarlas.
+
+        Cada evento conoce a los eventos que dependen de él (sus hijos) para
+        poder avisarles cuando sus probabilidades cambian.
+        """
+        self.deps_keys = self._deps.keys()
+        for k in self._linked - set(self.deps_keys):
+            k._children.discard(self)
+        for k in self.deps_keys:
+            k._children.add(self)
+        self._linked = set(self.deps_keys)
+        self._invalidate()
+
+    def _invalidate(self):
+        """
+        Descarta las probabilidades memorizadas del evento y sus descendientes.
+
+        Se llama al modificar los parámetros del evento, que es el origen de
+        la invalidación que reciben los descendientes (ver _on_invalidate).
+        """
+        pending = [self]
+        seen = set()
+        while pending:
+            ev = pending.pop()
+            if ev in seen:
+                continue
+            seen.add(ev)
+            ev._cache.clear()
+            ev._params.clear()
+            ev._on_invalidate(self)
+            pending.extend(ev._children)
+
+    def _on_invalidate(self, source):
+        """
+        Permite a las subclases reaccionar a una invalidación.
+
+        Args:
+            source: evento cuyos parámetros cambiaron
+        """
+        pass
+
+    def cache_info(self):
+        """
+        Estadísticas de la memoria de probabilidades del evento.
+
+        Returns:
+            CacheInfo con la cantidad de aciertos (hits), de fallos (misses) y
+            de probabilidades memorizadas actualmente (size).
+        """
+        return CacheInfo(self._cache_hits, self._cache_misses,
+                         len(self._cache))
+
+    def cache_clear(self):
+        "Descarta la memoria de probabilidades y reinicia sus estadísticas."
+        self._cache.clear()
+        self._cache_hits = 0
+        self._cache_misses = 0
+
+    def _parameters(self, backend):
+        """
+        Parámetros gamma y alphas (en el orden de deps_keys) preparados para
+        el backend. Se memorizan hasta que el evento se modifica.
+        """
+        try:
+            return self._params[backend.name]
+        except KeyError:
+            ret = backend.parameters(self.gamma,
+                                     [self.deps[k] for k in self.deps_keys])
+            self._params[backend.name] = ret
+            return ret
+
+    def _p_neg_fw_full(self, full_config, backend=DECIMAL):
         """
         Calcula la probabilidad de X = 0 dada las dependencias.
         
@@ -76,6 +261,7 @@ class BinaryEvent:
             full_config: conjunto de dependencias que sabemos que se cumplen.
                 Las dependencias que no aparecen en el conjunto se asume que
                 no se cumplen.
+            backend: backend numérico del resultado (ver ib_numeric)
 
         Ej:
             Si mi clase es la variable X y es influenciada por las variables A,
@@ -83,14 +269,12 @@ class BinaryEvent:
 
             X._p_neg_fw_full({A, C}) == P(X = 0 | A = 1, B = 0, C = 1)
         """
-        ret = Decimal('1') - self.gamma
-        for ev, influence in self.deps.items():
-            if ev in full_config:
-                ret *= Decimal('1') - influence
-
-        return ret
+        gamma, alphas = self._parameters(backend)
+        probs = [backend.one if ev in full_config else backend.zero
+                 for ev in self.deps_keys]
+        return backend.noisy_or_neg(gamma, alphas, probs)
 
-    def _p_pos_fw_full(self, full_config):
+    def _p_pos_fw_full(self, full_config, backend=DECIMAL):
         """
         Calcula la probabilidad de X = 1 dada las dependencias.
 
@@ -105,10 +289,10 @@ class BinaryEvent:
 
             X._p_pos_fw_full({A, C}) == P(X = 1 | A = 1, B = 0, C = 1)
         """
-        ret = Decimal('1') - self._p_neg_fw_full(full_config)
-        return ret
+        return backend.complement(self._p_neg_fw_full(full_config, backend))
 
-    def _p_pos_fw(self, full_config, deps_settings):
+    def _p_pos_fw(self, full_config, deps_settings, method=ENUMERATE,
+                  backend=DECIMAL):
         """
         Calcula la probabilidad de X = 1 dado un caso de marginalización.
 
@@ -132,6 +316,9 @@ class BinaryEvent:
             deps_settings: Diccionario de BinaryEvent -> bool describe que 
                 información se conoce ya se asumía independientemente de la 
                 marginalización.
+            method: método con el que se calculan las probabilidades de las
+                dependencias (ver prob_pos).
+            backend: backend numérico del resultado (ver ib_numeric)
         
         Ej:
             Si mi clase es la variable X y es influenciada por las variables A,
@@ -165,17 +352,84 @@ class BinaryEvent:
             función ya que full_config = {A} nos dice que queremos A=1 y
             deps_settings = {A: false} nos dice que sabemos A=0.
         """
-        ret = self._p_pos_fw_full(full_config)
+        ret = self._p_pos_fw_full(full_config, backend)
         for k in self.deps_keys:
             if k not in deps_settings.keys():
                 if k in full_config:
-                    ret *= k._prob_pos()
+                    p = k._prob_pos(method=method, backend=backend)
                 else:
-                    ret *= k._prob_neg()
+                    p = k._prob_neg(method=method, backend=backend)
+                ret = backend.mul(ret, p)
+        return ret
+
+    def _cache_key(self, deps_settings, method, backend):
+        """
+        Clave de memoria para unas condiciones sobre las dependencias.
+
+        Sólo importan las condiciones sobre dependencias directas de 'self';
+        el resto no afecta el resultado de _prob_pos.
+        """
+        return (method, backend.name, frozenset([(k, bool(v))
+                                   for k, v in deps_settings.items()
+                                   if k in self.deps_keys]))
+
+    def _prob_pos(self, deps_settings={}, method=FACTORIZED, backend=DECIMAL):
+        """
+        Versión de prob_pos que devuelve la representación del backend
+        (Decimal por defecto). Ver prob_pos.
+        """
+        key = self._cache_key(deps_settings, method, backend)
+        try:
+            ret = self._cache[key]
+        except KeyError:
+            self._cache_misses += 1
+            if method == FACTORIZED:
+                ret = self._marginalize_factorized(deps_settings, backend)
+            elif method == ENUMERATE:
+                ret = self._marginalize(deps_settings, backend)
+            else:
+                raise ValueError('Método desconocido: {}'.format(method))
+            self._cache[key] = ret
+        else:
+            self._cache_hits += 1
         return ret
 
-    def _prob_pos(self, deps_settings={}):
-        """Decimal version of prob_pos. Ver prob_pos"""
+    def _dep_prob(self, k, deps_settings, backend):
+        """
+        Probabilidad de que suceda la dependencia k dadas las condiciones.
+
+        Es 1 o 0 si deps_settings fija k y P(k = 1) si no.
+        """
+        if k in deps_settings:
+            return backend.one if deps_settings[k] else backend.zero
+        return k._prob_pos(backend=backend)
+
+    def _marginalize_factorized(self, deps_settings, backend):
+        """
+        Calcula P(X = 1 | deps_settings) en tiempo lineal en las dependencias.
+
+        Como las dependencias son independientes entre si, la marginalización
+        de prob_pos se factoriza:
+
+            P(X = 0 | A = 1) = (1 - gamma) * (1 - alpha_A) *
+                               (1 - alpha_B * P(B=1)) * (1 - alpha_C * P(C=1))
+
+        Las condiciones de deps_settings fijan algunos factores en (1 - alpha)
+        o en 1.
+        """
+        gamma, alphas = self._parameters(backend)
+        probs = [self._dep_prob(k, deps_settings, backend)
+                 for k in self.deps_keys]
+        return backend.complement(backend.noisy_or_neg(gamma, alphas, probs))
+
+    def _marginalize(self, deps_settings, backend, method=ENUMERATE):
+        """
+        Calcula P(X = 1 | deps_settings) enumerando todas las configuraciones
+        de las dependencias. Ver prob_pos.
+
+        method es el método con el que se calculan las probabilidades de las
+        dependencias.
+        """
         all_configs = [c
                        for k in range(len(self.deps_keys) + 1)
                        for c in itertools.combinations(self.deps_keys, k)]
@@ -184,15 +438,19 @@ class BinaryEvent:
                               for c in all_configs
                               if self._is_compatible(c, deps_settings)]
 
-        return sum([self._p_pos_fw(c, deps_settings) 
-                    for c in compatible_configs])
+        return backend.sum([self._p_pos_fw(c, deps_settings, method, backend)
+                            for c in compatible_configs])
 
-    def _prob_neg(self, deps_settings={}):
-        """Decimal version of prob_neg. Ver prob_neg"""
-        return Decimal('1') - self._prob_pos(deps_settings)
+    def _prob_neg(self, deps_settings={}, method=FACTORIZED, backend=DECIMAL):
+        """
+        Versión de prob_neg que devuelve la representación del backend
+        (Decimal por defecto). Ver prob_neg.
+        """
+        return backend.complement(
+            self._prob_pos(deps_settings, method, backend))
 
 
-    def prob_pos(self, deps_settings={}):
+    def prob_pos(self, deps_settings={}, method=FACTORIZED, backend=None):
         """
         Calcula la probabilidad de X = 1 dada las dependencias.
 
@@ -214,10 +472,20 @@ class BinaryEvent:
             P(X = 1 | A = 1) = P(X=1 | B=0, C=0, A=1) * P(B=0) * P(C=0) +
                                P(X=1 | B=0, C=1, A=1) * P(B=0) * P(C=1) + ... 
 
+        Por defecto (method=FACTORIZED) no se enumeran las configuraciones:
+        gracias a la independencia de las dependencias la suma se factoriza y
+        el costo es lineal en la cantidad de dependencias (ver
+        _marginalize_factorized). Con method=ENUMERATE se realiza la suma
+        completa de arriba, útil para verificar el resultado.
+
         Args:
             deps_settings: diccionario BinaryEvent -> bool que codifica que
                 condiciones imponemos sobre las dependencias. El diccionario
                 puede no describir todas las dependencias de 'self'
+            method: FACTORIZED o ENUMERATE
+            backend: backend numérico con el que se realizan las cuentas:
+                'decimal' (exacto), 'float' o 'log'. Ver ib_numeric. Con None
+                se usa el backend del evento (ver set_backend).
 
         Ej:
             X.prob_pos({A: false, B: true}} == P(X = 1 | A = 0, B = 1)
@@ -230,11 +498,28 @@ class BinaryEvent:
 
             Ver desarrollo al principio de la documentación.
         """
-        return float(self._prob_pos(deps_settings))
+        backend = ib_numeric.get_backend(backend or self.backend)
+        return backend.to_float(self._prob_pos(deps_settings, method, backend))
 
-    def prob_neg(self, deps_settings={}):
+    def prob_neg(self, deps_settings={}, method=FACTORIZED, backend=None):
         "1 - prob_pos"
-        return float(self._prob_neg(deps_settings))
+        backend = ib_numeric.get_backend(backend or self.backend)
+        return backend.to_float(self._prob_neg(deps_settings, method, backend))
+
+    def log_prob_pos(self, deps_settings={}, method=FACTORIZED):
+        """
+        Calcula log P(X = 1 | deps_settings) en espacio logarítmico.
+
+        Las cuentas se hacen con el backend LOG (float64, ver ib_numeric),
+        por lo que los productos de muchas probabilidades chicas no dan
+        underflow. El resultado es el logaritmo natural, sin exponenciar:
+        puede ser menor que log del mínimo float64.
+        """
+        return self._prob_pos(deps_settings, method, LOG)
+
+    def log_prob_neg(self, deps_settings={}, method=FACTORIZED):
+        "log(1 - prob_pos). Ver log_prob_pos."
+        return self._prob_neg(deps_settings, method, LOG)
         
     def _is_compatible(self, full_config, partial_config):
         """
@@ -284,6 +569,7 @@ class JointProbability(BinaryEvent):
     no debe pasar que A dependa directamente de B ni viceversa. Visto de otra
     forma, en el DAG no hay flechas de A a B o viceversa.
     """
+    __slots__ = ('events', '_order', '_bits', '_tables')
 
     def __init__(self, *args):
         """
@@ -293,22 +579,235 @@ class JointProbability(BinaryEvent):
             *args: Lista de eventos binarios. Los eventos binarios no deben ser
                    directamente dependientes entre si.
         """
+        self._init_cache()
+        self.name = None
+        self.backend = None
         self.events = args
+        self._order = None
+        self._tables = {}
+        self._on_invalidate(None)
+        for x in args:
+            x._children.add(self)
+
+    def _on_invalidate(self, source):
+        """
+        Recalcula las dependencias por si cambiaron las de algún evento y
+        descarta de la tabla condicional las filas de los eventos afectados.
+
+        La tabla condicional sólo depende de los parámetros de los eventos
+        de la conjunción: si cambió un ancestro más lejano se conserva.
+        """
         self.deps_keys = set([k 
-                              for x in args
+                              for x in self.events
                               for k in x.deps_keys])
+        if self._order is None or set(self._order) != self.deps_keys:
+            self._order = tuple(self.deps_keys)
+            self._bits = dict([(k, 1 << j)
+                               for j, k in enumerate(self._order)])
+            self._tables.clear()
+            return
+        for i, x in enumerate(self.events):
+            if x is source or (isinstance(x, JointProbability) and
+                               x._contains(source)):
+                for state in self._tables.values():
+                    state[0][i] = None
+                    state[1] = None
+
+    def _contains(self, ev):
+        "Define si ev es uno de los eventos de la conjunción (a cualquier nivel)."
+        return any([x is ev or (isinstance(x, JointProbability) and
+                                x._contains(ev))
+                    for x in self.events])
+
+    def cache_clear(self):
+        "Descarta además la tabla condicional (ver _table)."
+        BinaryEvent.cache_clear(self)
+        self._tables.clear()
+
+    def _table(self, backend):
+        """
+        Tabla condicional P(X_1 = 1, ..., X_m = 1 | config) para todas las
+        configuraciones de las dependencias.
+
+        Es una lista indexada por máscara de bits: la dependencia _order[j]
+        sucede en la configuración c si el bit j de c está prendido. Se arma
+        recién al usarla, una vez por backend, y se reutiliza en todas las
+        consultas sin importar las condiciones ni el método (ver
+        _marginalize_table). Se guarda además una fila por evento
+        (P(X_i = 1 | config)), de modo que cuando cambian los parámetros de
+        un evento sólo se recalcula su fila.
+        """
+        try:
+            state = self._tables[backend.name]
+        except KeyError:
+            state = self._tables[backend.name] = [[None] * len(self.events),
+                                                  None]
+        rows, table = state
+        if table is not None:
+            return table
+        configs = [set([k for k in self._order if mask & self._bits[k]])
+                   for mask in range(2 ** len(self._order))]
+        for i, x in enumerate(self.events):
+            if rows[i] is not None:
+                continue
+            # Cada evento sólo depende de sus propias dependencias
+            own = sum([self._bits[k] for k in x.deps_keys])
+            values = {}
+            for mask, config in enumerate(configs):
+                if mask & own not in values:
+                    values[mask & own] = x._p_pos_fw_full(config, backend)
+            rows[i] = [values[mask & own] for mask in range(len(configs))]
+        table = [backend.one] * len(configs)
+        for row in rows:
+            table = [backend.mul(a, b) for a, b in zip(table, row)]
+        state[1] = table
+        return table
+
+    def _p_pos_fw_full(self, full_config, backend=DECIMAL):
+        if len(self._order) > MAX_TABLE_DEPS:
+            ret = backend.one
+            for x in self.events:
+                ret = backend.mul(ret, x._p_pos_fw_full(full_config, backend))
+            return ret
+        mask = 0
+        for k in full_config:
+            mask |= self._bits.get(k, 0)
+        return self._table(backend)[mask]
+
+    def _p_neg_fw_full(self, full_config, backend=DECIMAL):
+        return backend.complement(self._p_pos_fw_full(full_config, backend))
+
+    def _use_table(self, backend):
+        """
+        Define si conviene calcular con la tabla condicional.
 
-    def _p_pos_fw_full(self, full_config):
-        ret = Decimal('1')
-        for x in self.events:
-            ret *= x._p_pos_fw_full(full_config)
-        return ret
+        Armarla cuesta del orden de 2^d * m (d dependencias y m eventos) e
+        inclusión-exclusión 2^m * d por consulta. Si la tabla es más cara se
+        arma recién cuando el evento se consulta con otras condiciones, ya
+        que a partir de ahí se reutiliza.
+        """
+        d = len(self._order)
+        if d > MAX_TABLE_DEPS:
+            return False
+        if backend.name in self._tables or 2 ** d <= 2 ** len(self.events) * d:
+            return True
+        return any([key[0] == FACTORIZED and key[1] == backend.name
+                    for key in self._cache])
+
+    def _marginalize_table(self, deps_settings, backend):
+        """
+        Calcula P(X_1 = 1, ..., X_m = 1 | deps_settings) como suma de la
+        tabla condicional (ver _table) pesada por la probabilidad de cada
+        configuración compatible con deps_settings.
 
-    def _p_neg_fw_full(self, full_config):
-        return Decimal('1') - self._p_pos_fw_full(full_config)
+        Los pesos se arman de a una dependencia, duplicando la lista de
+        configuraciones, por lo que el costo es proporcional a la cantidad
+        de configuraciones compatibles.
+        """
+        table = self._table(backend)
+        weights = [(0, backend.one)]
+        for k in self._order:
+            bit = self._bits[k]
+            if k in deps_settings:
+                if deps_settings[k]:
+                    weights = [(mask | bit, w) for mask, w in weights]
+                continue
+            p = k._prob_pos(backend=backend)
+            q = backend.complement(p)
+            weights = ([(mask, backend.mul(w, q)) for mask, w in weights] +
+                       [(mask | bit, backend.mul(w, p))
+                        for mask, w in weights])
+        return backend.sum([backend.mul(table[mask], w)
+                            for mask, w in weights])
+
+    def _marginalize_factorized(self, deps_settings, backend):
+        """
+        Calcula P(X_1 = 1, ..., X_m = 1 | deps_settings) para el método
+        FACTORIZED.
+
+        Con hasta MAX_TABLE_DEPS dependencias se suma la tabla condicional
+        (ver _marginalize_table), que se reutiliza entre consultas, salvo en
+        la primera consulta si armarla es más caro (ver _use_table). Si no,
+        no se enumeran las configuraciones de las dependencias: el producto
+        de los P(X_i = 1 | config) no se factoriza sobre las dependencias,
+        pero por inclusión-exclusión
+
+            P(X_1 = 1, ..., X_m = 1 | config) =
+                sum_{S subconjunto de eventos} (-1)^|S| *
+                    prod_{X_i en S} P(X_i = 0 | config)
+
+        y cada término sí se factoriza como en BinaryEvent. El costo es lineal
+        en la cantidad de dependencias y exponencial en la cantidad de
+        eventos, por lo que si hay más eventos que dependencias conviene
+        enumerar las configuraciones de las dependencias. También se enumera
+        si algún evento es a su vez conjunto o el backend no admite restas
+        (LOG).
+        """
+        if self._use_table(backend):
+            return self._marginalize_table(deps_settings, backend)
+        if (not backend.signed or
+                len(self.events) > len(self.deps_keys) or
+                any(isinstance(x, JointProbability) for x in self.events)):
+            return self._marginalize(deps_settings, backend, FACTORIZED)
+
+        probs = dict([(k, k._prob_pos(backend=backend))
+                      for k in self.deps_keys
+                      if k not in deps_settings])
+        ret = backend.zero
+        for size in range(len(self.events) + 1):
+            for subset in itertools.combinations(self.events, size):
+                term = backend.one
+                for x in subset:
+                    term = backend.mul(term,
+                                       backend.complement(
+                                           backend.convert(x.gamma)))
+                for k in self.deps_keys:
+                    factor = backend.one
+                    for x in subset:
+                        if k in x.deps_keys:
+                            factor = backend.mul(factor, backend.complement(
+                                backend.convert(x.deps[k])))
+                    if k in deps_settings:
+                        if deps_settings[k]:
+                            term = backend.mul(term, factor)
+                    else:
+                        p = probs[k]
+                        term = backend.mul(term, backend.add(
+                            backend.complement(p), backend.mul(p, factor)))
+                if size % 2:
+                    ret = backend.sub(ret, term)
+                else:
+                    ret = backend.add(ret, term)
+        return ret
     
     def __repr__(self):
         if self.name is not None:
             return 'Joint({})'.format(', '.join([str(x) for x in self.events]))
         else:
             return super().__repr__()
+
+
+def set_backend(events, backend):
+    """
+    Cambia el backend por defecto de una red.
+
+    Las consultas sobre los eventos dados y sus ancestros que no indiquen
+    un backend se calculan con éste. Los eventos que se creen después (por
+    ejemplo un JointProbability) usan Decimal hasta que se les asigne.
+
+    Args:
+        events: eventos de la red (se incluyen sus ancestros)
+        backend: None o 'decimal', 'float' o 'log'. Ver ib_numeric.
+    """
+    ib_numeric.get_backend(backend)
+    pending = list(events)
+    seen = set()
+    while pending:
+        ev = pending.pop()
+        if ev in seen:
+            continue
+        seen.add(ev)
+        ev.backend = backend
+        pending.extend(ev.deps_keys)
+        if isinstance(ev, JointProbability):
+            pending.extend(ev.events)
@@ -0,0 +1,121 @@
+#-*- coding: utf-8 -*-
+"""
+Evaluación de la misma consulta para muchos pacientes a la vez.
+
+La evidencia es una matriz (pacientes, hallazgos) con 1, 0 o NaN (hallazgo
+no observado). La red y la forma de la consulta (eventos consultados y
+hallazgos) se compilan una sola vez a un circuito aritmético (ver
+ib_circuit) y la matriz se evalúa por bloques de filas: cada bloque es una
+única pasada vectorizada del circuito, de modo que el costo por paciente es
+de microsegundos. Los bloques acotan la memoria y pueden repartirse en un
+pool de procesos; cada proceso compila el circuito una vez, a partir del
+código generado. A los procesos sólo se les envían ese código y los arrays
+de parámetros: la red y sus BinaryEvents no siempre pueden serializarse
+(por ejemplo con el método de inicio spawn).
+
+El circuito calcula las probabilidades en float64 sin escalar: con cientos
+de hallazgos positivos P(evidencia) puede dar 0. Esas filas (pocas) se
+recalculan con ib_elimination.query, que no tiene underflow. Las filas con
+evidencia imposible quedan en NaN.
+
+Ej:
+    result = ib_batch.posteriors(net, [TB, Canc], [Tos, Fiebre, DifResp],
+                                 matriz)
+"""
+from __future__ import print_function, division, unicode_literals
+import multiprocessing
+
+import numpy as np
+
+import ib_circuit
+import ib_elimination
+
+# Circuito y parámetros (gamma, alpha) de cada proceso del pool
+_state = None
+
+
+def _init(gamma, alpha, targets, observed, source):
+    global _state
+    _state = (ib_circuit.Circuit(None, targets, observed, source), gamma,
+              alpha)
+
+
+def _chunk_posteriors(evidence, state=None):
+    """
+    P(target = 1 | fila) para un bloque de filas.
+
+    Returns:
+        array (filas, len(targets)); NaN en las filas que el circuito no
+        pudo resolver
+    """
+    circuit, gamma, alpha = state or _state
+    result = circuit.evaluate_indicators(circuit.indicators(evidence), gamma,
+                                         alpha)
+    ok = (result.evidence > 0)[:, None] & np.isfinite(result.posterior)
+    return np.where(ok, result.posterior, np.nan)
+
+
+def _fallback(net, targets, observed, row, heuristic):
+    "Resuelve una fila por eliminación de variables."
+    evidence = dict([(v, bool(x)) for v, x in zip(observed, row)
+                     if not np.isnan(x)])
+    ret = np.full(len(targets), np.nan)
+    for j, t in enumerate(targets):
+        try:
+            ret[j] = ib_elimination.query(net, [t], evidence, heuristic)
+        except ZeroDivisionError:
+            pass
+    return ret
+
+
+def posteriors(net, targets, findings, evidence, chunk_size=4096,
+               processes=None, heuristic=ib_elimination.MIN_FILL,
+               cache_dir=None):
+    """
+    Calcula P(target = 1 | evidencia de cada paciente).
+
+    Args:
+        net: ib_network.Network
+        targets: eventos consultados (BinaryEvent, nombre o id)
+        findings: eventos de las columnas de evidence
+        evidence: array (pacientes, len(findings)) con 1, 0 o NaN
+        chunk_size: filas por bloque
+        processes: cantidad de procesos. None o 1 evalúa en el proceso
+            actual.
+        heuristic: orden de eliminación (ver ib_elimination)
+        cache_dir: directorio de caché del código generado (ver
+            ib_circuit.compile_circuit)
+
+    Returns:
+        array (pacientes, len(targets)); NaN en las filas con evidencia
+        imposible
+    """
+    evidence = np.asarray(evidence, dtype=np.float64)
+    if evidence.ndim != 2 or evidence.shape[1] != len(findings):
+        raise ValueError('Se espera una matriz de {} columnas'.format(
+            len(findings)))
+    circuit = ib_circuit.compile_circuit(net, targets, findings, heuristic,
+                                         cache_dir)
+    chunks = [evidence[lo:lo + chunk_size]
+              for lo in range(0, len(evidence), chunk_size)]
+    gamma = np.asarray(net.gamma, dtype=np.float64)
+    alpha = np.asarray(net.alpha, dtype=np.float64)
+    workers = processes or 1
+    if workers > 1 and len(chunks) > 1:
+        pool = multiprocessing.Pool(workers, _init,
+                                    (gamma, alpha, circuit.targets,
+                                     circuit.observed, circuit.source))
+        try:
+            results = pool.map(_chunk_posteriors, chunks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        state = (circuit, gamma, alpha)
+        results = [_chunk_posteriors(chunk, state) for chunk in chunks]
+    ret = (np.concatenate(results) if results else
+           np.zeros((0, len(circuit.targets))))
+    for n in np.nonzero(np.isnan(ret).any(axis=1))[0]:
+        ret[n] = _fallback(net, circuit.targets, circuit.observed,
+                           evidence[n], heuristic)
+    return ret
@@ -0,0 +1,86 @@
+#-*- coding: utf-8 -*-
+import multiprocessing
+import numpy as np
+import pytest
+import ib
+import ib_batch
+import ib_network
+import ejercicio
+
+# Tests de la evaluación por lotes
+
+e = ejercicio
+net = ib_network.Network([e.Sintomas])
+TARGETS = [e.TB, e.Canc, e.Gripe]
+FINDINGS = [e.Tos, e.Fiebre, e.DifResp, e.Fuma]
+
+
+def _expected(net, targets, findings, row):
+    evidence = dict([(f, bool(x)) for f, x in zip(findings, row)
+                     if not np.isnan(x)])
+    return [net.query(t, evidence) for t in targets]
+
+
+def test_matches_query():
+    "Cada fila coincide con Network.query, con valores faltantes."
+    rng = np.random.default_rng(0)
+    matrix = rng.choice([0.0, 1.0, np.nan], size=(200, len(FINDINGS)))
+    result = net.query_batch(TARGETS, FINDINGS, matrix, chunk_size=64)
+    assert result.shape == (200, len(TARGETS))
+    for row, values in zip(matrix, result):
+        assert values == pytest.approx(_expected(net, TARGETS, FINDINGS, row))
+
+
+def test_two_findings():
+    "Con dos hallazgos la matriz no se confunde con indicadores."
+    matrix = np.array([[1, 0], [np.nan, 1], [1, 1], [0, 0]])
+    findings = [e.Tos, e.Fiebre]
+    result = net.query_batch([e.TB], findings, matrix)
+    assert result.shape == (4, 1)
+    for row, values in zip(matrix, result):
+        assert values == pytest.approx(_expected(net, [e.TB], findings, row))
+
+
+def test_processes():
+    "El resultado no depende de la cantidad de procesos."
+    rng = np.random.default_rng(1)
+    matrix = rng.choice([0.0, 1.0, np.nan], size=(300, len(FINDINGS)))
+    single = ib_batch.posteriors(net, TARGETS, FINDINGS, matrix, 50)
+    parallel = ib_batch.posteriors(net, TARGETS, FINDINGS, matrix, 50,
+                                   processes=2)
+    assert parallel == pytest.approx(single)
+
+
+def test_spawn(monkeypatch):
+    "Los procesos del pool no reciben la red (con spawn no se serializa)."
+    monkeypatch.setattr(ib_batch.multiprocessing, 'Pool',
+                        multiprocessing.get_context('spawn').Pool)
+    matrix = np.array([[1, 0, np.nan, 1], [0, 1, 1, np.nan]] * 10)
+    result = ib_batch.posteriors(net, TARGETS, FINDINGS, matrix, 5,
+                                 processes=2)
+    assert result == pytest.approx(
+        ib_batch.posteriors(net, TARGETS, FINDINGS, matrix))
+
+
+def test_impossible_evidence():
+    "Las filas con evidencia imposible quedan en NaN."
+    findings = [e.Tos, e.TB, e.Canc, e.Gripe]
+    matrix = np.array([[1, 0, 0, 0], [1, 1, np.nan, np.nan]], dtype=float)
+    result = net.query_batch([e.Fuma], findings, matrix)
+    assert np.isnan(result[0, 0])
+    assert result[1, 0] == pytest.approx(
+        net.query(e.Fuma, {e.Tos: True, e.TB: True}))
+
+
+def test_underflow():
+    "Con cientos de hallazgos positivos se recurre a eliminación."
+    disease = ib.BinaryEvent(gamma=0.1, name='D')
+    findings = [ib.BinaryEvent({disease: 0.01}, gamma=0.0001, name=str(k))
+                for k in range(200)]
+    star = ib_network.Network(findings)
+    matrix = np.ones((2, len(findings)))
+    matrix[1, 1:] = np.nan
+    result = star.query_batch([disease], findings, matrix)
+    assert result[0, 0] == pytest.approx(1.0)
+    assert result[1, 0] == pytest.approx(
+        star.query(disease, {findings[0]: True}))
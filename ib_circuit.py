@@ -0,0 +1,388 @@
+#-*- coding: utf-8 -*-
+"""
+Compilación de una red y una forma de consulta a un circuito aritmético.
+
+Cada consulta de ib_elimination recorre objetos de Python: arma factores,
+calcula un orden de eliminación y decide qué multiplicar. Cuando la misma
+forma de consulta (mismos eventos consultados y mismos eventos observados) se
+evalúa muchas veces con distinta evidencia o parámetros, todo ese trabajo se
+repite. Este módulo lo hace una sola vez y genera el código fuente de una
+función de Python en línea recta: una secuencia fija de llamadas a
+numpy.einsum que calcula el polinomio de la red.
+
+La función generada recibe como entradas:
+
+    * gamma (..., n) y alpha (..., nnz): parámetros de la red
+    * indicators (..., m, 2): indicadores de evidencia de los m eventos
+      observados. [1, 0] significa observado en 0, [0, 1] observado en 1 y
+      [1, 1] sin observar.
+
+y devuelve P(evidencia) y P(target = 1, evidencia) para cada target. Como el
+circuito es una secuencia fija de productos y sumas, la función generada
+también incluye la pasada hacia atrás que calcula el gradiente de
+P(evidencia) respecto de gamma, alpha y los indicadores. La derivada
+respecto del indicador [x] del evento v es P(evidencia, v = x) (Darwiche,
+2003).
+
+Los eventos noisy-or se factorizan con una variable auxiliar H por evento
+(Díez y Galán, 2003):
+
+    P(X = x | A_1..A_k) = sum_h g(x, h) * prod_j f_j(a_j, h)
+
+    g(0, 0) = 0, g(1, 0) = 1, g(0, 1) = 1 - gamma, g(1, 1) = -(1 - gamma)
+    f_j(a, 0) = 1, f_j(0, 1) = 1, f_j(1, 1) = 1 - alpha_j
+
+de modo que cada factor depende de un único parámetro y tiene cuatro
+entradas, sin importar la cantidad de dependencias.
+
+El código generado puede guardarse en un directorio de caché para no volver
+a compilarlo en otros procesos.
+"""
+from __future__ import print_function, division, unicode_literals
+import collections
+import hashlib
+import io
+import os
+import string
+
+import numpy as np
+
+import ib_elimination
+
+# Se incrementa cuando cambia el código generado, para invalidar la caché
+VERSION = 2
+
+# Tamaño de batch a partir del cual las contracciones se descomponen en
+# productos de a pares
+BIG_BATCH = 256
+
+_LETTERS = string.ascii_letters
+
+CircuitResult = collections.namedtuple(
+    'CircuitResult',
+    ['evidence', 'joint', 'posterior', 'd_gamma', 'd_alpha', 'd_indicators'])
+CircuitResult.__doc__ = """
+Resultado de evaluar un circuito.
+
+Atributos:
+    evidence: array (...) con P(evidencia)
+    joint: array (..., len(targets)) con P(target = 1, evidencia)
+    posterior: array (..., len(targets)) con P(target = 1 | evidencia)
+    d_gamma, d_alpha, d_indicators: gradientes de P(evidencia) respecto de
+        cada entrada (None si no se pidieron)
+"""
+
+_PREAMBLE = '''\
+# Generado por ib_circuit (versión {version}). No editar.
+import numpy as np
+
+_ONES = np.ones(2)
+
+
+def _root(g):
+    return np.stack([1 - g, g], axis=-1)
+
+
+def _leak(g):
+    leak = 1 - g
+    return np.stack([np.stack([np.zeros_like(g), leak], axis=-1),
+                     np.stack([np.ones_like(g), -leak], axis=-1)], axis=-2)
+
+
+def _influence(a):
+    ones = np.ones_like(a)
+    return np.stack([np.stack([ones, ones], axis=-1),
+                     np.stack([ones, 1 - a], axis=-1)], axis=-2)
+
+
+def evaluate(gamma, alpha, indicators, gradient=False):
+    _big = np.broadcast(np.empty(np.shape(gamma)[:-1]),
+                        np.empty(np.shape(alpha)[:-1]),
+                        np.empty(np.shape(indicators)[:-2])).size >= {big}
+'''
+
+
+def _optimize(specs, out_spec):
+    """
+    Argumento optimize de una llamada a numpy.einsum con más de dos
+    operandos: el orden de contracción se calcula al generar el código y no
+    en cada evaluación. Todos los operandos comparten las dimensiones del
+    batch, por lo que el orden no depende de ellas. Con batches chicos es
+    más rápido no descomponer la contracción (ver BIG_BATCH).
+    """
+    if len(specs) <= 2:
+        return ''
+    operands = [np.empty((2,) * len(s)) for s in specs]
+    path, _ = np.einsum_path('{}->{}'.format(','.join(specs), out_spec),
+                             *operands, optimize='greedy')
+    return ', optimize=({!r} if _big else False)'.format(path)
+
+
+class _Emitter(object):
+    "Genera el código de la función evaluate paso a paso."
+
+    def __init__(self):
+        self.forward = []
+        self.steps = []
+        self.count = 0
+
+    def name(self):
+        self.count += 1
+        return 't{}'.format(self.count)
+
+    def line(self, code):
+        self.forward.append('    ' + code)
+
+    def einsum(self, factors, keep, record=True):
+        """
+        Emite el producto de factors sumando las variables que no están en
+        keep. factors es una lista de pares (nombre, variables).
+
+        Returns:
+            (nombre, variables) del resultado
+        """
+        factors = list(factors)
+        while len(factors) > ib_elimination.MAX_OPERANDS:
+            # Como en ib_elimination.product_sum, se multiplica por partes
+            head = factors[:ib_elimination.MAX_OPERANDS]
+            factors = factors[ib_elimination.MAX_OPERANDS:]
+            rest = set(keep).union(*[vs for _, vs in factors])
+            factors.append(self.einsum(head, rest, record))
+        variables = []
+        for _, vs in factors:
+            variables.extend([v for v in vs if v not in variables])
+        letters = dict(zip(variables, _LETTERS))
+        out = tuple(v for v in variables if v in keep)
+        specs = [''.join(letters[v] for v in vs) for _, vs in factors]
+        out_spec = ''.join(letters[v] for v in out)
+        name = self.name()
+        self.line("{} = np.einsum('{}->...{}', {}{})".format(
+            name, ','.join('...' + s for s in specs), out_spec,
+            ', '.join(n for n, _ in factors), _optimize(specs, out_spec)))
+        if record:
+            self.steps.append((name, out_spec,
+                               [(n, s) for (n, _), s in zip(factors, specs)]))
+        return name, out
+
+    def backward(self):
+        "Código de la pasada hacia atrás por los pasos registrados."
+        lines = []
+        for name, out_spec, inputs in reversed(self.steps):
+            for k, (n, spec) in enumerate(inputs):
+                others = [(m, s) for j, (m, s) in enumerate(inputs) if j != k]
+                present = set(out_spec).union(*[s for _, s in others])
+                # Letras que sólo aparecen en este factor: el gradiente es
+                # constante a lo largo de ellas
+                missing = [c for c in spec if c not in present]
+                operands = (['g_' + name] + [m for m, _ in others] +
+                            ['_ONES'] * len(missing))
+                specs = (['...' + out_spec] + ['...' + s for _, s in others] +
+                         missing)
+                lines.append("    g_{} = np.einsum('{}->...{}', {}{})".format(
+                    n, ','.join(specs), spec, ', '.join(operands),
+                    _optimize([x.lstrip('.') for x in specs], spec)))
+        return lines
+
+
+def _generate(net, targets, observed, heuristic):
+    "Código fuente de la función evaluate para una forma de consulta."
+    n = len(net)
+    relevant = ib_elimination.ancestors(net, list(targets) + list(observed))
+    em = _Emitter()
+    factors = []
+    leaves = []
+    for i in sorted(relevant):
+        a, b = net.indptr[i], net.indptr[i + 1]
+        if a == b:
+            name = em.name()
+            em.line('{} = _root(gamma[..., {}])'.format(name, i))
+            factors.append((name, (i,)))
+            leaves.append(('root', name, i))
+            continue
+        h = n + i
+        name = em.name()
+        em.line('{} = _leak(gamma[..., {}])'.format(name, i))
+        factors.append((name, (i, h)))
+        leaves.append(('leak', name, i))
+        for j in range(a, b):
+            name = em.name()
+            em.line('{} = _influence(alpha[..., {}])'.format(name, j))
+            factors.append((name, (int(net.indices[j]), h)))
+            leaves.append(('influence', name, j))
+    for r, v in enumerate(observed):
+        name = em.name()
+        em.line('{} = indicators[..., {}, :]'.format(name, r))
+        factors.append((name, (v,)))
+        leaves.append(('indicator', name, r))
+
+    def eliminate(factors, variables, record):
+        symbolic = [ib_elimination.Factor(vs, np.empty((2,) * len(vs)))
+                    for _, vs in factors]
+        for v in ib_elimination.elimination_order(symbolic, variables,
+                                                  heuristic):
+            involved = [f for f in factors if v in f[1]]
+            factors = [f for f in factors if v not in f[1]]
+            keep = set(u for _, vs in involved for u in vs if u != v)
+            factors.append(em.einsum(involved, keep, record))
+        return factors
+
+    # Parte compartida: se eliminan todas las variables salvo los targets
+    keep = set(targets)
+    variables = set(v for _, vs in factors for v in vs)
+    shared = eliminate(factors, variables - keep, True)
+
+    # P(evidencia): se eliminan también los targets
+    rest = eliminate(shared, keep, True)
+    evidence, _ = em.einsum(rest, set(), True)
+    em.line('evidence = {}'.format(evidence))
+
+    # P(target = 1, evidencia) para cada target, sin gradiente
+    joints = []
+    for t in targets:
+        rest = eliminate(shared, keep - set([t]), False)
+        name, _ = em.einsum(rest, set([t]), False)
+        joints.append('{}[..., 1]'.format(name))
+    if joints:
+        em.line('joint = np.stack([{}], axis=-1)'.format(', '.join(joints)))
+    else:
+        em.line('joint = np.zeros(np.shape(evidence) + (0,))')
+    em.line('if not gradient:')
+    em.line('    return evidence, joint, None, None, None')
+
+    lines = em.forward
+    lines.append('    g_{} = np.ones_like(evidence)'.format(evidence))
+    lines.extend(em.backward())
+    lines.append('    batch = np.shape(evidence)')
+    lines.append('    d_gamma = np.zeros(batch + np.shape(gamma)[-1:])')
+    lines.append('    d_alpha = np.zeros(batch + np.shape(alpha)[-1:])')
+    lines.append('    d_indicators = np.zeros(batch + np.shape(indicators)'
+                 '[-2:])')
+    consumed = set(n for _, _, inputs in em.steps for n, _ in inputs)
+    for kind, name, k in leaves:
+        if name not in consumed:
+            continue
+        g = 'g_' + name
+        if kind == 'root':
+            lines.append('    d_gamma[..., {}] += {}[..., 1] - {}[..., 0]'
+                         .format(k, g, g))
+        elif kind == 'leak':
+            lines.append('    d_gamma[..., {}] += {}[..., 1, 1] - '
+                         '{}[..., 0, 1]'.format(k, g, g))
+        elif kind == 'influence':
+            lines.append('    d_alpha[..., {}] -= {}[..., 1, 1]'.format(k, g))
+        else:
+            lines.append('    d_indicators[..., {}, :] += {}'.format(k, g))
+    lines.append('    return evidence, joint, d_gamma, d_alpha, d_indicators')
+    return (_PREAMBLE.format(version=VERSION, big=BIG_BATCH) +
+            '\n'.join(lines) + '\n')
+
+
+def _key(net, targets, observed, heuristic):
+    "Clave de caché: estructura de la red y forma de la consulta."
+    data = repr((VERSION, len(net), net.indptr.tolist(), net.indices.tolist(),
+                 list(targets), list(observed), heuristic))
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+class Circuit(object):
+    """
+    Circuito aritmético compilado para una forma de consulta.
+
+    Atributos:
+        net: red compilada. Puede ser None si la evidencia se pasa como
+            array y los parámetros se dan explícitamente (ver evaluate)
+        targets: ids de los eventos consultados
+        observed: ids de los eventos observados, en el orden de los
+            indicadores
+        source: código fuente generado
+    """
+
+    def __init__(self, net, targets, observed, source):
+        self.net = net
+        self.targets = list(targets)
+        self.observed = list(observed)
+        self.source = source
+        namespace = {}
+        exec(compile(source, '<ib_circuit>', 'exec'), namespace)
+        self._evaluate = namespace['evaluate']
+
+    def indicators(self, evidence):
+        """
+        Indicadores de evidencia para evaluate.
+
+        Args:
+            evidence: diccionario evento -> bool, o array (..., m) con un
+                valor por evento observado: 1, 0 o NaN si no se observó
+        """
+        if isinstance(evidence, dict):
+            values = np.full(len(self.observed), np.nan)
+            for k, v in evidence.items():
+                values[self.observed.index(self.net.id_of(k))] = v
+        else:
+            values = np.asarray(evidence, dtype=np.float64)
+        ret = np.ones(values.shape + (2,))
+        ret[..., 0] = np.where(values == 1, 0, 1)
+        ret[..., 1] = np.where(values == 0, 0, 1)
+        return ret
+
+    def evaluate(self, evidence={}, gamma=None, alpha=None, gradient=False):
+        """
+        Evalúa el circuito.
+
+        Args:
+            evidence: evidencia (ver indicators)
+            gamma, alpha: parámetros (por defecto los de la red)
+            gradient: si es True calcula también el gradiente de
+                P(evidencia)
+
+        Returns:
+            CircuitResult
+        """
+        return self.evaluate_indicators(self.indicators(evidence), gamma,
+                                        alpha, gradient)
+
+    def evaluate_indicators(self, indicators, gamma=None, alpha=None,
+                            gradient=False):
+        """
+        Como evaluate pero recibe directamente el array de indicadores
+        (..., m, 2).
+        """
+        gamma = np.asarray(self.net.gamma if gamma is None else gamma,
+                           dtype=np.float64)
+        alpha = np.asarray(self.net.alpha if alpha is None else alpha,
+                           dtype=np.float64)
+        ev, joint, d_gamma, d_alpha, d_ind = self._evaluate(
+            gamma, alpha, indicators, gradient)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            posterior = joint / np.expand_dims(ev, -1)
+        return CircuitResult(ev, joint, posterior, d_gamma, d_alpha, d_ind)
+
+
+def compile_circuit(net, targets, observed, heuristic=ib_elimination.MIN_FILL,
+                    cache_dir=None):
+    """
+    Compila una forma de consulta de la red a un Circuit.
+
+    Args:
+        net: ib_network.Network
+        targets: eventos consultados
+        observed: eventos que pueden observarse
+        heuristic: orden de eliminación (ver ib_elimination)
+        cache_dir: directorio donde guardar (y buscar) el código generado
+    """
+    targets = [net.id_of(t) for t in targets]
+    observed = [net.id_of(v) for v in observed]
+    path = None
+    if cache_dir is not None:
+        path = os.path.join(cache_dir, 'circuit_{}.py'.format(
+            _key(net, targets, observed, heuristic)))
+        if os.path.exists(path):
+            with io.open(path, 'r', encoding='utf-8') as f:
+                return Circuit(net, targets, observed, f.read())
+    source = _generate(net, targets, observed, heuristic)
+    if path is not None:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        with io.open(path, 'w', encoding='utf-8') as f:
+            f.write(source)
+    return Circuit(net, targets, observed, source)
@@ -0,0 +1,118 @@
+#-*- coding: utf-8 -*-
+import numpy as np
+import pytest
+import ib
+import ib_circuit
+import ib_elimination
+import ib_elimination_test
+import ib_network
+import ejercicio
+
+e = ejercicio
+net = ib_network.Network([e.Sintomas])
+circuit = ib_circuit.compile_circuit(net, [e.TB, e.Canc],
+                                     [e.Tos, e.Fiebre, e.DifResp])
+
+
+def test_matches_elimination():
+    "El circuito coincide con eliminación de variables."
+    sintomas = {e.Tos: True, e.Fiebre: True, e.DifResp: True}
+    result = circuit.evaluate(sintomas)
+    assert result.evidence == pytest.approx(net.evidence_prob(sintomas))
+    assert result.posterior[0] == pytest.approx(0.541296, abs=1e-6)
+    assert result.posterior[1] == pytest.approx(0.479073, abs=1e-6)
+
+    # Sin observar algunos eventos
+    result = circuit.evaluate({e.Tos: False})
+    assert result.posterior[0] == pytest.approx(
+        net.query(e.TB, {e.Tos: False}))
+
+
+def test_batch():
+    "Matriz de evidencia con NaN para los eventos no observados."
+    rows = np.array([[1, 1, 1], [0, np.nan, 1], [np.nan] * 3])
+    result = circuit.evaluate(rows)
+    assert result.posterior.shape == (3, 2)
+    for row, posterior in zip(rows, result.posterior):
+        evidence = dict([(v, bool(x)) for v, x in zip(circuit.observed, row)
+                         if not np.isnan(x)])
+        assert posterior[1] == pytest.approx(net.query(e.Canc, evidence))
+
+    gammas = np.tile(net.gamma, (4, 1))
+    gammas[:, net.id_of(e.Fuma)] = np.linspace(0.1, 0.9, 4)
+    result = circuit.evaluate({e.Tos: True}, gamma=gammas)
+    expected = ib_elimination.joint_table(net, [net.id_of(e.Canc)],
+                                          {net.id_of(e.Tos): True},
+                                          gamma=gammas)
+    assert result.posterior[:, 1] == pytest.approx(
+        ib_elimination.posterior(expected, 1))
+
+
+def test_gradient():
+    "El gradiente coincide con diferencias finitas."
+    evidence = {e.Tos: True, e.Fiebre: False}
+    result = circuit.evaluate(evidence, gradient=True)
+    eps = 1e-6
+    for i in range(len(net)):
+        gamma = np.array(net.gamma, dtype=np.float64)
+        gamma[i] += eps
+        diff = circuit.evaluate(evidence, gamma=gamma).evidence
+        assert (diff - result.evidence) / eps == pytest.approx(
+            result.d_gamma[i], abs=1e-5)
+    for j in range(len(net.alpha)):
+        alpha = np.array(net.alpha, dtype=np.float64)
+        alpha[j] += eps
+        diff = circuit.evaluate(evidence, alpha=alpha).evidence
+        assert (diff - result.evidence) / eps == pytest.approx(
+            result.d_alpha[j], abs=1e-5)
+
+    # La derivada respecto de un indicador es P(evidencia, v = x)
+    r = circuit.observed.index(net.id_of(e.DifResp))
+    assert result.d_indicators[r, 1] == pytest.approx(
+        net.evidence_prob({e.Tos: True, e.Fiebre: False, e.DifResp: True}))
+
+
+def test_random_networks():
+    for seed in range(5):
+        other = ib_elimination_test.random_network(seed, 8)
+        c = ib_circuit.compile_circuit(other, [0, 1], [6, 7])
+        result = c.evaluate({6: True, 7: False})
+        assert result.posterior == pytest.approx(
+            [other.query(0, {6: True, 7: False}),
+             other.query(1, {6: True, 7: False})])
+
+
+def test_cache_dir(tmpdir):
+    path = str(tmpdir.join('cache'))
+    first = ib_circuit.compile_circuit(net, [e.TB], [e.Tos], cache_dir=path)
+    assert len(tmpdir.join('cache').listdir()) == 1
+    second = ib_circuit.compile_circuit(net, [e.TB], [e.Tos], cache_dir=path)
+    assert second.source == first.source
+    assert second.evaluate({e.Tos: True}).posterior[0] == pytest.approx(
+        net.query(e.TB, {e.Tos: True}))
+
+
+def test_many_operands():
+    "Más factores que MAX_OPERANDS en una misma contracción."
+    disease = ib.BinaryEvent(gamma=0.1, name='D')
+    findings = [ib.BinaryEvent({disease: 0.3}, gamma=0.01, name=str(k))
+                for k in range(2 * ib_elimination.MAX_OPERANDS)]
+    star = ib_network.Network(findings)
+    c = ib_circuit.compile_circuit(star, [disease], findings[:-1])
+    evidence = dict([(f, k % 3 == 0) for k, f in enumerate(findings[:-1])])
+    assert c.evaluate(evidence).posterior[0] == pytest.approx(
+        star.query(disease, evidence))
+
+
+def test_two_observed():
+    "Una matriz de evidencia (k, 2) no se confunde con indicadores."
+    c = ib_circuit.compile_circuit(net, [e.TB], [e.Tos, e.Fiebre])
+    rows = np.array([[1, 0], [0, np.nan], [1, 1]])
+    result = c.evaluate(rows)
+    assert result.posterior.shape == (3, 1)
+    for row, posterior in zip(rows, result.posterior):
+        evidence = dict([(v, bool(x)) for v, x in zip(c.observed, row)
+                         if not np.isnan(x)])
+        assert posterior[0] == pytest.approx(net.query(e.TB, evidence))
+    direct = c.evaluate_indicators(c.indicators(rows))
+    assert direct.posterior == pytest.approx(result.posterior)
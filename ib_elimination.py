@@ -0,0 +1,565 @@
+#-*- coding: utf-8 -*-
+"""
+Inferencia exacta por eliminación de variables sobre una red compilada.
+
+BinaryEvent.prob_pos sólo condiciona sobre dependencias directas y asume que
+éstas son independientes; JointProbability además prohíbe dependencias entre
+sus eventos. Este módulo calcula probabilidades a posteriori exactas
+P(X = 1 | evidencia) sobre cualquier DAG de eventos binarios noisy-or, con
+evidencia sobre cualquier evento (ancestros, descendientes o hermanos del
+consultado).
+
+Cada evento aporta factores con su tabla de probabilidad condicional. Los
+eventos con muchas dependencias se descomponen en una cadena de variables
+auxiliares (X_j = X_{j-1} o (A_j y ruido_j)) de modo que ningún factor tenga
+más de tres variables. Luego se eliminan (suman) las variables que no son
+consultadas siguiendo un orden heurístico (min-fill o min-degree). El costo
+es exponencial en el ancho del orden de eliminación (treewidth) y no en la
+cantidad de eventos.
+
+Todas las tablas pueden tener dimensiones adicionales al principio (por
+ejemplo, una por paciente o por juego de parámetros): las operaciones las
+conservan.
+
+Con decenas o cientos de eventos observados P(evidencia) puede ser menor que
+el mínimo float64. Las consultas normalizan cada factor intermedio y llevan
+la escala aparte, en logaritmo (Factor.log_scale); log_query y
+log_evidence_prob devuelven directamente logaritmos.
+"""
+from __future__ import print_function, division, unicode_literals
+import collections
+import string
+
+import numpy as np
+
+# Heurísticas de orden de eliminación
+MIN_FILL = 'min-fill'
+MIN_DEGREE = 'min-degree'
+
+# Los eventos con más dependencias se descomponen en una cadena
+MAX_CPT_PARENTS = 4
+
+_LETTERS = string.ascii_letters
+
+# Cantidad máxima de factores por llamada a numpy.einsum
+MAX_OPERANDS = 30
+
+
+class Factor(object):
+    """
+    Factor sobre variables binarias.
+
+    Atributos:
+        variables: tupla de ids de variables
+        table: array de forma batch + (2,) * len(variables). table[..., x_1,
+            ..., x_k] es el valor del factor cuando variables[i] vale x_i
+        log_scale: logaritmo de un factor de escala (escalar o de forma
+            batch): el valor del factor es table * exp(log_scale). Permite
+            representar factores muy chicos sin underflow (ver rescale en
+            product_sum)
+    """
+    __slots__ = ('variables', 'table', 'log_scale')
+
+    def __init__(self, variables, table, log_scale=0.0):
+        self.variables = tuple(variables)
+        self.table = np.asarray(table)
+        self.log_scale = log_scale
+
+    @property
+    def batch_shape(self):
+        "Forma de las dimensiones adicionales de la tabla."
+        return self.table.shape[:self.table.ndim - len(self.variables)]
+
+    def reduce(self, var, value):
+        "Factor resultante de fijar var = value."
+        if var not in self.variables:
+            return self
+        axis = self.variables.index(var) - len(self.variables)
+        variables = [v for v in self.variables if v != var]
+        return Factor(variables, np.take(self.table, int(value), axis=axis),
+                      self.log_scale)
+
+    def __repr__(self):
+        return 'Factor({})'.format(self.variables)
+
+
+def _rescale(table, n_variables, log_scale):
+    """
+    Divide la tabla por su máximo (en cada elemento del batch) y suma el
+    logaritmo del máximo a log_scale.
+    """
+    axes = tuple(range(table.ndim - n_variables, table.ndim))
+    top = np.abs(table).max(axis=axes)
+    nonzero = top > 0
+    top = np.where(nonzero, top, 1.0)
+    shift = np.where(nonzero, np.log(top), -np.inf)
+    table = table / top.reshape(top.shape + (1,) * n_variables)
+    return table, log_scale + (float(shift) if np.ndim(shift) == 0 else shift)
+
+
+def product_sum(factors, keep, rescale=False):
+    """
+    Multiplica los factores y suma todas las variables que no están en keep.
+
+    Se resuelve con una única llamada a numpy.einsum.
+
+    Args:
+        factors: lista de Factor
+        keep: variables que deben quedar en el resultado (las que no aparecen
+            en ningún factor se ignoran)
+        rescale: si es True la tabla del resultado se normaliza para que su
+            máximo sea 1 y la escala se acumula en log_scale
+    """
+    if not factors:
+        return Factor([], np.ones(()))
+    factors = list(factors)
+    while len(factors) > MAX_OPERANDS:
+        # numpy.einsum admite una cantidad limitada de operandos: se
+        # multiplican por partes, sumando las variables que no aparecen en el
+        # resto
+        head, factors = factors[:MAX_OPERANDS], factors[MAX_OPERANDS:]
+        rest = set(keep).union(*[f.variables for f in factors])
+        factors.append(product_sum(head, rest, rescale))
+    variables = []
+    for f in factors:
+        variables.extend([v for v in f.variables if v not in variables])
+    letters = dict(zip(variables, _LETTERS))
+    out = [v for v in variables if v in keep]
+    spec = '{}->...{}'.format(
+        ','.join(['...' + ''.join([letters[v] for v in f.variables])
+                  for f in factors]),
+        ''.join([letters[v] for v in out]))
+    table = np.einsum(spec, *[f.table for f in factors])
+    log_scale = sum([f.log_scale for f in factors], 0.0)
+    if rescale:
+        table, log_scale = _rescale(table, len(out), log_scale)
+    return Factor(out, table, log_scale)
+
+
+def _noisy_or_factors(i, parents, gamma, alpha, aux):
+    """
+    Factores que describen P(X_i | dependencias) para un evento noisy-or.
+
+    Args:
+        i: id del evento
+        parents: ids de sus dependencias
+        gamma: array (...) con su gamma
+        alpha: array (..., k) con las influencias de cada dependencia
+        aux: primer id de las variables auxiliares (se usan a lo sumo
+            len(parents) - 1 ids consecutivos)
+
+    Returns:
+        lista de Factor
+    """
+    leak = 1 - gamma
+    if len(parents) == 0:
+        return [Factor([i], np.stack([leak, gamma], axis=-1))]
+
+    if len(parents) <= MAX_CPT_PARENTS:
+        # Tabla completa sobre (A_1, ..., A_k, X)
+        neg = leak[(Ellipsis,) + (None,) * len(parents)]
+        for j in range(len(parents)):
+            shape = [1] * len(parents)
+            shape[j] = 2
+            keep = np.stack([np.ones_like(alpha[..., j]),
+                             1 - alpha[..., j]], axis=-1)
+            neg = neg * keep.reshape(keep.shape[:-1] + tuple(shape))
+        table = np.stack([neg, 1 - neg], axis=-1)
+        return [Factor(list(parents) + [i], table)]
+
+    # Cadena: Y_1 depende de A_1 y del leak; Y_j = Y_{j-1} o (A_j y ruido_j);
+    # la última variable de la cadena es X_i.
+    ones = np.ones_like(gamma)
+    zeros = np.zeros_like(gamma)
+    a = alpha[..., 0]
+    first = np.stack([np.stack([leak, gamma], axis=-1),
+                      np.stack([leak * (1 - a), 1 - leak * (1 - a)],
+                               axis=-1)], axis=-2)
+    factors = []
+    previous = aux
+    factors.append(Factor([parents[0], previous], first))
+    for j in range(1, len(parents)):
+        current = i if j == len(parents) - 1 else aux + j
+        a = alpha[..., j]
+        # table[y, a, z]
+        y0 = np.stack([np.stack([ones, zeros], axis=-1),
+                       np.stack([1 - a, a], axis=-1)], axis=-2)
+        y1 = np.stack([np.stack([zeros, ones], axis=-1),
+                       np.stack([zeros, ones], axis=-1)], axis=-2)
+        table = np.stack([y0, y1], axis=-3)
+        factors.append(Factor([previous, parents[j], current], table))
+        previous = current
+    return factors
+
+
+def _parameters(net, gamma, alpha):
+    "gamma y alpha como float64 con las mismas dimensiones adicionales."
+    gamma = np.asarray(net.gamma if gamma is None else gamma, dtype=np.float64)
+    alpha = np.asarray(net.alpha if alpha is None else alpha, dtype=np.float64)
+    batch = np.broadcast(gamma[..., :1], alpha[..., :1]).shape[:-1]
+    return (np.broadcast_to(gamma, batch + gamma.shape[-1:]),
+            np.broadcast_to(alpha, batch + alpha.shape[-1:]))
+
+
+def node_factors(net, i, gamma=None, alpha=None):
+    """
+    Factores que describen P(X_i | dependencias) en una red compilada.
+
+    Las variables auxiliares del evento i tienen ids len(net) + indptr[i] +
+    j, de modo que los factores de cada evento pueden construirse (y
+    guardarse) por separado.
+
+    Args:
+        net: ib_network.Network
+        i: id del evento
+        gamma, alpha: parámetros alternativos (ver network_factors)
+    """
+    gamma, alpha = _parameters(net, gamma, alpha)
+    a, b = net.indptr[i], net.indptr[i + 1]
+    return _noisy_or_factors(i, list(net.indices[a:b]), gamma[..., i],
+                             alpha[..., a:b], len(net) + a)
+
+
+def network_factors(net, gamma=None, alpha=None, variables=None):
+    """
+    Factores de la distribución conjunta de una red compilada.
+
+    Args:
+        net: ib_network.Network
+        gamma, alpha: parámetros alternativos (con dimensiones adicionales al
+            principio); por defecto los de la red
+        variables: ids de los eventos cuyos factores se incluyen (por defecto
+            todos). Debe ser cerrado por ancestros.
+
+    Returns:
+        lista de Factor. Las variables auxiliares tienen ids >= len(net).
+    """
+    gamma, alpha = _parameters(net, gamma, alpha)
+    if variables is None:
+        variables = range(len(net))
+    return [f
+            for i in sorted(variables)
+            for f in node_factors(net, i, gamma, alpha)]
+
+
+def ancestors(net, ids):
+    "Ids de los eventos ids y de todos sus ancestros."
+    ret = set()
+    pending = list(ids)
+    while pending:
+        i = pending.pop()
+        if i in ret:
+            continue
+        ret.add(i)
+        pending.extend(int(k) for k in net.parents(i))
+    return ret
+
+
+def _interaction_graph(factors):
+    graph = {}
+    for f in factors:
+        for v in f.variables:
+            graph.setdefault(v, set()).update(u for u in f.variables if u != v)
+    return graph
+
+
+def elimination_order(factors, eliminate, heuristic=MIN_FILL):
+    """
+    Orden heurístico de eliminación de variables.
+
+    En cada paso se elige la variable que agrega menos aristas al grafo de
+    interacción al eliminarla (min-fill) o la de menor cantidad de vecinos
+    (min-degree). Los empates se rompen por cantidad de vecinos y luego por
+    id.
+
+    Args:
+        factors: lista de Factor
+        eliminate: variables a eliminar
+        heuristic: MIN_FILL o MIN_DEGREE
+    """
+    if heuristic not in (MIN_FILL, MIN_DEGREE):
+        raise ValueError('Heurística desconocida: {}'.format(heuristic))
+    graph = _interaction_graph(factors)
+    pending = set(v for v in eliminate if v in graph)
+    order = []
+
+    def fill(v):
+        neighbors = list(graph[v])
+        return sum(1
+                   for j, a in enumerate(neighbors)
+                   for b in neighbors[j + 1:]
+                   if b not in graph[a])
+
+    while pending:
+        if heuristic == MIN_FILL:
+            v = min(pending, key=lambda v: (fill(v), len(graph[v]), v))
+        else:
+            v = min(pending, key=lambda v: (len(graph[v]), v))
+        neighbors = graph.pop(v)
+        for a in neighbors:
+            graph[a].discard(v)
+            graph[a].update(b for b in neighbors if b != a)
+        pending.remove(v)
+        order.append(v)
+    return order
+
+
+def eliminate(factors, order, rescale=False):
+    """
+    Suma las variables de order, en ese orden, del producto de los factores.
+
+    Con rescale=True cada factor intermedio se normaliza (ver product_sum).
+
+    Returns:
+        lista de factores resultante, sobre las variables no eliminadas
+    """
+    factors = list(factors)
+    for v in order:
+        involved = [f for f in factors if v in f.variables]
+        if not involved:
+            continue
+        factors = [f for f in factors if v not in f.variables]
+        keep = set(u for f in involved for u in f.variables if u != v)
+        factors.append(product_sum(involved, keep, rescale))
+    return factors
+
+
+def reduce(factors, evidence):
+    "Fija en los factores los valores de la evidencia (id -> bool)."
+    ret = []
+    for f in factors:
+        for var, value in evidence.items():
+            f = f.reduce(var, value)
+        ret.append(f)
+    return ret
+
+
+def _shared_factors(net, keep, evidence, heuristic, gamma=None, alpha=None,
+                    rescale=False):
+    """
+    Factores de la red reducidos por la evidencia, con todas las variables
+    salvo keep ya eliminadas.
+
+    Sólo se usan los factores de los ancestros de keep y de la evidencia; el
+    resto de los eventos suman 1 y no afectan el resultado.
+    """
+    relevant = ancestors(net, list(keep) + list(evidence))
+    factors = reduce(network_factors(net, gamma, alpha, relevant), evidence)
+    keep = set(keep) - set(evidence)
+    variables = set(v for f in factors for v in f.variables)
+    return eliminate(factors,
+                     elimination_order(factors, variables - keep, heuristic),
+                     rescale)
+
+
+def target_table(factors, targets, evidence, heuristic):
+    """
+    Tabla P(targets, evidencia) a partir de factores que contienen a targets.
+    """
+    table, log_scale = _scaled_target_table(factors, targets, evidence,
+                                            heuristic)
+    if np.any(log_scale != 0):
+        table = table * np.exp(log_scale).reshape(
+            np.shape(log_scale) + (1,) * len(targets))
+    return table
+
+
+def _scaled_target_table(factors, targets, evidence, heuristic, rescale=False):
+    """
+    Como target_table, pero devuelve (tabla, log_scale): P(targets,
+    evidencia) es tabla * exp(log_scale), con log_scale de forma batch.
+    """
+    keep = set(targets) - set(evidence)
+    variables = set(v for f in factors for v in f.variables)
+    order = elimination_order(factors, variables - keep, heuristic)
+    result = product_sum(eliminate(factors, order, rescale), keep, rescale)
+
+    # Reordena según targets; los targets observados se fijan con la evidencia
+    table = result.table
+    batch = table.ndim - len(result.variables)
+    axes = list(range(batch)) + [batch + result.variables.index(t)
+                                 for t in targets if t in keep]
+    table = np.transpose(table, axes)
+    for j, t in enumerate(targets):
+        if t in evidence:
+            table = np.expand_dims(table, batch + j)
+            one_hot = np.zeros((2,) + (1,) * (table.ndim - batch - j - 1))
+            one_hot[int(evidence[t])] = 1
+            table = table * one_hot
+    return table, result.log_scale
+
+
+def posterior(table, n_targets):
+    "P(targets = 1 | evidencia) a partir de la tabla de joint_table."
+    batch = table.ndim - n_targets
+    total = table.sum(axis=tuple(range(batch, table.ndim)))
+    if np.any(total == 0):
+        raise ZeroDivisionError('La evidencia tiene probabilidad 0')
+    ret = table[(Ellipsis,) + (1,) * n_targets] / total
+    return float(ret) if np.ndim(ret) == 0 else ret
+
+
+def joint_table(net, targets, evidence={}, heuristic=MIN_FILL, gamma=None,
+                alpha=None):
+    """
+    Calcula P(targets, evidencia) para todas las combinaciones de targets.
+
+    Args:
+        net: ib_network.Network
+        targets: ids de los eventos consultados
+        evidence: diccionario id -> bool
+        heuristic: MIN_FILL o MIN_DEGREE
+        gamma, alpha: parámetros alternativos (ver network_factors)
+
+    Returns:
+        array de forma batch + (2,) * len(targets)
+    """
+    targets = list(targets)
+    evidence = dict([(int(k), bool(v)) for k, v in evidence.items()])
+    factors = _shared_factors(net, targets, evidence, heuristic, gamma, alpha)
+    return target_table(factors, targets, evidence, heuristic)
+
+
+def scaled_joint_table(net, targets, evidence={}, heuristic=MIN_FILL,
+                       gamma=None, alpha=None):
+    """
+    Como joint_table, pero normalizando cada factor intermedio para que su
+    máximo sea 1. Con mucha evidencia P(targets, evidencia) puede ser menor
+    que el mínimo float64; la escala se lleva aparte, en logaritmo.
+
+    Returns:
+        (tabla, log_scale): P(targets, evidencia) = tabla * exp(log_scale),
+        con log_scale de forma batch
+    """
+    targets = list(targets)
+    evidence = dict([(int(k), bool(v)) for k, v in evidence.items()])
+    factors = _shared_factors(net, targets, evidence, heuristic, gamma, alpha,
+                              rescale=True)
+    return _scaled_target_table(factors, targets, evidence, heuristic,
+                                rescale=True)
+
+
+def log_joint_table(net, targets, evidence={}, heuristic=MIN_FILL,
+                    gamma=None, alpha=None):
+    """
+    Calcula log P(targets, evidencia) para todas las combinaciones de
+    targets, sin underflow (ver scaled_joint_table).
+
+    Returns:
+        array de forma batch + (2,) * len(targets)
+    """
+    table, log_scale = scaled_joint_table(net, targets, evidence, heuristic,
+                                          gamma, alpha)
+    with np.errstate(divide='ignore'):
+        return np.log(table) + np.reshape(
+            log_scale, np.shape(log_scale) + (1,) * len(list(targets)))
+
+
+def query(net, target, evidence={}, heuristic=MIN_FILL):
+    """
+    Calcula la probabilidad a posteriori exacta P(target = 1 | evidencia).
+
+    Args:
+        net: ib_network.Network
+        target: evento a consultar (BinaryEvent, nombre o id). Si es un
+            JointProbability o una lista de eventos se calcula la
+            probabilidad de que sucedan todos.
+        evidence: diccionario evento -> bool sobre eventos cualesquiera de la
+            red
+        heuristic: MIN_FILL o MIN_DEGREE
+    """
+    targets = net.event_ids(target)
+    evidence = dict([(net.id_of(k), bool(v)) for k, v in evidence.items()])
+    table, _ = scaled_joint_table(net, targets, evidence, heuristic)
+    return posterior(table, len(targets))
+
+
+def query_many(net, queries, heuristic=MIN_FILL, share=16):
+    """
+    Calcula varias probabilidades a posteriori compartiendo cálculos.
+
+    Las consultas con la misma evidencia se resuelven juntas: la red se
+    reduce por la evidencia una sola vez y se eliminan una sola vez todas las
+    variables que no son consultadas por ninguna de ellas. Sobre los factores
+    resultantes, que sólo involucran a los eventos consultados, se resuelve
+    cada consulta. Para acotar el tamaño de esos factores se agrupan a lo
+    sumo share eventos consultados por eliminación compartida.
+
+    Args:
+        net: ib_network.Network
+        queries: lista de pares (targets, evidence), con targets una lista de
+            ids y evidence un diccionario id -> bool
+        heuristic: MIN_FILL o MIN_DEGREE
+        share: cantidad máxima de eventos consultados por grupo
+
+    Returns:
+        lista con P(targets = 1 | evidence) de cada consulta, en orden
+    """
+    groups = collections.OrderedDict()
+    for n, (targets, evidence) in enumerate(queries):
+        key = frozenset([(int(k), bool(v)) for k, v in evidence.items()])
+        groups.setdefault(key, []).append((n, [int(t) for t in targets]))
+
+    results = [None] * len(queries)
+    for key, items in groups.items():
+        evidence = dict(key)
+        chunks = [[]]
+        keep = set()
+        for n, targets in items:
+            if chunks[-1] and len(keep | set(targets)) > share:
+                chunks.append([])
+                keep = set()
+            chunks[-1].append((n, targets))
+            keep |= set(targets)
+        for chunk in chunks:
+            keep = set(t for _, targets in chunk for t in targets)
+            factors = _shared_factors(net, keep, evidence, heuristic,
+                                      rescale=True)
+            tables = {}
+            for n, targets in chunk:
+                if tuple(targets) not in tables:
+                    table, _ = _scaled_target_table(factors, targets,
+                                                    evidence, heuristic,
+                                                    rescale=True)
+                    tables[tuple(targets)] = posterior(table, len(targets))
+                results[n] = tables[tuple(targets)]
+    return results
+
+
+def log_query(net, target, evidence={}, heuristic=MIN_FILL):
+    """
+    Calcula log P(target = 1 | evidencia). Ver query y log_joint_table.
+    """
+    targets = net.event_ids(target)
+    evidence = dict([(net.id_of(k), bool(v)) for k, v in evidence.items()])
+    table = log_joint_table(net, targets, evidence, heuristic)
+    batch = table.ndim - len(targets)
+    flat = table.reshape(table.shape[:batch] + (-1,))
+    total = np.logaddexp.reduce(flat, axis=-1)
+    if np.any(total == -np.inf):
+        raise ZeroDivisionError('La evidencia tiene probabilidad 0')
+    ret = flat[..., -1] - total
+    return float(ret) if np.ndim(ret) == 0 else ret
+
+
+def log_evidence_prob(net, evidence, heuristic=MIN_FILL):
+    """
+    Calcula log P(evidencia) sin underflow, aun con cientos de eventos
+    observados.
+    """
+    evidence = dict([(net.id_of(k), v) for k, v in evidence.items()])
+    table = log_joint_table(net, [], evidence, heuristic)
+    return float(table) if np.ndim(table) == 0 else table
+
+
+def evidence_prob(net, evidence, heuristic=MIN_FILL):
+    """
+    Calcula la probabilidad exacta de la evidencia, P(evidencia).
+
+    Args:
+        net: ib_network.Network
+        evidence: diccionario evento -> bool
+    """
+    evidence = dict([(net.id_of(k), v) for k, v in evidence.items()])
+    table = joint_table(net, [], evidence, heuristic)
+    return float(table) if np.ndim(table) == 0 else table
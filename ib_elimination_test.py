@@ -0,0 +1,141 @@
+#-*- coding: utf-8 -*-
+import itertools
+import random
+import pytest
+import numpy as np
+import ib
+import ib_elimination
+import ib_network
+import ejercicio
+
+# Tests de eliminación de variables
+
+
+def brute_force(net, targets, evidence):
+    "P(targets = 1 | evidence) enumerando todos los estados de la red."
+    num = den = 0.0
+    for state in itertools.product([0, 1], repeat=len(net)):
+        if any(state[k] != v for k, v in evidence.items()):
+            continue
+        p = 1.0
+        for i in range(len(net)):
+            neg = 1 - net.gamma[i]
+            for j in range(net.indptr[i], net.indptr[i + 1]):
+                if state[net.indices[j]]:
+                    neg *= 1 - net.alpha[j]
+            p *= 1 - neg if state[i] else neg
+        den += p
+        if all(state[t] for t in targets):
+            num += p
+    return num / den
+
+
+def random_network(seed, n=9, max_parents=6):
+    "Red al azar con conexiones horizontales y eventos de muchos padres."
+    rnd = random.Random(seed)
+    events = []
+    for i in range(n):
+        parents = rnd.sample(events, min(len(events),
+                                         rnd.randint(0, max_parents)))
+        deps = dict([(p, rnd.uniform(0.1, 0.9)) for p in parents])
+        events.append(ib.BinaryEvent(deps, gamma=rnd.uniform(0.01, 0.3),
+                                     name=str(i)))
+    return ib_network.Network(events)
+
+
+def test_ejercicio():
+    "Las probabilidades exactas coinciden con las calculadas con webppl."
+    e = ejercicio
+    net = ib_network.Network([e.Sintomas])
+    sintomas = {e.Tos: True, e.Fiebre: True, e.DifResp: True}
+
+    assert net.query(e.TB, sintomas) == pytest.approx(0.541296, abs=1e-6)
+    assert net.query(e.Canc, sintomas) == pytest.approx(0.479073, abs=1e-6)
+    assert (net.query(e.Sintomas, {e.TB: True}) ==
+            pytest.approx(0.097082, abs=1e-6))
+    assert net.query(e.Tos) == pytest.approx(0.118580, abs=1e-6)
+    assert (net.evidence_prob(sintomas) ==
+            pytest.approx(0.000915, abs=1e-6))
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('heuristic', [ib_elimination.MIN_FILL,
+                                       ib_elimination.MIN_DEGREE])
+def test_brute_force(seed, heuristic):
+    "Eliminación de variables coincide con la enumeración completa."
+    net = random_network(seed)
+    rnd = random.Random(seed)
+    for _ in range(5):
+        observed = rnd.sample(range(len(net)), 3)
+        evidence = dict([(k, rnd.random() < 0.5) for k in observed])
+        targets = rnd.sample(range(len(net)), rnd.randint(1, 2))
+        assert (ib_elimination.query(net, targets, evidence, heuristic) ==
+                pytest.approx(brute_force(net, targets, evidence)))
+
+
+def test_batch_parameters():
+    "Los parámetros pueden tener dimensiones adicionales."
+    net = random_network(0)
+    gamma = np.stack([net.gamma, net.gamma * 0.5])
+    table = ib_elimination.joint_table(net, [8], {0: True}, gamma=gamma)
+    assert table.shape == (2, 2)
+    assert table[0, 1] / table[0].sum() == pytest.approx(
+        net.query(8, {0: True}))
+
+
+def test_elimination_order():
+    "El orden de eliminación incluye sólo las variables pedidas."
+    net = ib_network.Network([ejercicio.Sintomas])
+    factors = ib_elimination.network_factors(net)
+    order = ib_elimination.elimination_order(factors, range(5))
+    assert sorted(order) == list(range(5))
+
+
+def test_query_many():
+    "Las consultas agrupadas coinciden con las individuales."
+    e = ejercicio
+    net = ib_network.Network([e.Sintomas])
+    sintomas = {e.Tos: True, e.Fiebre: True, e.DifResp: True}
+    queries = [(e.Tos, {}), (e.Sintomas, {}), (e.Tos, {e.TB: True}),
+               (e.Sintomas, {e.TB: True}), (e.TB, sintomas),
+               (e.Canc, sintomas), (e.Tos, {}), (e.TB, {}),
+               ([e.Fiebre, e.Canc], {e.Canc: True})]
+    for share in [1, 2, 16]:
+        ids = [(net.event_ids(t), dict([(net.id_of(k), v)
+                                        for k, v in ev.items()]))
+               for t, ev in queries]
+        assert (ib_elimination.query_many(net, ids, share=share) ==
+                pytest.approx([net.query(t, ev) for t, ev in queries]))
+    assert (net.query_many(queries) ==
+            pytest.approx([net.query(t, ev) for t, ev in queries]))
+
+
+def test_log_space():
+    "Las consultas en espacio logarítmico no dan underflow."
+    net = random_network(1, 8)
+    evidence = {5: True, 7: False}
+    assert net.log_evidence_prob(evidence) == pytest.approx(
+        np.log(net.evidence_prob(evidence)))
+    assert net.log_query(0, evidence) == pytest.approx(
+        np.log(net.query(0, evidence)))
+
+    rnd = random.Random(2)
+    diseases = [ib.BinaryEvent(gamma=0.1) for _ in range(4)]
+    findings = [ib.BinaryEvent(dict([(d, rnd.uniform(0.01, 0.05))
+                                     for d in rnd.sample(diseases, 2)]),
+                               gamma=0.001)
+                for _ in range(300)]
+    net = ib_network.Network(findings)
+    evidence = dict([(f, i % 10 != 0) for i, f in enumerate(findings)])
+    assert net.evidence_prob(evidence) == 0
+    log_p = net.log_evidence_prob(evidence)
+    assert -np.inf < log_p < np.log(np.finfo(float).tiny)
+
+    # P(d | evidencia) = P(d, evidencia) / P(evidencia), ambos en logaritmo
+    d = net.id_of(diseases[0])
+    with_d = dict(evidence)
+    with_d[diseases[0]] = True
+    joint = net.log_evidence_prob(with_d)
+    assert net.log_query(d, evidence) == pytest.approx(joint - log_p)
+    assert net.query(d, evidence, engine='elimination') == pytest.approx(
+        np.exp(joint - log_p))
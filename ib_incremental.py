@@ -0,0 +1,249 @@
+#-*- coding: utf-8 -*-
+"""
+Reevaluación incremental de consultas tras editar parámetros o evidencia.
+
+En una sesión interactiva (por ejemplo, un médico que cambia el gamma de Hosp
+o marca un síntoma) recalcular todas las consultas desde cero desperdicia
+casi todo el trabajo. Session guarda los resultados intermedios y sabe de qué
+eventos depende cada uno:
+
+    * Las marginales P(X = 1) (semántica de BinaryEvent.prob_pos) dependen de
+      los parámetros del evento y de sus ancestros. Al editar un evento sólo
+      se recalculan él y sus descendientes, y la propagación se corta en los
+      descendientes cuya marginal no cambia.
+    * Los factores de eliminación de variables de cada evento dependen de
+      sus parámetros y de la evidencia sobre él y sus dependencias. Sólo se
+      reconstruyen los factores tocados por una edición.
+    * Cada consulta depende de los ancestros de sus eventos y de la
+      evidencia. Las consultas cuya parte relevante de la red no fue tocada
+      conservan su resultado.
+
+Session.update devuelve los resultados actualizados y cuánto se recalculó.
+"""
+from __future__ import print_function, division, unicode_literals
+import collections
+
+import numpy as np
+
+import ib_elimination
+import ib_network
+
+# Tipos de consulta
+QUERY = 'query'
+PROB_POS = 'prob_pos'
+
+Recomputed = collections.namedtuple('Recomputed',
+                                    ['marginals', 'factors', 'queries'])
+Update = collections.namedtuple('Update', ['results', 'recomputed'])
+
+
+class _Query(object):
+    __slots__ = ('kind', 'targets', 'result', 'relevant', 'dirty')
+
+    def __init__(self, kind, targets):
+        self.kind = kind
+        self.targets = targets
+        self.result = None
+        self.relevant = set()
+        self.dirty = True
+
+
+class Session(object):
+    """
+    Sesión de consultas sobre una red con parámetros y evidencia editables.
+
+    Los parámetros de la sesión se inicializan con los de la red; editarlos
+    no modifica la red.
+
+    Ej:
+        session = Session(net, {Tos: True})
+        session.add_query('tb', TB)
+        session.update()                 # calcula todo
+        session.set_gamma(Hosp, 0.05)
+        session.update().recomputed      # sólo lo que depende de Hosp
+    """
+
+    def __init__(self, net, evidence={}, heuristic=ib_elimination.MIN_FILL):
+        """
+        Args:
+            net: ib_network.Network
+            evidence: diccionario evento -> bool inicial
+            heuristic: orden de eliminación (ver ib_elimination)
+        """
+        self.net = net
+        self.heuristic = heuristic
+        self.gamma = np.array(net.gamma, dtype=np.float64)
+        self.alpha = np.array(net.alpha, dtype=np.float64)
+        self.evidence = dict([(net.id_of(k), bool(v))
+                              for k, v in evidence.items()])
+        self._children = [[] for _ in range(len(net))]
+        for i in range(len(net)):
+            for k in net.parents(i):
+                self._children[k].append(i)
+        self._queries = collections.OrderedDict()
+        self._marginals = None
+        self._factors = {}
+        self._edited = set()
+        self._counts = [0, 0, 0]
+
+    def add_query(self, name, target, kind=QUERY):
+        """
+        Registra una consulta.
+
+        Args:
+            name: nombre de la consulta en los resultados
+            target: evento consultado (ver Network.event_ids)
+            kind: QUERY para P(target = 1 | evidencia) exacta (Network.query)
+                o PROB_POS para target.prob_pos(evidencia)
+        """
+        if kind not in (QUERY, PROB_POS):
+            raise ValueError('Tipo de consulta desconocido: {}'.format(kind))
+        self._queries[name] = _Query(kind, self.net.event_ids(target))
+
+    def remove_query(self, name):
+        del self._queries[name]
+
+    def set_gamma(self, ev, value):
+        "Modifica el gamma de un evento."
+        i = self.net.id_of(ev)
+        self.gamma[i] = value
+        self._edit(i)
+
+    def set_alpha(self, ev, dep, value):
+        "Modifica la influencia de la dependencia dep sobre el evento ev."
+        i, k = self.net.id_of(ev), self.net.id_of(dep)
+        for j in range(self.net.indptr[i], self.net.indptr[i + 1]):
+            if self.net.indices[j] == k:
+                self.alpha[j] = value
+                self._edit(i)
+                return
+        raise KeyError('{} no depende de {}'.format(ev, dep))
+
+    def set_evidence(self, ev, value):
+        """
+        Modifica la evidencia sobre un evento.
+
+        Args:
+            ev: evento
+            value: True, False o None para quitar la evidencia
+        """
+        i = self.net.id_of(ev)
+        if value is None:
+            if i not in self.evidence:
+                return
+            del self.evidence[i]
+        else:
+            if self.evidence.get(i) == bool(value):
+                return
+            self.evidence[i] = bool(value)
+
+        # Factores cuyo alcance incluye a i
+        for k in [i] + self._children[i]:
+            self._factors.pop(k, None)
+        affected = ib_elimination.ancestors(self.net, [i])
+        for q in self._queries.values():
+            if q.kind == QUERY:
+                if affected & q.relevant or i in q.targets:
+                    q.dirty = True
+            elif any(i in self.net.parents(t) for t in q.targets):
+                q.dirty = True
+
+    def _edit(self, i):
+        "Registra que cambiaron los parámetros del evento i."
+        self._edited.add(i)
+        self._factors.pop(i, None)
+        for q in self._queries.values():
+            if q.kind == QUERY and i in q.relevant:
+                q.dirty = True
+            elif q.kind == PROB_POS and i in q.targets:
+                q.dirty = True
+
+    def _update_marginals(self):
+        """
+        Recalcula las marginales de los eventos editados y sus descendientes.
+
+        Returns:
+            conjunto de eventos cuya marginal cambió
+        """
+        net = self.net
+        if self._marginals is None:
+            self._marginals = ib_network.marginals(
+                self.gamma, self.alpha, net.indptr, net.indices,
+                net.level_ptr)
+            self._counts[0] += len(net)
+            self._edited.clear()
+            return set(range(len(net)))
+
+        changed = set()
+        pending = set(self._edited)
+        self._edited.clear()
+        while pending:
+            # Los ids respetan el orden topológico
+            i = min(pending)
+            pending.remove(i)
+            a, b = net.indptr[i], net.indptr[i + 1]
+            neg = (1 - self.gamma[i]) * np.prod(
+                1 - self.alpha[a:b] * self._marginals[net.indices[a:b]])
+            self._counts[0] += 1
+            if neg != 1 - self._marginals[i]:
+                self._marginals[i] = 1 - neg
+                changed.add(i)
+                pending.update(self._children[i])
+        return changed
+
+    def _node_factors(self, i):
+        "Factores del evento i reducidos por la evidencia."
+        try:
+            return self._factors[i]
+        except KeyError:
+            factors = ib_elimination.reduce(
+                ib_elimination.node_factors(self.net, i, self.gamma,
+                                            self.alpha),
+                self.evidence)
+            self._factors[i] = factors
+            self._counts[1] += 1
+            return factors
+
+    def _evaluate(self, q):
+        net = self.net
+        if q.kind == PROB_POS:
+            return float(net.joint_pos(q.targets, self.evidence,
+                                       gamma=self.gamma, alpha=self.alpha,
+                                       marg=self._marginals))
+        q.relevant = ib_elimination.ancestors(
+            net, list(q.targets) + list(self.evidence))
+        factors = [f for i in sorted(q.relevant)
+                   for f in self._node_factors(i)]
+        table = ib_elimination.target_table(factors, q.targets,
+                                            self.evidence, self.heuristic)
+        return ib_elimination.posterior(table, len(q.targets))
+
+    def update(self):
+        """
+        Recalcula las consultas afectadas por las ediciones.
+
+        Returns:
+            Update con los resultados de todas las consultas (diccionario
+            nombre -> probabilidad) y un Recomputed con la cantidad de
+            marginales, factores de eventos y consultas recalculados
+        """
+        changed = self._update_marginals()
+        for q in self._queries.values():
+            if q.kind == PROB_POS and any(
+                    int(k) in changed
+                    for t in q.targets for k in self.net.parents(t)):
+                q.dirty = True
+        for q in self._queries.values():
+            if q.dirty:
+                q.result = self._evaluate(q)
+                q.dirty = False
+                self._counts[2] += 1
+        counts = Recomputed(*self._counts)
+        self._counts = [0, 0, 0]
+        return Update(self.results, counts)
+
+    @property
+    def results(self):
+        "Diccionario nombre -> último resultado de cada consulta."
+        return collections.OrderedDict([(name, q.result)
+                                        for name, q in self._queries.items()])
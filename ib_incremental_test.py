@@ -0,0 +1,75 @@
+#-*- coding: utf-8 -*-
+import pytest
+import ib_incremental
+import ib_network
+import ejercicio
+
+e = ejercicio
+net = ib_network.Network([e.Sintomas])
+
+
+def new_session():
+    session = ib_incremental.Session(net, {e.Tos: True})
+    session.add_query('tb', e.TB)
+    session.add_query('canc', e.Canc)
+    session.add_query('gripe', e.Gripe, ib_incremental.PROB_POS)
+    session.add_query('tos', e.Tos, ib_incremental.PROB_POS)
+    return session
+
+
+def test_initial_update():
+    "La primera actualización calcula todo."
+    session = new_session()
+    update = session.update()
+    assert update.recomputed.queries == 4
+    assert update.recomputed.marginals == len(net)
+    assert update.results['tb'] == pytest.approx(net.query(e.TB, {e.Tos: True}))
+    assert update.results['tos'] == pytest.approx(e.Tos.prob_pos({e.Tos: True}))
+
+    update = session.update()
+    assert update.recomputed == ib_incremental.Recomputed(0, 0, 0)
+
+
+def test_parameter_edit():
+    "Editar un parámetro recalcula sólo lo que depende de él."
+    session = new_session()
+    session.update()
+
+    # Fuma sólo influye en Canc (y por ella en Tos y Dif. Resp)
+    session.set_alpha(e.Canc, e.Fuma, 0.5)
+    update = session.update()
+    assert update.recomputed.marginals == 3
+    assert update.recomputed.factors == 1
+    assert update.recomputed.queries == 3  # tb, canc y tos; no gripe
+
+    session.set_gamma(e.Frio, 0.9)
+    update = session.update()
+    assert update.recomputed.marginals == 4  # Frio, Gripe, Tos y Fiebre
+    assert update.recomputed.queries == 4
+
+    expected = net.query(e.TB, {e.Tos: True})
+    assert update.results['tb'] != pytest.approx(expected)
+    other = ib_network.Network([e.Sintomas])
+    other.gamma[other.id_of(e.Frio)] = 0.9
+    other.alpha[other.indptr[other.id_of(e.Canc)]] = 0.5
+    assert update.results['tb'] == pytest.approx(
+        other.query(e.TB, {e.Tos: True}))
+
+
+def test_evidence_edit():
+    "Modificar la evidencia reconstruye sólo los factores que la involucran."
+    session = new_session()
+    session.update()
+
+    session.set_evidence(e.Fiebre, False)
+    update = session.update()
+    assert update.recomputed.factors == 1
+    assert update.recomputed.queries == 2  # las prob_pos no dependen de Fiebre
+    assert update.results['canc'] == pytest.approx(
+        net.query(e.Canc, {e.Tos: True, e.Fiebre: False}))
+
+    session.set_evidence(e.Fiebre, None)
+    session.set_evidence(e.Fiebre, None)
+    update = session.update()
+    assert update.results['canc'] == pytest.approx(
+        net.query(e.Canc, {e.Tos: True}))
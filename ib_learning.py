@@ -0,0 +1,286 @@
+#-*- coding: utf-8 -*-
+"""
+Estimación de los parámetros noisy-or a partir de casos observados.
+
+Cada caso es una fila con el valor (0, 1 o NaN si falta) de cada evento de la
+red. Para estimar los parámetros de un evento X con dependencias U_1..U_k se
+consideran las filas en las que X y todas sus dependencias están observadas.
+En el modelo noisy-or
+
+    P(X = 0 | u) = (1 - gamma) * prod_{j: u_j = 1} (1 - alpha_j)
+
+X sucede si lo activa alguna de sus causas: la causa de fuga (leak), siempre
+presente, con probabilidad gamma, o alguna dependencia presente U_j con
+probabilidad alpha_j. No se sabe cuál de las causas activó a X, por lo que
+la máxima verosimilitud se obtiene con EM: en el paso E se calcula la
+probabilidad de que cada causa presente haya activado a X,
+
+    E[Z_c | u, X = 1] = q_c / P(X = 1 | u),   E[Z_c | u, X = 0] = 0
+
+y en el paso M cada parámetro es la fracción esperada de activaciones sobre
+las filas en que su causa estaba presente. Los eventos sin dependencias se
+reducen a la frecuencia de X = 1.
+
+Los casos se leen por bloques (ver read_csv) y cada bloque se comprime en
+estadísticos suficientes: para cada evento, la cantidad de filas con X = 0 y
+con X = 1 por cada configuración de sus dependencias (codificada como
+máscara de bits). La memoria queda acotada por la cantidad de
+configuraciones distintas y no por la cantidad de casos, y EM itera sobre
+los estadísticos sin volver a leer los datos. Los bloques pueden repartirse
+en un pool de procesos.
+
+Ej:
+    result = ib_learning.fit(net, ib_learning.read_csv('casos.csv'))
+    fitted = net.with_parameters(result.gamma, result.alpha)
+"""
+from __future__ import print_function, division, unicode_literals
+import collections
+import csv
+import io
+import multiprocessing
+from decimal import Decimal
+
+import numpy as np
+
+# Valores de las celdas de read_csv (en minúsculas); el resto es un error
+CSV_VALUES = {
+    '1': 1.0, '0': 0.0, 'true': 1.0, 'false': 0.0,
+    '': np.nan, 'na': np.nan, 'nan': np.nan,
+}
+
+# Los parámetros iniciales se llevan a [EPSILON, 1 - EPSILON]: EM no puede
+# salir de 0 ni de 1
+EPSILON = 1e-3
+
+Fit = collections.namedtuple('Fit', ['gamma', 'alpha', 'loglik',
+                                     'iterations', 'rows'])
+Fit.__doc__ = """
+Resultado de fit.
+
+Atributos:
+    gamma: array (n,) con el gamma estimado de cada evento
+    alpha: array alineado con net.indices con las influencias estimadas
+    loglik: array (n,) con la log-verosimilitud de cada evento en las filas
+        usadas
+    iterations: array (n,) con las iteraciones de EM de cada evento
+    rows: array (n,) con la cantidad de filas usadas para cada evento
+"""
+
+
+def read_csv(path, chunk_size=100000, encoding='utf-8'):
+    """
+    Lee un archivo CSV de casos por bloques.
+
+    La primera fila tiene los nombres de los eventos. Las celdas pueden ser
+    0/1, true/false o vacías (valor faltante).
+
+    Returns:
+        iterador de diccionarios nombre -> array float con NaN en los
+        valores faltantes, de a lo sumo chunk_size filas
+    """
+    with io.open(path, 'r', encoding=encoding, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        rows = []
+        for row in reader:
+            rows.append([CSV_VALUES[x.strip().lower()] for x in row])
+            if len(rows) == chunk_size:
+                yield dict(zip(header, np.array(rows).T))
+                rows = []
+        if rows:
+            yield dict(zip(header, np.array(rows).T))
+
+
+def as_matrix(net, chunk):
+    """
+    Convierte un bloque de casos en una matriz (filas, n) ordenada por id.
+
+    Args:
+        chunk: array (filas, n) con las columnas ordenadas por id, o un
+            objeto indexable por nombre de evento (diccionario de columnas,
+            pandas.DataFrame, etc.). Los eventos que no están en el bloque
+            quedan como faltantes.
+    """
+    if hasattr(chunk, 'keys'):
+        names = set(chunk.keys())
+        columns = dict([(i, np.asarray(chunk[name], dtype=np.float64))
+                        for i, name in enumerate(net.names) if name in names])
+        rows = len(next(iter(columns.values()))) if columns else 0
+        ret = np.full((rows, len(net)), np.nan)
+        for i, column in columns.items():
+            ret[:, i] = column
+        return ret
+    ret = np.asarray(chunk, dtype=np.float64)
+    if ret.ndim != 2 or ret.shape[1] != len(net):
+        raise ValueError('Se esperan {} columnas'.format(len(net)))
+    return ret
+
+
+def _merge(stats):
+    "Suma estadísticos (keys, counts) de un mismo evento."
+    keys = np.concatenate([k for k, _ in stats])
+    counts = np.concatenate([c for _, c in stats])
+    keys, inverse = np.unique(keys, return_inverse=True)
+    return keys, np.bincount(inverse, weights=counts).astype(np.int64)
+
+
+def _chunk_stats(args):
+    """
+    Estadísticos suficientes de un bloque.
+
+    Returns:
+        lista con (keys, counts) por evento, donde keys codifica la
+        configuración de las dependencias y el valor del evento como
+        2 * máscara + x, y counts la cantidad de filas con cada key
+    """
+    indptr, indices, data = args
+    observed = ~np.isnan(data)
+    values = data > 0.5
+    ret = []
+    for i in range(len(indptr) - 1):
+        cols = np.append(indices[indptr[i]:indptr[i + 1]], i)
+        rows = observed[:, cols].all(axis=1)
+        bits = values[rows][:, cols].astype(np.int64)
+        keys = bits[:, :-1].dot(np.int64(1) << np.arange(len(cols) - 1,
+                                                         dtype=np.int64))
+        keys = 2 * keys + bits[:, -1]
+        ret.append(np.unique(keys, return_counts=True))
+    return ret
+
+
+def statistics(net, chunks, processes=None):
+    """
+    Estadísticos suficientes de todos los casos.
+
+    Args:
+        net: ib_network.Network
+        chunks: iterable de bloques de casos (ver as_matrix)
+        processes: cantidad de procesos. None o 1 procesa en el proceso
+            actual.
+
+    Returns:
+        lista con (keys, counts) por evento (ver _chunk_stats)
+    """
+    if len(net.indices) and np.diff(net.indptr).max() > 62:
+        raise ValueError('Demasiadas dependencias para codificar en bits')
+    workers = processes or 1
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+    ret = [empty] * len(net)
+    try:
+        chunks = iter(chunks)
+        while True:
+            # Se leen pocos bloques por vez para acotar la memoria
+            jobs = [(net.indptr, net.indices, as_matrix(net, chunk))
+                    for _, chunk in zip(range(2 * workers), chunks)]
+            if not jobs:
+                break
+            results = (pool.map(_chunk_stats, jobs) if pool else
+                       [_chunk_stats(job) for job in jobs])
+            ret = [_merge([acc] + [r[i] for r in results])
+                   for i, acc in enumerate(ret)]
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return ret
+
+
+def _em(keys, counts, k, params, tol, max_iter):
+    """
+    EM para un evento con k dependencias.
+
+    Args:
+        keys, counts: estadísticos del evento
+        params: array (k + 1,) con gamma y los alpha iniciales
+
+    Returns:
+        (parámetros, log-verosimilitud, iteraciones)
+    """
+    masks = keys >> 1
+    pos = np.where(keys & 1 == 1, counts, 0).astype(np.float64)
+    total = counts.astype(np.float64)
+    present = (masks[:, None] >> np.arange(k)) & 1 == 1
+    rows = np.concatenate([[total.sum()], present.T.dot(total)])
+    q = np.clip(params, EPSILON, 1 - EPSILON)
+
+    def neg_probs(q):
+        return (1 - q[0]) * np.where(present, 1 - q[1:], 1.0).prod(axis=1)
+
+    iterations = 0
+    while iterations < max_iter:
+        iterations += 1
+        p_pos = np.maximum(1 - neg_probs(q), np.finfo(float).tiny)
+        ratio = pos / p_pos
+        expected = q * np.concatenate([[ratio.sum()], present.T.dot(ratio)])
+        new = np.where(rows > 0, expected / np.maximum(rows, 1), q)
+        delta = np.abs(new - q).max()
+        q = new
+        if delta < tol:
+            break
+    neg = neg_probs(q)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        loglik = (np.where(pos > 0, pos * np.log(1 - neg), 0).sum() +
+                  np.where(total > pos, (total - pos) * np.log(neg), 0).sum())
+    return q, float(loglik), iterations
+
+
+def fit_statistics(net, stats, tol=1e-6, max_iter=1000):
+    """
+    Estima los parámetros a partir de estadísticos ya calculados.
+
+    EM parte de los parámetros de net; los parámetros sin datos (eventos
+    sin filas observadas o dependencias nunca presentes) conservan su valor.
+
+    Returns:
+        Fit
+    """
+    n = len(net)
+    gamma = np.asarray(net.gamma, dtype=np.float64).copy()
+    alpha = np.asarray(net.alpha, dtype=np.float64).copy()
+    loglik = np.zeros(n)
+    iterations = np.zeros(n, dtype=np.int64)
+    rows = np.zeros(n, dtype=np.int64)
+    for i, (keys, counts) in enumerate(stats):
+        a, b = net.indptr[i], net.indptr[i + 1]
+        rows[i] = counts.sum()
+        if not rows[i]:
+            continue
+        params = np.concatenate([[gamma[i]], alpha[a:b]])
+        q, loglik[i], iterations[i] = _em(keys, counts, b - a, params, tol,
+                                          max_iter)
+        gamma[i] = q[0]
+        alpha[a:b] = q[1:]
+    return Fit(gamma, alpha, loglik, iterations, rows)
+
+
+def fit(net, chunks, processes=None, tol=1e-6, max_iter=1000):
+    """
+    Estima por máxima verosimilitud los parámetros noisy-or de la red.
+
+    Args:
+        net: ib_network.Network con la estructura (y los parámetros
+            iniciales de EM)
+        chunks: iterable de bloques de casos (ver as_matrix y read_csv)
+        processes: procesos con los que se calculan los estadísticos
+        tol: EM termina cuando ningún parámetro cambia más que tol
+        max_iter: cantidad máxima de iteraciones de EM por evento
+
+    Returns:
+        Fit
+    """
+    return fit_statistics(net, statistics(net, chunks, processes), tol,
+                          max_iter)
+
+
+def update_events(net, result):
+    """
+    Copia los parámetros estimados a los BinaryEvents de la red.
+
+    Los eventos invalidan sus memorias al cambiar sus parámetros.
+    """
+    for i, ev in enumerate(net.events):
+        ev.gamma = Decimal(repr(float(result.gamma[i])))
+        for k in range(net.indptr[i], net.indptr[i + 1]):
+            ev.deps[net.events[net.indices[k]]] = Decimal(
+                repr(float(result.alpha[k])))
@@ -0,0 +1,91 @@
+#-*- coding: utf-8 -*-
+import io
+import numpy as np
+import pytest
+import ib_learning
+import ib_network
+import ib_sampling
+import ejercicio
+
+# Tests de la estimación de parámetros
+
+
+def _cases(net, size, seed=0):
+    "Casos muestreados de la red, como array float (size, n)."
+    rng = np.random.default_rng(seed)
+    states, _ = ib_sampling.sample(ib_sampling._arrays(net), size, rng)
+    return states.astype(np.float64)
+
+
+@pytest.fixture
+def net():
+    return ib_network.Network([ejercicio.Sintomas])
+
+
+def test_recovers_parameters(net):
+    "Con muchos casos se recuperan los parámetros de la red."
+    data = _cases(net, 200000)
+    start = net.with_parameters(np.full(len(net), 0.5),
+                                np.full(len(net.indices), 0.5))
+    result = ib_learning.fit(start, np.array_split(data, 7))
+    assert np.all(result.rows == len(data))
+    assert result.gamma == pytest.approx(net.gamma, abs=0.01)
+    # TB es poco frecuente: sus influencias se estiman con pocas filas
+    assert result.alpha == pytest.approx(net.alpha, abs=0.05)
+
+    # Los estadísticos no dependen de cómo se dividen los casos
+    whole = ib_learning.fit(start, [data])
+    assert whole.gamma == pytest.approx(result.gamma)
+    assert whole.alpha == pytest.approx(result.alpha)
+
+    # La estimación maximiza la verosimilitud
+    true = ib_learning.fit_statistics(net, ib_learning.statistics(net, [data]),
+                                      max_iter=0)
+    assert result.loglik.sum() >= true.loglik.sum()
+
+
+def test_missing_values(net, tmp_path):
+    "Las filas con valores faltantes se ignoran sólo para los eventos afectados."
+    data = _cases(net, 1000)
+    tos = net.id_of(ejercicio.Tos)
+    data[:100, tos] = np.nan
+    path = str(tmp_path / 'casos.csv')
+    with io.open(path, 'w', encoding='utf-8') as f:
+        f.write(','.join(net.names) + '\n')
+        for row in data:
+            f.write(','.join('' if np.isnan(x) else str(int(x))
+                             for x in row) + '\n')
+
+    chunks = list(ib_learning.read_csv(path, chunk_size=300))
+    assert [len(c[net.names[0]]) for c in chunks] == [300, 300, 300, 100]
+    result = ib_learning.fit(net, chunks)
+    expected = np.full(len(net), 1000)
+    expected[tos] = 900
+    for i in range(len(net)):
+        if tos in net.parents(i):
+            expected[i] = 900
+    assert list(result.rows) == list(expected)
+    direct = ib_learning.fit(net, [data])
+    assert result.gamma == pytest.approx(direct.gamma)
+
+
+def test_update_events():
+    "Los parámetros estimados se copian a los BinaryEvents."
+    net = ib_network.Network(ib_network.Network([ejercicio.Sintomas])
+                             .to_events())
+    result = ib_learning.fit(net, [_cases(net, 20000)])
+    ib_learning.update_events(net, result)
+    for i, ev in enumerate(net.events):
+        assert float(ev.gamma) == pytest.approx(result.gamma[i])
+        for k in range(net.indptr[i], net.indptr[i + 1]):
+            parent = net.events[net.indices[k]]
+            assert float(ev.deps[parent]) == pytest.approx(result.alpha[k])
+
+
+def test_processes(net):
+    "Los estadísticos calculados en un pool coinciden con los secuenciales."
+    chunks = np.array_split(_cases(net, 5000), 5)
+    stats = ib_learning.statistics(net, chunks)
+    parallel = ib_learning.statistics(net, chunks, processes=2)
+    for (k1, c1), (k2, c2) in zip(stats, parallel):
+        assert list(k1) == list(k2) and list(c1) == list(c2)
@@ -0,0 +1,181 @@
+#-*- coding: utf-8 -*-
+"""
+Explicaciones más probables (MPE/MAP) por eliminación max-producto.
+
+Dada la evidencia, busca las asignaciones de un conjunto de eventos (por
+defecto todos los no observados: MPE) de mayor probabilidad conjunta con la
+evidencia. Si no se maximiza sobre todos los eventos (MAP, por ejemplo sólo
+sobre las enfermedades), el resto se suma.
+
+Se usan los mismos factores que ib_elimination:
+
+    1. Se suman, con eliminación de variables, los eventos que no se
+       maximizan y las variables auxiliares de las cadenas noisy-or.
+    2. Se eliminan los eventos maximizados reemplazando la suma por el
+       máximo (max-producto), en espacio logarítmico para no tener
+       underflow. Para cada variable eliminada se guarda su mejor valor en
+       función de las variables restantes.
+    3. Se reconstruye la asignación recorriendo esas tablas en el orden
+       inverso (traceback).
+
+El costo es exponencial en el ancho del orden de eliminación y no en la
+cantidad de eventos. Las k mejores explicaciones se obtienen con el método
+de Lawler-Murty: el resto del espacio de asignaciones se particiona en
+subproblemas que fijan un prefijo de la mejor asignación y niegan la
+variable siguiente. Como los eventos son binarios, negar una variable es
+observar el valor opuesto, por lo que cada subproblema es la misma
+eliminación max-producto con más evidencia sobre los factores del paso 1,
+que se calculan una sola vez.
+"""
+from __future__ import print_function, division, unicode_literals
+import collections
+import heapq
+import math
+
+import numpy as np
+
+import ib_elimination
+
+Explanation = collections.namedtuple('Explanation',
+                                     ['assignment', 'prob', 'log_joint'])
+Explanation.__doc__ = """
+Una explicación de la evidencia.
+
+Atributos:
+    assignment: diccionario id -> bool con el valor de cada evento
+        maximizado
+    prob: P(assignment | evidencia)
+    log_joint: log P(assignment, evidencia)
+"""
+
+
+def _log_factors(net, maximize, evidence, heuristic):
+    """
+    Factores en logaritmo sobre los eventos de maximize, con el resto de las
+    variables ya sumadas.
+    """
+    relevant = ib_elimination.ancestors(net, list(maximize) + list(evidence))
+    factors = ib_elimination.reduce(
+        ib_elimination.network_factors(net, variables=relevant), evidence)
+    variables = set(v for f in factors for v in f.variables)
+    summed = variables - set(maximize)
+    factors = ib_elimination.eliminate(
+        factors, ib_elimination.elimination_order(factors, summed, heuristic),
+        rescale=True)
+    ret = []
+    with np.errstate(divide='ignore'):
+        for f in factors:
+            ret.append(ib_elimination.Factor(
+                f.variables, np.log(f.table) + f.log_scale))
+    return ret
+
+
+def _aligned(factor, variables):
+    "Tabla del factor con un eje por cada variable de variables."
+    axes = sorted(range(len(factor.variables)),
+                  key=lambda j: variables.index(factor.variables[j]))
+    shape = [2 if v in factor.variables else 1 for v in variables]
+    return np.transpose(factor.table, axes).reshape(shape)
+
+
+def max_eliminate(factors, order):
+    """
+    Maximiza las variables de order, en ese orden, de la suma de los
+    factores en logaritmo.
+
+    Returns:
+        (máximo, traceback): traceback es una lista de (variable, variables
+        restantes del factor, tabla con el mejor valor de la variable para
+        cada valor de las restantes)
+    """
+    factors = list(factors)
+    traceback = []
+    for v in order:
+        involved = [f for f in factors if v in f.variables]
+        if not involved:
+            continue
+        factors = [f for f in factors if v not in f.variables]
+        variables = []
+        for f in involved:
+            variables.extend([u for u in f.variables if u not in variables])
+        total = sum([_aligned(f, variables) for f in involved])
+        axis = variables.index(v)
+        rest = variables[:axis] + variables[axis + 1:]
+        traceback.append((v, rest, np.argmax(total, axis=axis)))
+        factors.append(ib_elimination.Factor(rest, total.max(axis=axis)))
+    return float(sum([f.table for f in factors], 0.0)), traceback
+
+
+def _best(factors, maximize, fixed, heuristic):
+    """
+    Mejor asignación de maximize con los valores de fixed.
+
+    Returns:
+        (log P(asignación, evidencia), asignación id -> bool)
+    """
+    factors = ib_elimination.reduce(factors, fixed)
+    free = [v for v in maximize if v not in fixed]
+    order = ib_elimination.elimination_order(factors, free, heuristic)
+    value, traceback = max_eliminate(factors, order)
+    assignment = dict(fixed)
+    for v in free:
+        assignment.setdefault(v, False)
+    for v, rest, best in reversed(traceback):
+        assignment[v] = bool(best[tuple(int(assignment[u]) for u in rest)])
+    return value, assignment
+
+
+def mpe(net, evidence={}, variables=None, k=1,
+        heuristic=ib_elimination.MIN_FILL):
+    """
+    Calcula las k explicaciones más probables de la evidencia.
+
+    Args:
+        net: ib_network.Network
+        evidence: diccionario evento -> bool
+        variables: eventos sobre los que se maximiza (BinaryEvent, nombre o
+            id); el resto se suma (MAP). Por defecto todos los no observados
+            (MPE).
+        k: cantidad de explicaciones
+        heuristic: orden de eliminación (ver ib_elimination)
+
+    Returns:
+        lista de a lo sumo k Explanation, de mayor a menor probabilidad.
+        Sólo se incluyen explicaciones de probabilidad positiva.
+    """
+    evidence = dict([(net.id_of(k), bool(v)) for k, v in evidence.items()])
+    if variables is None:
+        maximize = [i for i in range(len(net)) if i not in evidence]
+    else:
+        maximize = [i for i in net.event_ids(variables) if i not in evidence]
+    log_evidence = ib_elimination.log_evidence_prob(net, evidence, heuristic)
+    if log_evidence == -np.inf:
+        raise ZeroDivisionError('La evidencia tiene probabilidad 0')
+    factors = _log_factors(net, maximize, evidence, heuristic)
+
+    # Lawler-Murty: cada subproblema fija algunas variables de maximize
+    count = 0
+    value, assignment = _best(factors, maximize, {}, heuristic)
+    heap = [(-value, count, {}, assignment)]
+    ret = []
+    while heap and len(ret) < k:
+        value, _, fixed, assignment = heapq.heappop(heap)
+        if value == np.inf:
+            break
+        ret.append(Explanation(
+            dict([(v, assignment[v]) for v in maximize]),
+            math.exp(-value - log_evidence), -value))
+        prefix = dict(fixed)
+        for v in maximize:
+            if v in fixed:
+                continue
+            child = dict(prefix)
+            child[v] = not assignment[v]
+            child_value, child_assignment = _best(factors, maximize, child,
+                                                  heuristic)
+            if child_value > -np.inf:
+                count += 1
+                heapq.heappush(heap, (-child_value, count, child,
+                                      child_assignment))
+            prefix[v] = assignment[v]
+    return ret
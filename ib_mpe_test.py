@@ -0,0 +1,78 @@
+#-*- coding: utf-8 -*-
+import numpy as np
+import pytest
+import ib_elimination_test
+import ib_mpe
+import ib_network
+import ib_reference
+import ejercicio
+
+# Tests de las explicaciones más probables
+
+
+def brute_force(net, evidence, variables, k):
+    """
+    Las k mejores asignaciones de variables enumerando todos los estados.
+
+    Returns:
+        lista de (asignación, P(asignación, evidencia))
+    """
+    states = np.arange(2 ** len(net), dtype=np.int64)
+    probs = ib_reference.state_probs(ib_reference._arrays(net), states)
+    mask, value = ib_reference._bitmask(evidence)
+    match = (states & mask) == value
+    totals = {}
+    for state, p in zip(states[match], probs[match]):
+        key = tuple(bool(state >> i & 1) for i in variables)
+        totals[key] = totals.get(key, 0.0) + p
+    ranked = sorted(totals.items(), key=lambda kv: -kv[1])[:k]
+    return [(dict(zip(variables, key)), p) for key, p in ranked if p > 0]
+
+
+def _check(net, evidence, variables, k):
+    maximize = (list(range(len(net))) if variables is None else variables)
+    maximize = [i for i in maximize if i not in evidence]
+    expected = brute_force(net, evidence, maximize, k)
+    result = ib_mpe.mpe(net, evidence, variables, k)
+    assert len(result) == len(expected)
+    p_evidence = net.evidence_prob(evidence)
+    for x, (_, p) in zip(result, expected):
+        assert np.exp(x.log_joint) == pytest.approx(p)
+        assert x.prob == pytest.approx(p / p_evidence)
+        # Con empates el orden puede variar: se verifica la probabilidad
+        # de la asignación devuelta
+        full = dict(evidence)
+        full.update(x.assignment)
+        assert np.exp(x.log_joint) == pytest.approx(
+            brute_force(net, full, [], 1)[0][1])
+
+
+def test_ejercicio():
+    "MPE y MAP sobre las enfermedades dados los síntomas."
+    e = ejercicio
+    net = ib_network.Network([e.Sintomas])
+    sintomas = dict([(net.id_of(s), True) for s in (e.Tos, e.Fiebre,
+                                                     e.DifResp)])
+    _check(net, sintomas, None, 6)
+    diseases = [net.id_of(x) for x in (e.TB, e.Canc, e.Gripe)]
+    _check(net, sintomas, diseases, 8)
+
+    best = net.mpe(sintomas, [e.TB, e.Canc, e.Gripe])[0]
+    assert best.assignment == {'TB': False, 'Canc': True, 'Gripe': True}
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_random_networks(seed):
+    "Redes con eventos de muchos padres (cadenas auxiliares)."
+    net = ib_elimination_test.random_network(seed, 10)
+    evidence = {9: True, 4: False}
+    _check(net, evidence, None, 10)
+    _check(net, evidence, [0, 2, 5, 8], 5)
+    _check(net, {}, [1, 3], 4)
+
+
+def test_impossible_evidence():
+    e = ejercicio
+    net = ib_network.Network([e.Sintomas])
+    with pytest.raises(ZeroDivisionError):
+        net.mpe({e.Tos: True, e.TB: False, e.Canc: False, e.Gripe: False})
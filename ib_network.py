@@ -0,0 +1,696 @@
+#-*- coding: utf-8 -*-
+"""
+Representación compilada de una red de eventos binarios.
+
+Las clases de ib describen la red como un grafo de objetos que se referencian
+entre si mediante diccionarios. Eso es cómodo para construir modelos pero
+costoso para consultarlos: cada consulta recorre diccionarios y conjuntos de
+Python.
+
+Network compila un conjunto de BinaryEvents (y todos sus ancestros) en una
+forma compacta:
+
+    * Cada evento recibe un id entero según un orden topológico por niveles:
+      los eventos sin dependencias tienen nivel 0 y el resto un nivel más que
+      la mayor de sus dependencias. Los ids de un mismo nivel son
+      consecutivos.
+    * Las dependencias se guardan como una matriz rala en formato CSR: los
+      padres del evento i son indices[indptr[i]:indptr[i + 1]] y sus
+      influencias alpha[indptr[i]:indptr[i + 1]].
+    * Los gamma se guardan en un array indexado por id.
+    * Las configuraciones de las dependencias se codifican como máscaras de
+      bits.
+
+Las consultas tienen la misma semántica que BinaryEvent.prob_pos y
+JointProbability.prob_pos (en particular, asumen independientes a las
+dependencias de los eventos consultados). Los eventos de ib siguen siendo la
+forma de construir los modelos; Network es una foto de los parámetros al
+momento de compilar.
+"""
+from __future__ import print_function, division, unicode_literals
+import collections
+import io
+import json
+import os
+from decimal import Decimal
+
+import numpy as np
+
+import ib
+import ib_batch
+import ib_elimination
+import ib_mpe
+import ib_quickscore
+
+# Formato de Network.save
+FORMAT = 'ib-network'
+FORMAT_VERSION = 1
+MANIFEST = 'network.json'
+
+# Motores de Network.query
+AUTO = 'auto'
+ELIMINATION = 'elimination'
+QUICKSCORE = 'quickscore'
+
+# dtype de los arrays de parámetros para cada backend de ib_numeric
+DTYPES = {
+    'float': np.float64,
+    'decimal': object,
+}
+
+
+def _collect(events):
+    """
+    Devuelve los eventos dados y todos sus ancestros, sin repetir.
+
+    Los JointProbability se reemplazan por los eventos que los componen.
+    """
+    ret = []
+    seen = set()
+    pending = list(events)
+    while pending:
+        ev = pending.pop()
+        if isinstance(ev, ib.JointProbability):
+            pending.extend(ev.events)
+            continue
+        if ev in seen:
+            continue
+        seen.add(ev)
+        ret.append(ev)
+        pending.extend(ev.deps_keys)
+    return ret
+
+
+def _levels(events):
+    """
+    Nivel topológico de cada evento: 0 si no tiene dependencias y uno más que
+    el máximo nivel de sus dependencias si no.
+    """
+    levels = {}
+    for ev in events:
+        pending = [ev]
+        while pending:
+            x = pending[-1]
+            if x in levels:
+                pending.pop()
+                continue
+            missing = [k for k in x.deps_keys if k not in levels]
+            if missing:
+                pending.extend(missing)
+            else:
+                pending.pop()
+                levels[x] = 1 + max([levels[k] for k in x.deps_keys] + [-1])
+    return levels
+
+
+def segment_prod(values, indptr):
+    """
+    Producto de cada segmento values[..., indptr[i]:indptr[i + 1]].
+
+    Los segmentos vacíos tienen producto 1. values debe contener exactamente
+    los elementos de los segmentos, esto es values.shape[-1] == indptr[-1] -
+    indptr[0].
+    """
+    counts = np.diff(indptr)
+    out = np.ones(values.shape[:-1] + (len(counts),), dtype=values.dtype)
+    nonempty = np.nonzero(counts)[0]
+    if len(nonempty):
+        starts = indptr[:-1][nonempty] - indptr[0]
+        out[..., nonempty] = np.multiply.reduceat(values, starts, axis=-1)
+    return out
+
+
+def marginals(gamma, alpha, indptr, indices, level_ptr):
+    """
+    Calcula P(X = 1) para todos los eventos de una red compilada.
+
+    Se procesa un nivel topológico por vez: todos los eventos de un nivel se
+    calculan juntos a partir de los de niveles anteriores, como en
+    BinaryEvent._marginalize_factorized.
+
+    gamma y alpha pueden tener dimensiones adicionales al principio (por
+    ejemplo, una por cada juego de parámetros a evaluar); el resultado las
+    conserva.
+
+    Args:
+        gamma: array (..., n) con los gamma de cada evento
+        alpha: array (..., nnz) con las influencias en el orden de indices
+        indptr, indices: índice CSR de dependencias
+        level_ptr: los eventos del nivel l son level_ptr[l]:level_ptr[l + 1]
+
+    Returns:
+        array (..., n) con P(X = 1) de cada evento
+    """
+    gamma = np.asarray(gamma)
+    alpha = np.asarray(alpha)
+    shape = np.broadcast(gamma[..., :1], alpha[..., :1]).shape[:-1]
+    ret = np.empty(shape + gamma.shape[-1:], dtype=np.result_type(gamma,
+                                                                   alpha))
+    for lo, hi in zip(level_ptr[:-1], level_ptr[1:]):
+        a, b = indptr[lo], indptr[hi]
+        factors = 1 - alpha[..., a:b] * ret[..., indices[a:b]]
+        neg = (1 - gamma[..., lo:hi]) * segment_prod(factors,
+                                                     indptr[lo:hi + 1])
+        ret[..., lo:hi] = 1 - neg
+    return ret
+
+
+def _quickscore(net, target, evidence, engine):
+    "Define si la consulta se resuelve con Quickscore."
+    if engine == QUICKSCORE:
+        return ib_quickscore.applicable(net, target, evidence)
+    return ib_quickscore.preferred(net, target, evidence)
+
+
+class Network(object):
+    """
+    Red de eventos binarios compilada en arrays.
+
+    Atributos:
+        events: lista de BinaryEvent en orden topológico; el id de cada
+            evento es su posición en la lista. En una red cargada con load
+            se crean recién al usarlos (ver to_events)
+        index: diccionario BinaryEvent -> id
+        gamma: array (n,) con el gamma de cada evento
+        indptr, indices, alpha: dependencias en formato CSR. Los padres de i
+            son indices[indptr[i]:indptr[i + 1]], ordenados por id, y sus
+            influencias alpha[indptr[i]:indptr[i + 1]]
+        level_ptr: los ids del nivel topológico l son
+            level_ptr[l]:level_ptr[l + 1]
+        backend: 'float' (float64) o 'decimal' (arrays de decimal.Decimal)
+    """
+
+    def __init__(self, events, backend='float'):
+        """
+        Compila los eventos y todos sus ancestros.
+
+        Args:
+            events: iterable de BinaryEvent o JointProbability
+            backend: 'float' o 'decimal' (ver ib_numeric)
+        """
+        if backend not in DTYPES:
+            raise ValueError('Backend no soportado por Network: {}'
+                             .format(backend))
+        self.backend = backend
+        collected = _collect(events)
+        levels = _levels(collected)
+        order = dict([(ev, i) for i, ev in enumerate(collected)])
+        self._events = sorted(collected, key=lambda ev: (levels[ev],
+                                                         order[ev]))
+        self._index = dict([(ev, i) for i, ev in enumerate(self._events)])
+        self._names = [ev.name for ev in self._events]
+        self._name_index = None
+        self._source = None
+
+        n_levels = 1 + max([levels[ev] for ev in self._events] + [-1])
+        self.level_ptr = np.searchsorted(
+            [levels[ev] for ev in self._events], np.arange(n_levels + 1))
+
+        dtype = DTYPES[backend]
+        convert = Decimal if backend == 'decimal' else float
+        indptr = [0]
+        indices = []
+        alpha = []
+        for ev in self._events:
+            parents = sorted([(self._index[k], ev.deps[k])
+                              for k in ev.deps_keys])
+            indices.extend([k for k, _ in parents])
+            alpha.extend([convert(a) for _, a in parents])
+            indptr.append(len(indices))
+        self.indptr = np.array(indptr, dtype=np.int64)
+        self.indices = np.array(indices, dtype=np.int64)
+        self.alpha = np.array(alpha, dtype=dtype)
+        self.gamma = np.array([convert(ev.gamma) for ev in self._events],
+                              dtype=dtype)
+        self._marginals = None
+
+    def __len__(self):
+        return len(self.gamma)
+
+    def __contains__(self, ev):
+        return ev in self.index
+
+    def __repr__(self):
+        return 'Network({} eventos, {} dependencias)'.format(
+            len(self), len(self.indices))
+
+    @property
+    def events(self):
+        if self._events is None:
+            self._events = self.to_events()
+            self._index = dict([(ev, i) for i, ev in enumerate(self._events)])
+        return self._events
+
+    @property
+    def index(self):
+        if self._index is None:
+            self.events
+        return self._index
+
+    @property
+    def names(self):
+        "Nombre de cada evento, por id."
+        return list(self._names)
+
+    def id_of(self, ev):
+        """
+        Id de un evento.
+
+        Args:
+            ev: BinaryEvent de la red, su nombre o directamente su id
+        """
+        if isinstance(ev, ib.BinaryEvent):
+            return self.index[ev]
+        if isinstance(ev, (int, np.integer)):
+            if not 0 <= ev < len(self):
+                raise KeyError(ev)
+            return int(ev)
+        if self._name_index is None:
+            # Ante nombres repetidos vale el primero
+            self._name_index = {}
+            for i, name in enumerate(self._names):
+                self._name_index.setdefault(name, i)
+        return self._name_index[ev]
+
+    def event_ids(self, ev):
+        """
+        Ids de los eventos que componen ev (varios si es JointProbability).
+        """
+        if isinstance(ev, ib.JointProbability):
+            return [self.id_of(x) for x in ev.events]
+        if isinstance(ev, (list, tuple)):
+            return [self.id_of(x) for x in ev]
+        return [self.id_of(ev)]
+
+    def parents(self, i):
+        "Ids de las dependencias del evento con id i."
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def to_events(self):
+        """
+        Crea BinaryEvents equivalentes a la red, en orden de id.
+
+        Los eventos son nuevos: modificarlos no modifica la red.
+        """
+        convert = ((lambda x: Decimal(str(x))) if self.backend == 'float'
+                   else Decimal)
+        events = []
+        for i in range(len(self)):
+            a, b = self.indptr[i], self.indptr[i + 1]
+            deps = dict([(events[k], convert(x)) for k, x in
+                         zip(self.indices[a:b], self.alpha[a:b])])
+            events.append(ib.BinaryEvent(deps, gamma=convert(self.gamma[i]),
+                                         name=self._names[i]))
+        return events
+
+    def save(self, path):
+        """
+        Guarda la red en el directorio path.
+
+        El directorio contiene un manifiesto JSON (network.json) con los
+        nombres de los eventos y un archivo .npy por array (gamma, alpha,
+        indptr, indices, level_ptr y, con el backend 'float', las marginales
+        ya calculadas). Con el backend 'decimal' gamma y alpha se guardan
+        como texto para no perder precisión.
+        """
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        arrays = {'indptr': self.indptr, 'indices': self.indices,
+                  'level_ptr': self.level_ptr}
+        if self.backend == 'decimal':
+            arrays['gamma'] = np.array([str(x) for x in self.gamma],
+                                       dtype=np.str_)
+            arrays['alpha'] = np.array([str(x) for x in self.alpha],
+                                       dtype=np.str_)
+        else:
+            arrays['gamma'] = self.gamma
+            arrays['alpha'] = self.alpha
+            arrays['marginals'] = self.marginals()
+        for name, array in arrays.items():
+            np.save(os.path.join(path, name + '.npy'), array,
+                    allow_pickle=False)
+        manifest = {
+            'format': FORMAT,
+            'version': FORMAT_VERSION,
+            'backend': self.backend,
+            'events': len(self),
+            'dependencies': len(self.indices),
+            'names': self._names,
+            'arrays': sorted(arrays),
+        }
+        with io.open(os.path.join(path, MANIFEST), 'w',
+                     encoding='utf-8') as f:
+            f.write(json.dumps(manifest, indent=2, ensure_ascii=False))
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        """
+        Carga una red guardada con save.
+
+        No se crean BinaryEvents (ver to_events), por lo que cargar redes
+        grandes es inmediato.
+
+        Args:
+            path: directorio de la red
+            mmap_mode: None para leer los arrays en memoria o un modo de
+                numpy.load ('r', 'c') para mapearlos desde el archivo. Con
+                'r' los arrays son de sólo lectura y varios procesos
+                comparten la misma memoria; una red así se serializa (pickle)
+                como su ruta, sin copiar los arrays. Con el backend 'decimal'
+                sólo se mapean los arrays de índices (indptr, indices,
+                level_ptr): gamma y alpha se guardan como texto y se leen
+                en memoria para convertirlos a Decimal.
+        """
+        with io.open(os.path.join(path, MANIFEST), 'r',
+                     encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('format') != FORMAT:
+            raise ValueError('{} no es una red guardada'.format(path))
+        if manifest['version'] > FORMAT_VERSION:
+            raise ValueError('Versión de formato no soportada: {}'.format(
+                manifest['version']))
+        backend = manifest['backend']
+        text = ('gamma', 'alpha') if backend == 'decimal' else ()
+        arrays = dict([(name, np.load(os.path.join(path, name + '.npy'),
+                                      mmap_mode=(None if name in text
+                                                 else mmap_mode),
+                                      allow_pickle=False))
+                       for name in manifest['arrays']])
+        for name in text:
+            arrays[name] = np.array([Decimal(x) for x in arrays[name]],
+                                    dtype=object)
+
+        net = cls.__new__(cls)
+        net.backend = backend
+        net._events = None
+        net._index = None
+        net._names = manifest['names']
+        net._name_index = None
+        net._source = (os.path.abspath(path), mmap_mode)
+        for name in ('gamma', 'alpha', 'indptr', 'indices', 'level_ptr'):
+            setattr(net, name, arrays[name])
+        net._marginals = arrays.get('marginals')
+        return net
+
+    def __reduce_ex__(self, protocol):
+        if self._source is not None and self._source[1] == 'r':
+            return (Network.load, self._source)
+        return object.__reduce_ex__(self, protocol)
+
+    def with_parameters(self, gamma=None, alpha=None):
+        """
+        Red con la misma estructura y otros parámetros.
+
+        Los arrays de la estructura se comparten; los eventos de la nueva
+        red se crean recién al usarlos (ver to_events).
+
+        Args:
+            gamma: array (n,) o None para usar el de esta red
+            alpha: array alineado con indices o None para usar el de esta red
+        """
+        convert = ((lambda x: Decimal(str(x))) if self.backend == 'decimal'
+                   else float)
+        dtype = DTYPES[self.backend]
+        net = Network.__new__(Network)
+        net.__dict__.update(self.__dict__)
+        net._events = None
+        net._index = None
+        net._source = None
+        net._marginals = None
+        if gamma is not None:
+            net.gamma = np.array([convert(x) for x in gamma], dtype=dtype)
+        if alpha is not None:
+            net.alpha = np.array([convert(x) for x in alpha], dtype=dtype)
+        if len(net.gamma) != len(self) or len(net.alpha) != len(self.indices):
+            raise ValueError('Dimensiones de los parámetros incorrectas')
+        return net
+
+    def marginals(self):
+        """
+        Array con P(X = 1) de cada evento, por id. Ver ib_network.marginals.
+        """
+        if self._marginals is None:
+            self._marginals = marginals(self.gamma, self.alpha, self.indptr,
+                                        self.indices, self.level_ptr)
+        return self._marginals
+
+    def _influences(self, ids):
+        """
+        Matriz densa de influencias de los eventos ids sobre la unión de sus
+        dependencias.
+
+        Returns:
+            (parents, positions, rows, cols): parents es el array ordenado de
+            ids de las dependencias; la influencia alpha[..., positions[j]]
+            va en la fila rows[j] y columna cols[j] de la matriz.
+        """
+        positions = np.concatenate(
+            [np.arange(self.indptr[i], self.indptr[i + 1]) for i in ids] +
+            [np.zeros(0, dtype=np.int64)])
+        rows = np.concatenate(
+            [np.full(self.indptr[i + 1] - self.indptr[i], r, dtype=np.int64)
+             for r, i in enumerate(ids)] + [np.zeros(0, dtype=np.int64)])
+        parents, cols = np.unique(self.indices[positions],
+                                  return_inverse=True)
+        return parents, positions, rows, cols.reshape(-1)
+
+    def _masks(self, parents, deps_settings):
+        """
+        Máscaras de bits (pos, neg) con las dependencias fijadas en 1 y en 0.
+
+        El bit j corresponde a parents[j]. Las condiciones sobre eventos que
+        no están en parents se ignoran.
+        """
+        pos = neg = 0
+        column = dict([(int(k), j) for j, k in enumerate(parents)])
+        for ev, happens in deps_settings.items():
+            try:
+                j = column.get(self.id_of(ev))
+            except KeyError:
+                continue
+            if j is None:
+                continue
+            if happens:
+                pos |= 1 << j
+            else:
+                neg |= 1 << j
+        return pos, neg
+
+    def _pinned_probs(self, parents, pos, neg, marg):
+        "P(k = 1) de cada dependencia, fijando en 1 o 0 las condicionadas."
+        probs = marg[..., parents].copy()
+        for j in range(len(parents)):
+            if pos >> j & 1:
+                probs[..., j] = 1
+            elif neg >> j & 1:
+                probs[..., j] = 0
+        return probs
+
+    def joint_pos(self, ids, deps_settings={}, method=ib.FACTORIZED,
+                  gamma=None, alpha=None, marg=None):
+        """
+        Calcula P(X_1 = 1, ..., X_m = 1 | deps_settings) para los eventos ids.
+
+        Es la versión compilada de BinaryEvent.prob_pos (un solo id) y
+        JointProbability.prob_pos (varios ids). Con method=FACTORIZED se usa
+        inclusión-exclusión sobre los eventos (costo lineal en las
+        dependencias); con method=ENUMERATE se enumeran las configuraciones de
+        las dependencias como máscaras de bits.
+
+        gamma, alpha y marg permiten evaluar con otros parámetros (con
+        dimensiones adicionales al principio, ver marginals); por defecto se
+        usan los de la red.
+
+        Returns:
+            array (...) con la probabilidad (0-dimensional si no hay
+            dimensiones adicionales)
+        """
+        gamma = self.gamma if gamma is None else gamma
+        alpha = self.alpha if alpha is None else alpha
+        if marg is None:
+            marg = (self.marginals() if gamma is self.gamma and
+                    alpha is self.alpha else
+                    marginals(gamma, alpha, self.indptr, self.indices,
+                              self.level_ptr))
+        ids = list(ids)
+        parents, positions, rows, cols = self._influences(ids)
+        pos, neg = self._masks(parents, deps_settings)
+        probs = self._pinned_probs(parents, pos, neg, marg)
+
+        batch = np.broadcast(gamma[..., :1], alpha[..., :1],
+                             marg[..., :1]).shape[:-1]
+        infl = np.zeros(batch + (len(ids), len(parents)),
+                        dtype=np.result_type(alpha, marg))
+        infl[..., rows, cols] = alpha[..., positions]
+        keep = 1 - infl
+        leak = 1 - gamma[..., ids]
+
+        if method == ib.FACTORIZED:
+            # Doblando sobre los eventos se obtiene, para cada subconjunto S
+            # (máscara de bits), prod_{X en S} (1 - alpha_{X,k}) por
+            # dependencia k, prod_{X en S} (1 - gamma_X) y (-1)^|S|.
+            factors = np.ones(batch + (1, len(parents)), dtype=keep.dtype)
+            leaks = np.ones(batch + (1,), dtype=keep.dtype)
+            signs = np.ones(1, dtype=np.int64)
+            for r in range(len(ids)):
+                factors = np.concatenate(
+                    [factors, factors * keep[..., r:r + 1, :]], axis=-2)
+                leaks = np.concatenate(
+                    [leaks, leaks * leak[..., r:r + 1]], axis=-1)
+                signs = np.concatenate([signs, -signs])
+            p = probs[..., None, :]
+            terms = leaks * np.prod((1 - p) + p * factors, axis=-1)
+            return np.sum(signs * terms, axis=-1)
+        elif method == ib.ENUMERATE:
+            k = len(parents)
+            configs = np.arange(2 ** k, dtype=np.int64)
+            compatible = ((configs & pos) == pos) & ((configs & neg) == 0)
+            configs = configs[compatible]
+            bits = ((configs[:, None] >> np.arange(k)) & 1).astype(bool)
+            weights = np.prod(np.where(bits, probs[..., None, :],
+                                       1 - probs[..., None, :]), axis=-1)
+            negs = leak[..., None, :] * np.prod(
+                np.where(bits[:, None, :], keep[..., None, :, :], 1), axis=-1)
+            return np.sum(weights * np.prod(1 - negs, axis=-1), axis=-1)
+        raise ValueError('Método desconocido: {}'.format(method))
+
+    def prob_pos(self, ev, deps_settings={}, method=ib.FACTORIZED):
+        """
+        Equivalente compilado de ev.prob_pos(deps_settings).
+
+        Args:
+            ev: BinaryEvent o JointProbability cuyos eventos están en la red
+                (también se aceptan nombres, ids o listas de ellos)
+            deps_settings: diccionario evento -> bool con las condiciones
+                sobre las dependencias de ev
+            method: ib.FACTORIZED o ib.ENUMERATE
+        """
+        return float(self.joint_pos(self.event_ids(ev), deps_settings,
+                                    method))
+
+    def prob_neg(self, ev, deps_settings={}, method=ib.FACTORIZED):
+        "1 - prob_pos"
+        return 1 - self.prob_pos(ev, deps_settings, method)
+
+    def query(self, target, evidence={}, heuristic=ib_elimination.MIN_FILL,
+              engine=AUTO):
+        """
+        Probabilidad a posteriori exacta P(target = 1 | evidence).
+
+        A diferencia de prob_pos, la evidencia puede ser sobre cualquier
+        evento de la red y no se asume independencia entre dependencias.
+
+        Args:
+            target: evento consultado (ver event_ids)
+            evidence: diccionario evento -> bool
+            heuristic: orden de eliminación (ver ib_elimination)
+            engine: ELIMINATION (ver ib_elimination), QUICKSCORE (ver
+                ib_quickscore) o AUTO, que usa Quickscore cuando la consulta
+                es de una enfermedad dados pocos hallazgos positivos en una
+                red de dos capas y eliminación de variables si no.
+        """
+        targets = self.event_ids(target)
+        ids = dict([(self.id_of(k), v) for k, v in evidence.items()])
+        if engine in (AUTO, QUICKSCORE):
+            if (len(targets) == 1 and
+                    _quickscore(self, targets[0], ids, engine)):
+                return ib_quickscore.query(self, targets[0], ids)
+            if engine == QUICKSCORE:
+                raise ValueError('La consulta no es de una red de dos capas')
+        elif engine != ELIMINATION:
+            raise ValueError('Motor desconocido: {}'.format(engine))
+        return ib_elimination.query(self, targets, ids, heuristic)
+
+    def query_many(self, queries, heuristic=ib_elimination.MIN_FILL,
+                   engine=AUTO):
+        """
+        Resuelve varias consultas de query compartiendo cálculos.
+
+        Las consultas se agrupan por evidencia. Con engine=AUTO, los grupos
+        en los que todas las consultas admiten Quickscore se resuelven con
+        una única pasada de Quickscore; el resto con ib_elimination.query_many,
+        que reduce y elimina una sola vez las variables no consultadas.
+
+        Args:
+            queries: lista de pares (target, evidence) como los de query
+            heuristic, engine: ver query
+
+        Returns:
+            lista de probabilidades, en el orden de queries
+        """
+        if engine not in (AUTO, QUICKSCORE, ELIMINATION):
+            raise ValueError('Motor desconocido: {}'.format(engine))
+        converted = [(self.event_ids(target),
+                      dict([(self.id_of(k), bool(v))
+                            for k, v in evidence.items()]))
+                     for target, evidence in queries]
+        results = [None] * len(converted)
+        pending = []
+        if engine == ELIMINATION:
+            pending = list(range(len(converted)))
+        else:
+            groups = collections.OrderedDict()
+            for n, (_, evidence) in enumerate(converted):
+                groups.setdefault(frozenset(evidence.items()), []).append(n)
+            for key, group in groups.items():
+                evidence = dict(key)
+                targets = [converted[n][0] for n in group]
+                if all(len(t) == 1 and
+                       _quickscore(self, t[0], evidence, engine)
+                       for t in targets):
+                    den, num = ib_quickscore.quickscore(
+                        self, evidence, [t[0] for t in targets])
+                    if den <= 0:
+                        raise ZeroDivisionError(
+                            'La evidencia tiene probabilidad 0')
+                    for n, p in zip(group, num / den):
+                        results[n] = float(p)
+                elif engine == QUICKSCORE:
+                    raise ValueError(
+                        'La consulta no es de una red de dos capas')
+                else:
+                    pending.extend(group)
+        solved = ib_elimination.query_many(
+            self, [converted[n] for n in pending], heuristic)
+        for n, p in zip(pending, solved):
+            results[n] = p
+        return results
+
+    def evidence_prob(self, evidence, heuristic=ib_elimination.MIN_FILL):
+        "Probabilidad exacta de la evidencia. Ver ib_elimination."
+        return ib_elimination.evidence_prob(self, evidence, heuristic)
+
+    def log_query(self, target, evidence={},
+                  heuristic=ib_elimination.MIN_FILL):
+        """
+        log P(target = 1 | evidence) por eliminación de variables, sin
+        underflow con mucha evidencia. Ver ib_elimination.log_query.
+        """
+        return ib_elimination.log_query(self, target, evidence, heuristic)
+
+    def log_evidence_prob(self, evidence, heuristic=ib_elimination.MIN_FILL):
+        "log P(evidence). Ver ib_elimination.log_evidence_prob."
+        return ib_elimination.log_evidence_prob(self, evidence, heuristic)
+
+    def mpe(self, evidence={}, variables=None, k=1,
+            heuristic=ib_elimination.MIN_FILL):
+        """
+        Las k explicaciones más probables de la evidencia. Ver ib_mpe.mpe.
+
+        Returns:
+            lista de ib_mpe.Explanation, con las asignaciones indexadas por
+            nombre de evento
+        """
+        return [x._replace(assignment=dict([(self._names[i], v)
+                                            for i, v in x.assignment.items()]))
+                for x in ib_mpe.mpe(self, evidence, variables, k, heuristic)]
+
+    def query_batch(self, targets, findings, evidence, chunk_size=4096,
+                    processes=None, heuristic=ib_elimination.MIN_FILL):
+        """
+        P(target = 1 | evidencia) para cada fila de una matriz de evidencia
+        (pacientes, hallazgos) con NaN en los valores faltantes. Ver
+        ib_batch.posteriors.
+        """
+        return ib_batch.posteriors(self, targets, findings, evidence,
+                                   chunk_size, processes, heuristic)
@@ -0,0 +1,101 @@
+#-*- coding: utf-8 -*-
+import pickle
+import pytest
+import numpy as np
+import ib
+import ib_network
+import ejercicio
+from ib_test import Earthquake, Bulglar, Radio, Alarm, Phonecall
+
+# Tests de la red compilada
+
+
+def test_compile():
+    "Los ids respetan el orden topológico y el índice CSR las dependencias."
+    net = ib_network.Network([Phonecall, Radio])
+
+    assert len(net) == 5
+    assert set(net.events) == {Earthquake, Bulglar, Radio, Alarm, Phonecall}
+    for i, ev in enumerate(net.events):
+        parents = net.parents(i)
+        assert set(net.events[k] for k in parents) == set(ev.deps_keys)
+        assert all(k < i for k in parents)
+    assert net.gamma[net.id_of('Alarm')] == pytest.approx(0.001)
+    assert list(net.level_ptr) == [0, 2, 4, 5]
+
+
+@pytest.mark.parametrize('backend', ['float', 'decimal'])
+@pytest.mark.parametrize('method', [ib.FACTORIZED, ib.ENUMERATE])
+def test_network_matches_events(backend, method):
+    "Las consultas compiladas coinciden con las de BinaryEvent."
+    e = ejercicio
+    net = ib_network.Network([e.Sintomas, Phonecall, Radio], backend=backend)
+    queries = [
+        (Alarm, {}), (Alarm, {Bulglar: True}),
+        (Alarm, {Bulglar: False, Earthquake: True}),
+        (Phonecall, {Alarm: False}), (Radio, {}),
+        (e.Gripe, {}), (e.Tos, {}), (e.Tos, {e.TB: True, e.Gripe: False}),
+        (e.Sintomas, {}), (e.Sintomas, {e.TB: True}),
+        (e.Sintomas, {e.Canc: True}),
+    ]
+    for ev, settings in queries:
+        assert (net.prob_pos(ev, settings, method) ==
+                pytest.approx(ev.prob_pos(settings), rel=1e-12))
+
+
+def test_marginals_batch():
+    "marginals admite juegos de parámetros adicionales."
+    net = ib_network.Network([ejercicio.Sintomas])
+    gamma = np.stack([net.gamma, net.gamma * 0.5])
+    marg = ib_network.marginals(gamma, net.alpha, net.indptr, net.indices,
+                                net.level_ptr)
+    assert marg.shape == (2, len(net))
+    assert np.allclose(marg[0], net.marginals())
+    assert np.all(marg[1] < marg[0])
+
+
+@pytest.mark.parametrize('backend', ['float', 'decimal'])
+def test_save_load(tmpdir, backend):
+    net = ib_network.Network([ejercicio.Sintomas], backend=backend)
+    path = str(tmpdir.join('red'))
+    net.save(path)
+    loaded = ib_network.Network.load(path)
+    assert loaded.names == net.names
+    assert loaded.backend == backend
+    for name in ('gamma', 'alpha', 'indptr', 'indices', 'level_ptr'):
+        assert list(getattr(loaded, name)) == list(getattr(net, name))
+    assert loaded._events is None
+    sintomas = {'Tos': True, 'Fiebre': True, 'Dif. Resp': True}
+    assert loaded.query('TB', sintomas) == pytest.approx(
+        net.query(ejercicio.TB, sintomas))
+
+    # Los eventos se crean al usarlos
+    events = dict(zip(loaded.names, loaded.events))
+    assert loaded.id_of(events['Canc']) == net.id_of(ejercicio.Canc)
+    assert events['Tos'].prob_pos({events['TB']: True}) == pytest.approx(
+        ejercicio.Tos.prob_pos({ejercicio.TB: True}))
+
+
+def test_mmap(tmpdir):
+    net = ib_network.Network([ejercicio.Sintomas])
+    path = str(tmpdir.join('red'))
+    net.save(path)
+    loaded = ib_network.Network.load(path, mmap_mode='r')
+    assert isinstance(loaded.alpha, np.memmap)
+    assert not loaded.alpha.flags.writeable
+    assert list(loaded.marginals()) == list(net.marginals())
+
+    # Se serializa como la ruta, sin los arrays
+    data = pickle.dumps(loaded)
+    assert len(data) < 1000
+    again = pickle.loads(data)
+    assert isinstance(again.gamma, np.memmap)
+    assert again.prob_pos('Tos') == pytest.approx(ejercicio.Tos.prob_pos())
+
+    # Con Decimal sólo se mapean los índices
+    path = str(tmpdir.join('exacta'))
+    ib_network.Network([ejercicio.Sintomas], backend='decimal').save(path)
+    loaded = ib_network.Network.load(path, mmap_mode='r')
+    assert isinstance(loaded.indices, np.memmap)
+    assert not isinstance(loaded.gamma, np.memmap)
+    assert loaded.prob_pos('Tos') == pytest.approx(ejercicio.Tos.prob_pos())
@@ -0,0 +1,213 @@
+#-*- coding: utf-8 -*-
+"""
+Representaciones numéricas para los cálculos de probabilidad de ib.
+
+Cada backend define cómo se representa una probabilidad y cómo se opera con
+ella. Las clases de ib hacen todas sus cuentas a través de un backend, de modo
+que el mismo modelo puede evaluarse con:
+
+    * DECIMAL: decimal.Decimal, exacto hasta la precisión del contexto de
+      decimal (28 dígitos por defecto). Es el backend por defecto.
+    * FLOAT: float64. Los productos de noisy-or se calculan con arrays de
+      NumPy si está instalado.
+    * LOG: float64 en espacio logarítmico. Cada probabilidad p se representa
+      como log(p), lo que evita underflow en productos de muchos factores.
+
+Los backends de punto flotante no son exactos. Las tolerancias relativas
+esperadas respecto de DECIMAL en los modelos de ib_test.py están en
+TOLERANCE.
+"""
+from __future__ import print_function, division, unicode_literals
+import math
+from decimal import Decimal
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Tolerancia relativa respecto de DECIMAL de cada backend
+TOLERANCE = {
+    'decimal': 0,
+    'float': 1e-12,
+    'log': 1e-9,
+}
+
+
+class DecimalBackend(object):
+    """
+    Probabilidades representadas como decimal.Decimal.
+    """
+    name = 'decimal'
+    # Admite restas cuyo resultado intermedio es negativo
+    signed = True
+    one = Decimal('1')
+    zero = Decimal('0')
+
+    def convert(self, p):
+        "Convierte una probabilidad (Decimal, float o int) al backend."
+        return Decimal(p)
+
+    def parameters(self, gamma, alphas):
+        """
+        Prepara los parámetros de un evento para noisy_or_neg.
+
+        Args:
+            gamma: Decimal con la probabilidad independiente del evento
+            alphas: lista de Decimal con las influencias de sus dependencias
+        """
+        return gamma, list(alphas)
+
+    def to_float(self, x):
+        "Probabilidad representada por x como float."
+        return float(x)
+
+    def complement(self, x):
+        "Representación de 1 - p, siendo x la representación de p."
+        return self.one - x
+
+    def mul(self, a, b):
+        return a * b
+
+    def add(self, a, b):
+        return a + b
+
+    def sub(self, a, b):
+        return a - b
+
+    def sum(self, values):
+        return sum(values, self.zero)
+
+    def noisy_or_neg(self, gamma, alphas, probs):
+        """
+        Calcula (1 - gamma) * prod_i (1 - alpha_i * p_i).
+
+        Es la probabilidad de fracaso de un evento noisy-or cuyas
+        dependencias suceden, independientemente, con probabilidades p_i.
+
+        Args:
+            gamma, alphas: parámetros preparados con parameters
+            probs: representaciones de las probabilidades p_i, en el mismo
+                orden que alphas
+        """
+        ret = self.one - gamma
+        for alpha, p in zip(alphas, probs):
+            ret *= self.one - alpha * p
+        return ret
+
+
+class FloatBackend(DecimalBackend):
+    """
+    Probabilidades representadas como float64.
+    """
+    name = 'float'
+    one = 1.0
+    zero = 0.0
+
+    def convert(self, p):
+        return float(p)
+
+    def parameters(self, gamma, alphas):
+        alphas = [float(a) for a in alphas]
+        if np is not None:
+            alphas = np.array(alphas, dtype=np.float64)
+        return float(gamma), alphas
+
+    def to_float(self, x):
+        return float(x)
+
+    def sum(self, values):
+        return math.fsum(values)
+
+    def noisy_or_neg(self, gamma, alphas, probs):
+        if np is None:
+            return DecimalBackend.noisy_or_neg(self, gamma, alphas, probs)
+        probs = np.asarray(probs, dtype=np.float64)
+        return float((1.0 - gamma) * np.prod(1.0 - alphas * probs))
+
+
+class LogBackend(FloatBackend):
+    """
+    Probabilidades representadas por su logaritmo natural en float64.
+
+    No admite restas con resultado negativo (signed = False): los cálculos
+    que las requieren deben usar un método alternativo.
+    """
+    name = 'log'
+    signed = False
+    one = 0.0
+    zero = float('-inf')
+
+    def convert(self, p):
+        p = float(p)
+        return math.log(p) if p > 0 else self.zero
+
+    def to_float(self, x):
+        return math.exp(x)
+
+    def complement(self, x):
+        # log(1 - exp(x)) evitando cancelación cerca de 0 y de 1
+        if x == self.zero:
+            return self.one
+        if x > -math.log(2):
+            y = -math.expm1(x)
+            return math.log(y) if y > 0 else self.zero
+        return math.log1p(-math.exp(x))
+
+    def mul(self, a, b):
+        return a + b
+
+    def add(self, a, b):
+        hi, lo = max(a, b), min(a, b)
+        if hi == self.zero:
+            return self.zero
+        return hi + math.log1p(math.exp(lo - hi))
+
+    def sub(self, a, b):
+        raise ValueError('El backend log no admite restas')
+
+    def sum(self, values):
+        values = list(values)
+        if not values:
+            return self.zero
+        hi = max(values)
+        if hi == self.zero:
+            return self.zero
+        return hi + math.log(math.fsum([math.exp(v - hi) for v in values]))
+
+    def noisy_or_neg(self, gamma, alphas, probs):
+        if np is None:
+            ret = math.log1p(-gamma) if gamma < 1 else self.zero
+            for alpha, p in zip(alphas, probs):
+                q = 1.0 - alpha * math.exp(p)
+                ret += math.log(q) if q > 0 else self.zero
+            return ret
+        probs = np.asarray(probs, dtype=np.float64)
+        with np.errstate(divide='ignore'):
+            return float(np.log1p(-gamma) +
+                         np.sum(np.log1p(-alphas * np.exp(probs))))
+
+
+DECIMAL = DecimalBackend()
+FLOAT = FloatBackend()
+LOG = LogBackend()
+
+BACKENDS = dict([(b.name, b) for b in [DECIMAL, FLOAT, LOG]])
+
+
+def get_backend(backend):
+    """
+    Devuelve el backend pedido.
+
+    Args:
+        backend: None (DECIMAL), el nombre de un backend ('decimal', 'float',
+            'log') o un backend.
+    """
+    if backend is None:
+        return DECIMAL
+    if isinstance(backend, DecimalBackend):
+        return backend
+    try:
+        return BACKENDS[backend]
+    except KeyError:
+        raise ValueError('Backend desconocido: {}'.format(backend))
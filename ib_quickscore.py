@@ -0,0 +1,182 @@
+#-*- coding: utf-8 -*-
+"""
+Quickscore: probabilidades a posteriori de enfermedades dados hallazgos en
+redes noisy-or de dos capas.
+
+En una red enfermedad -> síntoma (como la de ejercicio.py o QMR-DT) la
+consulta típica es P(enfermedad | hallazgos positivos y negativos). Si las
+enfermedades son independientes a priori, los hallazgos negativos se absorben
+en forma cerrada:
+
+    P(f = 0 | enfermedades) = (1 - gamma_f) * prod_d (1 - alpha_{f,d})^d
+
+y sólo los positivos requieren inclusión-exclusión (Heckerman, 1989):
+
+    P(F+, F-) = sum_{S subconjunto de F+} (-1)^|S| *
+                prod_{f en S U F-} (1 - gamma_f) *
+                prod_d [(1 - P(d)) + P(d) * prod_{f en S U F-} (1 - alpha_{f,d})]
+
+Los subconjuntos S se recorren en orden de código Gray, de modo que cada paso
+agrega o quita un único hallazgo y actualiza los productos por enfermedad en
+tiempo lineal. El costo es exponencial sólo en la cantidad de hallazgos
+positivos.
+"""
+from __future__ import print_function, division, unicode_literals
+
+import numpy as np
+
+import ib_elimination
+
+# Cantidad máxima de hallazgos positivos para preferir Quickscore (ver
+# preferred)
+MAX_POSITIVE = 12
+
+
+def _parents(net, i):
+    return set(int(k) for k in net.parents(i))
+
+
+def applicable(net, target, evidence):
+    """
+    Define si Quickscore calcula exactamente P(target | evidence).
+
+    Se requiere que:
+        * target no sea evidencia
+        * ningún evento observado (hallazgo) sea ancestro de target ni de las
+          dependencias de los hallazgos (enfermedades)
+        * las enfermedades y target sean independientes a priori, esto es,
+          que no compartan ancestros
+
+    Args:
+        net: ib_network.Network
+        target: id del evento consultado
+        evidence: diccionario id -> bool
+    """
+    findings = set(evidence)
+    if target in findings:
+        return False
+    diseases = set([target])
+    for f in findings:
+        diseases |= _parents(net, f)
+    seen = set()
+    for d in diseases:
+        ancestors = ib_elimination.ancestors(net, [d])
+        if ancestors & seen or ancestors & findings:
+            return False
+        seen |= ancestors
+    return True
+
+
+def preferred(net, target, evidence):
+    """
+    Define si conviene usar Quickscore: además de ser aplicable, la cantidad
+    de hallazgos positivos no debe superar MAX_POSITIVE. La suma alternada de
+    inclusión-exclusión pierde precisión por cancelación cuando tiene muchos
+    términos; eliminación de variables no tiene ese problema.
+    """
+    positive = sum(1 for v in evidence.values() if v)
+    return positive <= MAX_POSITIVE and applicable(net, target, evidence)
+
+
+def _priors(net, diseases):
+    "P(d = 1) exacta de cada enfermedad."
+    marg = np.asarray(net.marginals(), dtype=np.float64)
+    ret = []
+    for d in diseases:
+        if net.indptr[d] == net.indptr[d + 1]:
+            ret.append(marg[d])
+        else:
+            ret.append(ib_elimination.query(net, d))
+    return np.array(ret, dtype=np.float64)
+
+
+def _exclusive_prod(values):
+    "Para cada i, el producto de todos los valores salvo values[i]."
+    prefix = np.concatenate([[1.0], np.cumprod(values[:-1])])
+    suffix = np.concatenate([np.cumprod(values[::-1][:-1])[::-1], [1.0]])
+    return prefix * suffix
+
+
+def quickscore(net, evidence, diseases):
+    """
+    Calcula P(evidence) y P(d = 1, evidence) para cada enfermedad d.
+
+    Args:
+        net: ib_network.Network
+        evidence: diccionario id -> bool con los hallazgos. Sus dependencias
+            deben ser independientes a priori (ver applicable).
+        diseases: ids de las enfermedades consultadas
+
+    Returns:
+        (P(evidence), array con P(d = 1, evidence) para cada d de diseases)
+    """
+    findings = sorted(evidence)
+    targets = list(diseases)
+    columns = sorted(set(targets).union(*[_parents(net, f)
+                                          for f in findings]))
+    position = dict([(d, j) for j, d in enumerate(columns)])
+    priors = _priors(net, columns)
+
+    # log(1 - alpha_{f,d}) y log(1 - gamma_f); los ceros se cuentan aparte
+    alpha = np.asarray(net.alpha, dtype=np.float64)
+    gamma = np.asarray(net.gamma, dtype=np.float64)
+    keep = np.ones((len(findings), len(columns)))
+    for r, f in enumerate(findings):
+        for j in range(net.indptr[f], net.indptr[f + 1]):
+            keep[r, position[int(net.indices[j])]] = 1 - alpha[j]
+    leak = 1 - gamma[findings]
+    with np.errstate(divide='ignore'):
+        log_keep = np.where(keep > 0, np.log(keep), 0)
+        log_leak = np.where(leak > 0, np.log(leak), 0)
+    zero_keep = (keep <= 0).astype(np.int64)
+    zero_leak = (leak <= 0).astype(np.int64)
+
+    negative = np.array([not evidence[f] for f in findings], dtype=bool)
+    positive = np.nonzero(~negative)[0]
+    log_prod = log_keep[negative].sum(axis=0)
+    zeros = zero_keep[negative].sum(axis=0)
+    log_l = log_leak[negative].sum()
+    zeros_l = zero_leak[negative].sum()
+
+    target_cols = [position[d] for d in targets]
+    den = 0.0
+    num = np.zeros(len(targets))
+    included = np.zeros(len(positive), dtype=bool)
+    sign = 1.0
+    for step in range(2 ** len(positive)):
+        if step:
+            # Código Gray: cambia el hallazgo del bit menos significativo
+            r = (step & -step).bit_length() - 1
+            flip = 1 if not included[r] else -1
+            included[r] = not included[r]
+            f = positive[r]
+            log_prod = log_prod + flip * log_keep[f]
+            zeros = zeros + flip * zero_keep[f]
+            log_l += flip * log_leak[f]
+            zeros_l += flip * zero_leak[f]
+            sign = -sign
+        if zeros_l:
+            continue
+        prod = np.where(zeros == 0, np.exp(log_prod), 0.0)
+        factors = (1 - priors) + priors * prod
+        weight = sign * np.exp(log_l)
+        den += weight * np.prod(factors)
+        others = _exclusive_prod(factors)
+        num += (weight * others[target_cols] * priors[target_cols] *
+                prod[target_cols])
+    return den, num
+
+
+def query(net, target, evidence):
+    """
+    Calcula P(target = 1 | evidence) con Quickscore.
+
+    Args:
+        net: ib_network.Network
+        target: id del evento consultado
+        evidence: diccionario id -> bool (ver applicable)
+    """
+    den, num = quickscore(net, evidence, [target])
+    if den <= 0:
+        raise ZeroDivisionError('La evidencia tiene probabilidad 0')
+    return float(num[0] / den)
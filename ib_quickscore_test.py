@@ -0,0 +1,80 @@
+#-*- coding: utf-8 -*-
+import random
+import pytest
+import ib
+import ib_network
+import ib_quickscore
+import ejercicio
+
+
+def two_layer_network(seed, n_diseases=8, n_findings=12):
+    "Red enfermedad -> hallazgo al azar, con un ancestro por enfermedad."
+    rnd = random.Random(seed)
+    causes = [ib.BinaryEvent(gamma=rnd.uniform(0.1, 0.5))
+              for _ in range(n_diseases // 2)]
+    diseases = [ib.BinaryEvent(gamma=rnd.uniform(0.01, 0.2))
+                for _ in range(n_diseases // 2)]
+    diseases += [ib.BinaryEvent({c: rnd.uniform(0.1, 0.9)},
+                                gamma=rnd.uniform(0.01, 0.2))
+                 for c in causes]
+    findings = []
+    for _ in range(n_findings):
+        parents = rnd.sample(diseases, rnd.randint(1, 4))
+        deps = dict([(d, rnd.choice([1, rnd.uniform(0.05, 0.95)]))
+                     for d in parents])
+        findings.append(ib.BinaryEvent(deps, gamma=rnd.uniform(0, 0.05)))
+    return ib_network.Network(findings + diseases), diseases, findings
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_matches_elimination(seed):
+    "Quickscore coincide con eliminación de variables."
+    net, diseases, findings = two_layer_network(seed)
+    rnd = random.Random(seed)
+    evidence = dict([(f, rnd.random() < 0.4) for f in findings])
+    for d in diseases:
+        ids = dict([(net.id_of(k), v) for k, v in evidence.items()])
+        assert ib_quickscore.applicable(net, net.id_of(d), ids)
+        assert (net.query(d, evidence, engine=ib_network.QUICKSCORE) ==
+                pytest.approx(net.query(d, evidence,
+                                        engine=ib_network.ELIMINATION)))
+
+
+def test_not_applicable():
+    "Si las enfermedades comparten ancestros se usa eliminación."
+    e = ejercicio
+    net = ib_network.Network([e.Sintomas])
+    sintomas = {e.Tos: True, e.Fiebre: True, e.DifResp: False}
+    ids = dict([(net.id_of(k), v) for k, v in sintomas.items()])
+
+    # Gripe y TB dependen de Hosp
+    assert not ib_quickscore.applicable(net, net.id_of(e.TB), ids)
+    assert not ib_quickscore.applicable(net, net.id_of(e.Tos),
+                                        {net.id_of(e.TB): True})
+    with pytest.raises(ValueError):
+        net.query(e.TB, sintomas, engine=ib_network.QUICKSCORE)
+    assert net.query(e.TB, sintomas) == net.query(
+        e.TB, sintomas, engine=ib_network.ELIMINATION)
+
+
+def test_query_many():
+    "Una única pasada de Quickscore resuelve todas las enfermedades."
+    net, diseases, findings = two_layer_network(0)
+    evidence = dict([(f, i % 3 == 0) for i, f in enumerate(findings)])
+    queries = [(d, evidence) for d in diseases]
+    assert (net.query_many(queries, engine=ib_network.QUICKSCORE) ==
+            pytest.approx(net.query_many(queries,
+                                         engine=ib_network.ELIMINATION)))
+
+
+def test_preferred():
+    "Con muchos hallazgos positivos AUTO usa eliminación de variables."
+    net, diseases, findings = two_layer_network(
+        0, n_findings=ib_quickscore.MAX_POSITIVE + 1)
+    evidence = dict([(f, True) for f in findings])
+    ids = dict([(net.id_of(f), True) for f in findings])
+    target = net.id_of(diseases[0])
+    assert ib_quickscore.applicable(net, target, ids)
+    assert not ib_quickscore.preferred(net, target, ids)
+    assert net.query(target, evidence) == \
+        net.query(target, evidence, engine=ib_network.ELIMINATION)
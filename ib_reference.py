@@ -0,0 +1,208 @@
+#-*- coding: utf-8 -*-
+"""
+Motor de referencia exacto por fuerza bruta.
+
+Enumera los 2^n estados conjuntos del modelo noisy-or subyacente a una red
+(el mismo que describe ejercicio.wppl) y suma sus probabilidades. No hace
+ninguna aproximación ni usa la estructura de la red, por lo que sirve para
+validar los demás motores sin necesidad de Node ni webppl.
+
+Los estados se representan como enteros cuyos bits son los valores de los
+eventos (el bit i es el evento de id i). Se procesan en bloques vectorizados
+con NumPy y los bloques pueden repartirse en un pool de procesos. Todas las
+consultas se responden en una única pasada: cada una se reduce a sumas de
+P(estado) sobre los estados que cumplen una máscara de bits.
+
+Ejecutado como script imprime en formato JSON las consultas de
+ejercicio.wppl, para compararlas con comp_py_wppl.py:
+
+    python ib_reference.py > ejercicio.ref.json
+"""
+from __future__ import print_function, division, unicode_literals
+import json
+import multiprocessing
+
+import numpy as np
+
+import ib_network
+
+# Cantidad máxima de eventos representables en los bits de un int64
+MAX_EVENTS = 62
+
+
+def _arrays(net):
+    "Arrays de la red que necesitan los procesos."
+    return (np.asarray(net.gamma, dtype=np.float64),
+            np.asarray(net.alpha, dtype=np.float64),
+            net.indptr, net.indices)
+
+
+def state_probs(arrays, states):
+    """
+    Probabilidad de cada estado conjunto.
+
+    Args:
+        arrays: (gamma, alpha, indptr, indices) de la red
+        states: array de enteros; el bit i es el valor del evento i
+
+    Returns:
+        array con P(estado) para cada elemento de states
+    """
+    gamma, alpha, indptr, indices = arrays
+    bits = (states[:, None] >> np.arange(len(gamma))) & 1 == 1
+    keep = np.where(bits[:, indices], 1 - alpha, 1.0)
+    neg = (1 - gamma) * ib_network.segment_prod(keep, indptr)
+    return np.where(bits, 1 - neg, neg).prod(axis=1)
+
+
+def _range_sums(args):
+    """
+    Suma P(estado) para los estados de [lo, hi) que cumplen cada máscara.
+
+    Returns:
+        array con una suma por máscara
+    """
+    arrays, masks, values, lo, hi, chunk_size = args
+    sums = np.zeros(len(masks))
+    for start in range(lo, hi, chunk_size):
+        states = np.arange(start, min(start + chunk_size, hi), dtype=np.int64)
+        probs = state_probs(arrays, states)
+        match = (states[:, None] & masks) == values
+        sums += probs.dot(match)
+    return sums
+
+
+def _bitmask(settings):
+    "Máscara y valores de bits de un diccionario id -> bool."
+    mask = value = 0
+    for i, v in settings.items():
+        mask |= 1 << i
+        if v:
+            value |= 1 << i
+    return mask, value
+
+
+class Reference(object):
+    """
+    Motor exacto que enumera todos los estados de una red.
+
+    Ej:
+        ref = Reference(ib_network.Network([Sintomas]))
+        ref.query(TB, {Tos: True, Fiebre: True, DifResp: True})
+    """
+
+    def __init__(self, net, processes=None, chunk_size=65536):
+        """
+        Args:
+            net: ib_network.Network
+            processes: cantidad de procesos. None o 1 enumera en el proceso
+                actual.
+            chunk_size: cantidad de estados por bloque vectorizado
+        """
+        if len(net) > MAX_EVENTS:
+            raise ValueError('La red tiene demasiados eventos: {}'.format(
+                len(net)))
+        self.net = net
+        self.processes = processes
+        self.chunk_size = chunk_size
+
+    def sums(self, settings):
+        """
+        Calcula P(settings) para cada elemento de settings.
+
+        Args:
+            settings: lista de diccionarios id -> bool
+
+        Returns:
+            array con la probabilidad de cada conjunto de valores
+        """
+        pairs = [_bitmask(s) for s in settings]
+        masks = np.array([m for m, _ in pairs], dtype=np.int64)
+        values = np.array([v for _, v in pairs], dtype=np.int64)
+        total = 2 ** len(self.net)
+        workers = self.processes or 1
+        step = -(-total // (workers * 4))
+        step = -(-step // self.chunk_size) * self.chunk_size
+        jobs = [(_arrays(self.net), masks, values, lo,
+                 min(lo + step, total), self.chunk_size)
+                for lo in range(0, total, step)]
+        if workers > 1 and len(jobs) > 1:
+            pool = multiprocessing.Pool(workers)
+            try:
+                results = pool.map(_range_sums, jobs)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [_range_sums(job) for job in jobs]
+        return np.sum(results, axis=0)
+
+    def query_many(self, queries):
+        """
+        Calcula P(target = 1 | evidence) para varias consultas en una única
+        enumeración.
+
+        Args:
+            queries: diccionario nombre -> (target, evidence), con target un
+                evento, una lista de eventos o un JointProbability y evidence
+                un diccionario evento -> bool
+
+        Returns:
+            diccionario nombre -> probabilidad
+        """
+        settings = []
+        impossible = []
+        for target, evidence in queries.values():
+            ev = dict([(self.net.id_of(k), bool(v))
+                       for k, v in evidence.items()])
+            targets = self.net.event_ids(target)
+            impossible.append(any(ev.get(i) is False for i in targets))
+            joint = dict(ev)
+            joint.update((i, True) for i in targets)
+            settings.extend([ev, joint])
+        sums = self.sums(settings)
+        ret = {}
+        for k, name in enumerate(queries):
+            den, num = sums[2 * k], sums[2 * k + 1]
+            ret[name] = 0.0 if impossible[k] else float(num / den)
+        return ret
+
+    def query(self, target, evidence={}):
+        "Calcula P(target = 1 | evidence)."
+        return self.query_many({None: (target, evidence)})[None]
+
+
+def ejercicio_queries():
+    "Las consultas de ejercicio.wppl, con los eventos de ejercicio.py."
+    import ejercicio as e
+    sintomas = [e.Tos, e.Fiebre, e.DifResp]
+    observed = dict([(s, True) for s in sintomas])
+    return e.Sintomas, {
+        'tos_prior': (e.Tos, {}),
+        'fiebre_prior': (e.Fiebre, {}),
+        'difResp_prior': (e.DifResp, {}),
+        'sintomas_prior': (sintomas, {}),
+
+        'tos_dado_tb': (e.Tos, {e.TB: True}),
+        'fiebre_dado_tb': (e.Fiebre, {e.TB: True}),
+        'difResp_dado_tb': (e.DifResp, {e.TB: True}),
+        'sintomas_dado_tb': (sintomas, {e.TB: True}),
+
+        'tb_dado_sintomas': (e.TB, observed),
+
+        'tos_dado_cancer': (e.Tos, {e.Canc: True}),
+        'fiebre_dado_cancer': (e.Fiebre, {e.Canc: True}),
+        'difResp_dado_cancer': (e.DifResp, {e.Canc: True}),
+        'sintomas_dado_cancer': (sintomas, {e.Canc: True}),
+
+        'cancer_dado_sintomas': (e.Canc, observed),
+
+        'tb_prior': (e.TB, {}),
+        'cancer_prior': (e.Canc, {}),
+    }
+
+
+if __name__ == '__main__':
+    root, queries = ejercicio_queries()
+    ref = Reference(ib_network.Network([root]))
+    print(json.dumps(ref.query_many(queries), indent=4, sort_keys=True))
@@ -0,0 +1,48 @@
+#-*- coding: utf-8 -*-
+import pytest
+import ib_elimination_test
+import ib_network
+import ib_reference
+import ejercicio
+
+e = ejercicio
+net = ib_network.Network([e.Sintomas])
+
+# Resultados de ejercicio.wppl (ver comp.txt)
+WPPL = {
+    'tb_dado_sintomas': 0.541296,
+    'cancer_dado_sintomas': 0.479073,
+    'sintomas_dado_tb': 0.097082,
+    'fiebre_dado_tb': 0.252943,
+    'tos_prior': 0.118580,
+    'sintomas_prior': 0.000915,
+}
+
+
+def test_matches_wppl():
+    root, queries = ib_reference.ejercicio_queries()
+    result = ib_reference.Reference(ib_network.Network([root])).query_many(
+        queries)
+    for name, value in WPPL.items():
+        assert result[name] == pytest.approx(value, abs=1e-6)
+
+
+def test_matches_elimination():
+    for seed in range(3):
+        other = ib_elimination_test.random_network(seed, 10)
+        ref = ib_reference.Reference(other, chunk_size=64)
+        evidence = {7: True, 9: False}
+        for target in (0, 3, 8):
+            assert ref.query(target, evidence) == pytest.approx(
+                other.query(target, evidence))
+        assert ref.query(9, evidence) == 0
+
+
+def test_processes():
+    "El resultado no depende de la cantidad de procesos."
+    sintomas = {e.Tos: True, e.Fiebre: True, e.DifResp: True}
+    single = ib_reference.Reference(net, chunk_size=16).query(e.TB, sintomas)
+    parallel = ib_reference.Reference(net, processes=2, chunk_size=16).query(
+        e.TB, sintomas)
+    assert parallel == pytest.approx(single)
+    assert single == pytest.approx(net.query(e.TB, sintomas))
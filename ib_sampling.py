@@ -0,0 +1,188 @@
+#-*- coding: utf-8 -*-
+"""
+Inferencia aproximada por muestreo sobre una red compilada.
+
+Cuando la inferencia exacta es demasiado costosa se puede estimar
+P(target = 1 | evidencia) muestreando la red:
+
+    * Muestreo hacia adelante: se muestrea cada evento, en orden topológico,
+      a partir de los valores ya muestreados de sus dependencias.
+    * Ponderación por verosimilitud (likelihood weighting): los eventos
+      observados no se muestrean sino que se fijan en su valor observado, y
+      cada muestra se pondera por la probabilidad de la evidencia dadas sus
+      dependencias.
+
+La estimación es el promedio ponderado (autonormalizado) de las muestras.
+Las muestras se generan en lotes vectorizados con NumPy, procesando juntos
+todos los eventos de un mismo nivel topológico. Cada lote usa su propio
+generador, derivado de la semilla con numpy.random.SeedSequence, de modo que
+el resultado no depende de cuántos procesos se usen. Los lotes pueden
+repartirse en un pool de procesos.
+"""
+from __future__ import print_function, division, unicode_literals
+import collections
+import math
+import multiprocessing
+
+import numpy as np
+
+import ib_network
+
+Estimate = collections.namedtuple('Estimate',
+                                  ['value', 'stderr', 'ess', 'samples'])
+Estimate.__doc__ = """
+Resultado de una estimación por muestreo.
+
+Atributos:
+    value: estimación de P(target = 1 | evidencia)
+    stderr: error estándar de la estimación (método delta)
+    ess: tamaño efectivo de muestra, (sum w)^2 / sum w^2
+    samples: cantidad de muestras generadas
+"""
+
+
+def _arrays(net):
+    "Arrays de la red que necesitan los procesos de muestreo."
+    return (np.asarray(net.gamma, dtype=np.float64),
+            np.asarray(net.alpha, dtype=np.float64),
+            net.indptr, net.indices, net.level_ptr)
+
+
+def sample(arrays, size, rng, evidence={}):
+    """
+    Muestrea la red ponderando por verosimilitud.
+
+    Sin evidencia es muestreo hacia adelante y todos los pesos son 1.
+
+    Args:
+        arrays: (gamma, alpha, indptr, indices, level_ptr) de la red
+        size: cantidad de muestras
+        rng: numpy.random.Generator
+        evidence: diccionario id -> bool
+
+    Returns:
+        (states, log_weights): states es un array bool (size, n) con el
+        valor de cada evento en cada muestra y log_weights el logaritmo del
+        peso de cada muestra
+    """
+    gamma, alpha, indptr, indices, level_ptr = arrays
+    states = np.zeros((size, len(gamma)), dtype=bool)
+    log_weights = np.zeros(size)
+    observed = np.zeros(len(gamma), dtype=bool)
+    values = np.zeros(len(gamma), dtype=bool)
+    for k, v in evidence.items():
+        observed[k] = True
+        values[k] = v
+    for lo, hi in zip(level_ptr[:-1], level_ptr[1:]):
+        a, b = indptr[lo], indptr[hi]
+        keep = np.where(states[:, indices[a:b]], 1 - alpha[a:b], 1.0)
+        p = 1 - (1 - gamma[lo:hi]) * ib_network.segment_prod(
+            keep, indptr[lo:hi + 1])
+        level = rng.random((size, hi - lo)) < p
+        obs = observed[lo:hi]
+        if obs.any():
+            level[:, obs] = values[lo:hi][obs]
+            likelihood = np.where(values[lo:hi][obs], p[:, obs],
+                                  1 - p[:, obs])
+            with np.errstate(divide='ignore'):
+                log_weights += np.log(likelihood).sum(axis=1)
+        states[:, lo:hi] = level
+    return states, log_weights
+
+
+def _batch_stats(args):
+    """
+    Estadísticos suficientes de un lote de muestras.
+
+    Los pesos se escalan por exp(-m), con m el máximo log-peso del lote, para
+    evitar underflow con mucha evidencia.
+
+    Returns:
+        (m, sum w, sum w f, sum w^2, sum w^2 f, cantidad de muestras) donde
+        f indica si sucedieron todos los targets
+    """
+    arrays, targets, evidence, size, seed = args
+    rng = np.random.default_rng(seed)
+    states, log_weights = sample(arrays, size, rng, evidence)
+    hit = states[:, targets].all(axis=1)
+    m = log_weights.max()
+    if m == -np.inf:
+        return (m, 0.0, 0.0, 0.0, 0.0, size)
+    w = np.exp(log_weights - m)
+    return (m, w.sum(), w[hit].sum(), (w ** 2).sum(), (w[hit] ** 2).sum(),
+            size)
+
+
+def _combine(stats):
+    "Combina los estadísticos de varios lotes en una estimación."
+    finite = [s for s in stats if s[0] != -np.inf]
+    samples = sum(s[5] for s in stats)
+    if not finite:
+        return Estimate(float('nan'), float('inf'), 0.0, samples)
+    m = max(s[0] for s in finite)
+    sw = swf = sw2 = sw2f = 0.0
+    for s in finite:
+        scale = math.exp(s[0] - m)
+        sw += scale * s[1]
+        swf += scale * s[2]
+        sw2 += scale ** 2 * s[3]
+        sw2f += scale ** 2 * s[4]
+    value = swf / sw
+    variance = (sw2f - 2 * value * sw2f + value ** 2 * sw2) / sw ** 2
+    return Estimate(value, math.sqrt(max(variance, 0.0)), sw ** 2 / sw2,
+                    samples)
+
+
+def estimate(net, target, evidence={}, precision=None, batch_size=10000,
+             max_samples=1000000, processes=None, seed=None):
+    """
+    Estima P(target = 1 | evidence) por ponderación por verosimilitud.
+
+    Los lotes se generan por rondas (una por proceso) hasta que el error
+    estándar es menor que precision o se alcanzan max_samples muestras.
+
+    Args:
+        net: ib_network.Network
+        target: evento consultado (ver Network.event_ids)
+        evidence: diccionario evento -> bool
+        precision: error estándar buscado. Si es None se generan
+            max_samples muestras.
+        batch_size: muestras por lote
+        max_samples: cantidad máxima de muestras
+        processes: cantidad de procesos. None o 1 muestrea en el proceso
+            actual.
+        seed: semilla (entero, None o numpy.random.SeedSequence)
+
+    Returns:
+        Estimate
+    """
+    targets = net.event_ids(target)
+    evidence = dict([(net.id_of(k), bool(v)) for k, v in evidence.items()])
+    arrays = _arrays(net)
+    seeds = (seed if isinstance(seed, np.random.SeedSequence) else
+             np.random.SeedSequence(seed))
+    workers = processes or 1
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    stats = []
+    try:
+        done = 0
+        while done < max_samples:
+            sizes = []
+            for _ in range(workers):
+                size = min(batch_size, max_samples - done)
+                if size <= 0:
+                    break
+                sizes.append(size)
+                done += size
+            jobs = [(arrays, targets, evidence, size, s)
+                    for size, s in zip(sizes, seeds.spawn(len(sizes)))]
+            stats.extend(pool.map(_batch_stats, jobs) if pool else
+                         [_batch_stats(job) for job in jobs])
+            ret = _combine(stats)
+            if precision is not None and ret.stderr <= precision:
+                break
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return _combine(stats)
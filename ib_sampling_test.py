@@ -0,0 +1,48 @@
+#-*- coding: utf-8 -*-
+import pytest
+import numpy as np
+import ib_network
+import ib_sampling
+import ejercicio
+
+e = ejercicio
+net = ib_network.Network([e.Sintomas])
+
+
+def test_forward_sampling():
+    "Sin evidencia las frecuencias aproximan las marginales."
+    ret = ib_sampling.estimate(net, e.Gripe, max_samples=40000, seed=0)
+    assert ret.ess == pytest.approx(40000)
+    assert ret.samples == 40000
+    assert abs(ret.value - net.query(e.Gripe)) < 4 * ret.stderr
+
+
+def test_likelihood_weighting():
+    "La estimación con evidencia aproxima la probabilidad exacta."
+    sintomas = {e.Tos: True, e.Fiebre: True, e.DifResp: False}
+    ret = ib_sampling.estimate(net, e.TB, sintomas, precision=0.01,
+                               batch_size=20000, seed=1)
+    assert ret.stderr <= 0.01
+    assert ret.samples < 1000000
+    assert ret.ess < ret.samples
+    assert abs(ret.value - net.query(e.TB, sintomas)) < 4 * ret.stderr
+
+
+def test_processes():
+    "El resultado no depende de la cantidad de procesos."
+    serial = ib_sampling.estimate(net, e.Canc, {e.Tos: True},
+                                  batch_size=1000, max_samples=4000, seed=2)
+    parallel = ib_sampling.estimate(net, e.Canc, {e.Tos: True},
+                                    batch_size=1000, max_samples=4000,
+                                    processes=2, seed=2)
+    assert serial == parallel
+
+
+def test_sample():
+    "La evidencia queda fijada en todas las muestras."
+    states, log_weights = ib_sampling.sample(
+        ib_sampling._arrays(net), 100, np.random.default_rng(0),
+        {net.id_of(e.Tos): True})
+    assert states.shape == (100, len(net))
+    assert states[:, net.id_of(e.Tos)].all()
+    assert (log_weights <= 0).all()
@@ -0,0 +1,401 @@
+#-*- coding: utf-8 -*-
+"""
+Servidor local de consultas sobre una red compilada.
+
+Carga una red una sola vez y responde consultas por HTTP/JSON. Las consultas
+que llegan juntas se agrupan en micro-lotes: el servidor espera a lo sumo
+batch_window segundos (o hasta juntar max_batch consultas) y las resuelve
+con una única llamada a Network.query_many, que comparte la eliminación de
+variables entre las consultas con la misma evidencia. Las consultas
+idénticas en curso se resuelven una sola vez, y los resultados se guardan en
+una memoria LRU indexada por consulta y evidencia.
+
+Requiere Python 3 (asyncio). Endpoints:
+
+    POST /query   {"target": "TB", "evidence": {"Tos": true}, "kind": "query"}
+                  -> {"result": 0.0123, "cached": false}
+                  target puede ser un nombre, un id o una lista de ellos;
+                  los valores de evidence son booleanos o 0/1;
+                  kind es "query" (P(target | evidencia) exacta, como
+                  Network.query) o "prob_pos" (semántica de
+                  BinaryEvent.prob_pos)
+    GET /metrics  latencias, throughput, lotes y aciertos de la memoria
+    GET /health   {"status": "ok"}
+
+Ej:
+    python ib_server.py red/ --port 8000
+
+donde red/ es un directorio creado con Network.save.
+"""
+from __future__ import print_function, division, unicode_literals
+import argparse
+import asyncio
+import collections
+import json
+import threading
+import timeit
+
+import numpy as np
+
+import ib_elimination
+import ib_network
+
+# Tipos de consulta
+QUERY = 'query'
+PROB_POS = 'prob_pos'
+
+_timer = timeit.default_timer
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+            405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+class RequestError(Exception):
+    "Consulta inválida (se responde con 400)."
+
+
+class QueryServer(object):
+    """
+    Servidor de consultas con micro-lotes y memoria LRU.
+
+    Las consultas también pueden hacerse sin HTTP, con la corrutina submit.
+    """
+
+    def __init__(self, net, batch_window=0.002, max_batch=256,
+                 cache_size=4096, heuristic=ib_elimination.MIN_FILL,
+                 latency_window=10000):
+        """
+        Args:
+            net: ib_network.Network
+            batch_window: segundos que se espera para juntar consultas
+            max_batch: cantidad máxima de consultas por lote
+            cache_size: cantidad de resultados en la memoria LRU
+            heuristic: orden de eliminación (ver ib_elimination)
+            latency_window: cantidad de latencias recientes con las que se
+                calculan los percentiles
+        """
+        self.net = net
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.cache_size = cache_size
+        self.heuristic = heuristic
+        self._cache = collections.OrderedDict()
+        self._inflight = {}
+        self._pending = []
+        self._wakeup = None
+        self._batcher = None
+        self._server = None
+        self._latencies = collections.deque(maxlen=latency_window)
+        self._counts = collections.Counter()
+        self._started = _timer()
+        self.port = None
+
+    # Consultas
+
+    def key(self, target, evidence={}, kind=QUERY):
+        """
+        Clave normalizada de una consulta.
+
+        Raises:
+            RequestError si falta target, algún evento no existe, algún
+            valor de la evidencia no es booleano (o 0/1) o kind es
+            desconocido
+        """
+        if kind not in (QUERY, PROB_POS):
+            raise RequestError('Tipo de consulta desconocido: {}'.format(kind))
+        if target is None:
+            raise RequestError('Falta target')
+        if not isinstance(evidence, dict):
+            raise RequestError('evidence debe ser un objeto')
+        for k, v in evidence.items():
+            if not (isinstance(v, (bool, np.bool_)) or
+                    (isinstance(v, (int, np.integer)) and v in (0, 1))):
+                raise RequestError('Valor inválido para {}: {!r}'.format(
+                    k, v))
+        try:
+            targets = tuple(self.net.event_ids(target))
+            settings = frozenset([(self.net.id_of(k), bool(v))
+                                  for k, v in evidence.items()])
+        except (KeyError, TypeError) as e:
+            raise RequestError('Evento desconocido: {}'.format(e.args[0]))
+        return (kind, targets, settings)
+
+    def _compute(self, keys):
+        """
+        Resuelve un lote de consultas. Se ejecuta fuera del loop de asyncio.
+
+        Returns:
+            lista con el resultado (o la excepción) de cada consulta
+        """
+        net = self.net
+        results = [None] * len(keys)
+        queries = [(n, k) for n, k in enumerate(keys) if k[0] == QUERY]
+        try:
+            values = net.query_many([(list(k[1]), dict(k[2]))
+                                     for _, k in queries], self.heuristic)
+        except Exception:
+            # Se aísla la consulta que falló
+            values = []
+            for _, k in queries:
+                try:
+                    values.append(net.query(list(k[1]), dict(k[2]),
+                                            self.heuristic))
+                except Exception as e:
+                    values.append(e)
+        for (n, _), v in zip(queries, values):
+            results[n] = v
+        for n, k in enumerate(keys):
+            if k[0] == PROB_POS:
+                try:
+                    results[n] = float(net.joint_pos(list(k[1]), dict(k[2])))
+                except Exception as e:
+                    results[n] = e
+        return results
+
+    async def submit(self, target, evidence={}, kind=QUERY):
+        """
+        Resuelve una consulta.
+
+        Returns:
+            (probabilidad, si vino de la memoria)
+        """
+        start = _timer()
+        self._counts['requests'] += 1
+        try:
+            key = self.key(target, evidence, kind)
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self._counts['cache_hits'] += 1
+                return self._cache[key], True
+            future = self._inflight.get(key)
+            if future is not None:
+                self._counts['coalesced'] += 1
+            else:
+                future = asyncio.get_event_loop().create_future()
+                self._inflight[key] = future
+                self._pending.append(key)
+                self._wakeup.set()
+            return await asyncio.shield(future), False
+        except Exception:
+            self._counts['errors'] += 1
+            raise
+        finally:
+            self._latencies.append(_timer() - start)
+
+    async def _run_batches(self):
+        "Tarea que junta las consultas pendientes y las resuelve en lotes."
+        loop = asyncio.get_event_loop()
+        while True:
+            await self._wakeup.wait()
+            if len(self._pending) < self.max_batch:
+                await asyncio.sleep(self.batch_window)
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            if not self._pending:
+                self._wakeup.clear()
+            try:
+                results = await loop.run_in_executor(None, self._compute,
+                                                     batch)
+            except Exception as e:
+                results = [e] * len(batch)
+            self._counts['batches'] += 1
+            self._counts['batched'] += len(batch)
+            for key, result in zip(batch, results):
+                future = self._inflight.pop(key)
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                    continue
+                future.set_result(result)
+                self._cache[key] = result
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+    def metrics(self):
+        "Métricas del servidor."
+        elapsed = _timer() - self._started
+        latencies = np.array(self._latencies) * 1e3
+        counts = self._counts
+        ret = {
+            'requests': counts['requests'],
+            'errors': counts['errors'],
+            'cache_hits': counts['cache_hits'],
+            'cache_size': len(self._cache),
+            'coalesced': counts['coalesced'],
+            'batches': counts['batches'],
+            'mean_batch_size': (counts['batched'] / counts['batches']
+                                if counts['batches'] else 0.0),
+            'uptime': elapsed,
+            'throughput': counts['requests'] / elapsed if elapsed else 0.0,
+        }
+        if len(latencies):
+            ret['latency_ms'] = {
+                'mean': float(latencies.mean()),
+                'p50': float(np.percentile(latencies, 50)),
+                'p90': float(np.percentile(latencies, 90)),
+                'p99': float(np.percentile(latencies, 99)),
+                'max': float(latencies.max()),
+            }
+        return ret
+
+    # HTTP
+
+    async def _route(self, method, path, body):
+        "Resuelve un pedido HTTP. Devuelve (status, objeto JSON)."
+        if path == '/health':
+            return 200, {'status': 'ok'}
+        if path == '/metrics':
+            return 200, self.metrics()
+        if path != '/query':
+            return 404, {'error': 'Ruta desconocida: {}'.format(path)}
+        if method != 'POST':
+            return 405, {'error': 'Se espera POST'}
+        try:
+            request = json.loads(body.decode('utf-8'))
+            if not isinstance(request, dict):
+                raise RequestError('La consulta debe ser un objeto')
+        except (ValueError, RequestError) as e:
+            # Se cuenta como las consultas inválidas que llegan a submit
+            self._counts['requests'] += 1
+            self._counts['errors'] += 1
+            return 400, {'error': str(e)}
+        try:
+            value, cached = await self.submit(request.get('target'),
+                                              request.get('evidence', {}),
+                                              request.get('kind', QUERY))
+        except (ValueError, RequestError, ZeroDivisionError) as e:
+            return 400, {'error': str(e)}
+        return 200, {'result': value, 'cached': cached}
+
+    async def _handle(self, reader, writer):
+        "Atiende una conexión (con keep-alive)."
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    method, path, version = line.decode('latin-1').split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                close = (headers.get('connection', '').lower() == 'close' or
+                         version == 'HTTP/1.0')
+                try:
+                    length = int(headers.get('content-length', 0))
+                    if length < 0:
+                        raise ValueError(length)
+                except ValueError:
+                    # Sin largo válido no se sabe dónde termina el cuerpo
+                    status, data = 400, {'error': 'Content-Length inválido'}
+                    close = True
+                else:
+                    body = await reader.readexactly(length)
+                    try:
+                        status, data = await self._route(method, path, body)
+                    except Exception as e:
+                        status, data = 500, {'error': repr(e)}
+                payload = json.dumps(data).encode('utf-8')
+                writer.write('HTTP/1.1 {} {}\r\nContent-Type: application/json'
+                             '\r\nContent-Length: {}\r\nConnection: {}\r\n\r\n'
+                             .format(status, _REASONS[status], len(payload),
+                                     'close' if close else 'keep-alive')
+                             .encode('latin-1') + payload)
+                await writer.drain()
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=0):
+        """
+        Empieza a escuchar en host:port (port=0 elige un puerto libre, que
+        queda en self.port).
+        """
+        self._wakeup = asyncio.Event()
+        self._batcher = asyncio.ensure_future(self._run_batches())
+        self._server = await asyncio.start_server(self._handle, host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._started = _timer()
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+        self._batcher.cancel()
+        try:
+            await self._batcher
+        except asyncio.CancelledError:
+            pass
+
+
+class ServerThread(object):
+    """
+    Ejecuta un QueryServer en un hilo propio, útil para tests y scripts
+    sincrónicos.
+
+    Ej:
+        with ServerThread(QueryServer(net)) as server:
+            urlopen(server.url + '/health')
+    """
+
+    def __init__(self, server, host='127.0.0.1', port=0):
+        self.server = server
+        self.host = host
+        self._port = port
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever)
+        self._thread.daemon = True
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(self.host, self.server.port)
+
+    def __enter__(self):
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(
+            self.server.start(self.host, self._port), self._loop).result()
+        return self
+
+    def __exit__(self, *exc):
+        asyncio.run_coroutine_threadsafe(self.server.close(),
+                                         self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        return False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Servidor de consultas')
+    parser.add_argument('network', help='directorio creado con Network.save')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--batch-window', type=float, default=0.002)
+    parser.add_argument('--max-batch', type=int, default=256)
+    parser.add_argument('--cache-size', type=int, default=4096)
+    args = parser.parse_args(argv)
+
+    net = ib_network.Network.load(args.network, mmap_mode='r')
+    server = QueryServer(net, args.batch_window, args.max_batch,
+                         args.cache_size)
+
+    async def run():
+        await server.start(args.host, args.port)
+        print('Escuchando en http://{}:{}'.format(args.host, server.port))
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+#-*- coding: utf-8 -*-
+import json
+import socket
+import threading
+import pytest
+import ib_network
+import ib_server
+import ejercicio
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+
+# Tests del servidor de consultas
+
+
+def _post(url, data):
+    request = Request(url + '/query', json.dumps(data).encode('utf-8'),
+                      {'Content-Type': 'application/json'})
+    try:
+        with urlopen(request, timeout=10) as f:
+            return f.status, json.loads(f.read().decode('utf-8'))
+    except HTTPError as e:
+        return e.code, json.loads(e.read().decode('utf-8'))
+
+
+def _get(url, path):
+    with urlopen(url + path, timeout=10) as f:
+        return json.loads(f.read().decode('utf-8'))
+
+
+@pytest.fixture
+def net():
+    return ib_network.Network([ejercicio.Sintomas])
+
+
+def test_query(net):
+    "Las respuestas coinciden con Network y se guardan en la memoria."
+    e = ejercicio
+    observed = {'Tos': True, 'Fiebre': True, 'Dif. Resp': True}
+    with ib_server.ServerThread(ib_server.QueryServer(net)) as server:
+        assert _get(server.url, '/health') == {'status': 'ok'}
+        status, data = _post(server.url, {'target': 'TB',
+                                          'evidence': observed})
+        assert status == 200 and not data['cached']
+        assert data['result'] == pytest.approx(net.query(e.TB, observed))
+        status, data = _post(server.url, {'target': 'TB',
+                                          'evidence': observed})
+        assert data['cached']
+
+        status, data = _post(server.url, {'target': ['Tos', 'Fiebre'],
+                                          'evidence': {'TB': True},
+                                          'kind': 'prob_pos'})
+        assert data['result'] == pytest.approx(
+            float(net.joint_pos([net.id_of(e.Tos), net.id_of(e.Fiebre)],
+                                {net.id_of(e.TB): True})))
+
+        assert _post(server.url, {'target': 'Nada'})[0] == 400
+        assert _post(server.url, {'target': 'TB', 'kind': 'otro'})[0] == 400
+        assert _post(server.url, {'evidence': {}})[0] == 400
+        assert _post(server.url, {'target': 'TB',
+                                  'evidence': {'Tos': 'no'}})[0] == 400
+        assert _post(server.url, {'target': 'TB',
+                                  'evidence': {'Tos': 2}})[0] == 400
+        status, data = _post(server.url, {'target': 'TB',
+                                          'evidence': {'Tos': 0}})
+        assert data['result'] == pytest.approx(net.query(e.TB, {e.Tos: False}))
+
+        metrics = _get(server.url, '/metrics')
+        assert metrics['requests'] == 9
+        assert metrics['errors'] == 5
+        assert metrics['cache_hits'] == 1
+        assert metrics['latency_ms']['p99'] >= metrics['latency_ms']['p50']
+
+
+def test_batching(net):
+    "Las consultas concurrentes se resuelven en pocos lotes."
+    names = net.names
+    queries = [{'target': names[i], 'evidence': {names[-1]: True}}
+               for i in range(len(names) - 1)] * 3
+    results = [None] * len(queries)
+    server = ib_server.QueryServer(net, batch_window=0.2)
+    with ib_server.ServerThread(server) as thread:
+        barrier = threading.Barrier(len(queries))
+
+        def run(n):
+            barrier.wait()
+            results[n] = _post(thread.url, queries[n])
+
+        threads = [threading.Thread(target=run, args=(n,))
+                   for n in range(len(queries))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        metrics = server.metrics()
+
+    for query, (status, data) in zip(queries, results):
+        assert status == 200
+        assert data['result'] == pytest.approx(
+            net.query(query['target'], query['evidence']))
+    assert metrics['batches'] < len(names) - 1
+    assert metrics['coalesced'] + metrics['cache_hits'] == \
+        len(queries) - (len(names) - 1)
+
+
+def test_bad_requests(net):
+    "Los pedidos mal formados se responden con 400."
+    with ib_server.ServerThread(ib_server.QueryServer(net)) as server:
+        assert _post(server.url, [1])[0] == 400
+        assert _post(server.url, 'TB')[0] == 400
+        metrics = _get(server.url, '/metrics')
+        assert metrics['requests'] == metrics['errors'] == 2
+
+        sock = socket.create_connection(('127.0.0.1', server.server.port),
+                                        timeout=10)
+        with sock:
+            sock.sendall(b'POST /query HTTP/1.1\r\nHost: localhost\r\n'
+                         b'Content-Length: abc\r\n\r\n{}')
+            response = sock.makefile('rb').read()
+        assert response.startswith(b'HTTP/1.1 400 ')
+        assert _get(server.url, '/health') == {'status': 'ok'}
@@ -0,0 +1,187 @@
+#-*- coding: utf-8 -*-
+"""
+Barridos de parámetros para análisis de sensibilidad.
+
+Evaluar "qué pasaría si el gamma de Fuma variara entre 0.1 y 0.5 y el alpha
+de Canc respecto de Fuma entre 0.02 y 0.1" reconstruyendo los BinaryEvents
+para cada punto es lento. Este módulo evalúa las consultas para todos los
+puntos a la vez: los parámetros de la red compilada se replican en una
+dimensión adicional (una fila por punto) y los cálculos de ib_network y
+ib_elimination operan sobre esa dimensión con broadcasting de NumPy.
+
+Ej:
+    net = ib_network.Network([Sintomas])
+    sweep(net,
+          [('tb', TB, {Tos: True}), ('canc', Canc, {Tos: True})],
+          gamma={Fuma: np.linspace(0.1, 0.5, 5)},
+          alpha={(Canc, Fuma): np.linspace(0.02, 0.1, 5)})
+
+devuelve un array estructurado de 25 filas con las columnas
+'gamma[Fuma]', 'alpha[Canc<-Fuma]', 'tb' y 'canc'.
+"""
+from __future__ import print_function, division, unicode_literals
+
+import numpy as np
+
+import ib_elimination
+import ib_network
+
+# Tipos de consulta
+QUERY = 'query'
+PROB_POS = 'prob_pos'
+
+
+def _label(net, i):
+    name = net.names[i]
+    return name if name is not None else str(i)
+
+
+def _alpha_position(net, child, parent):
+    "Posición en net.alpha de la influencia de parent sobre child."
+    c, p = net.id_of(child), net.id_of(parent)
+    for j in range(net.indptr[c], net.indptr[c + 1]):
+        if net.indices[j] == p:
+            return j
+    raise KeyError('{} no depende de {}'.format(_label(net, c),
+                                               _label(net, p)))
+
+
+def _swept(net, gamma, alpha, grid):
+    """
+    Parámetros barridos.
+
+    Returns:
+        (names, targets, values, size): nombre de cada parámetro, pares
+        ('gamma', id) o ('alpha', posición), sus valores y la cantidad de
+        puntos del barrido
+    """
+    names = []
+    targets = []
+    values = []
+    for ev, v in gamma.items():
+        i = net.id_of(ev)
+        names.append('gamma[{}]'.format(_label(net, i)))
+        targets.append(('gamma', i))
+        values.append(np.asarray(v, dtype=np.float64).ravel())
+    for (child, parent), v in alpha.items():
+        j = _alpha_position(net, child, parent)
+        names.append('alpha[{}<-{}]'.format(_label(net, net.id_of(child)),
+                                            _label(net, net.id_of(parent))))
+        targets.append(('alpha', j))
+        values.append(np.asarray(v, dtype=np.float64).ravel())
+
+    if grid:
+        size = int(np.prod([len(v) for v in values]))
+    else:
+        if len(set(len(v) for v in values)) > 1:
+            raise ValueError('Los valores deben tener el mismo largo')
+        size = len(values[0]) if values else 1
+    return names, targets, values, size
+
+
+def _points(net, targets, values, grid, lo, hi):
+    """
+    Valores barridos y arrays de parámetros de los puntos lo a hi - 1.
+
+    Sólo se construyen los puntos pedidos: con grid los valores de cada
+    punto se obtienen de su índice en la grilla.
+    """
+    if grid and values:
+        index = np.unravel_index(np.arange(lo, hi), [len(v) for v in values])
+        points = [v[k] for v, k in zip(values, index)]
+    else:
+        points = [v[lo:hi] for v in values]
+    gammas = np.tile(np.asarray(net.gamma, dtype=np.float64), (hi - lo, 1))
+    alphas = np.tile(np.asarray(net.alpha, dtype=np.float64), (hi - lo, 1))
+    for (kind, i), v in zip(targets, points):
+        (gammas if kind == 'gamma' else alphas)[:, i] = v
+    return points, gammas, alphas
+
+
+def parameter_grid(net, gamma={}, alpha={}, grid=True):
+    """
+    Arrays de parámetros de la red para cada punto del barrido.
+
+    Args:
+        net: ib_network.Network
+        gamma: diccionario evento -> valores de su gamma
+        alpha: diccionario (evento, dependencia) -> valores de la influencia
+        grid: si es True se evalúan todas las combinaciones de valores; si no,
+            todos los arrays deben tener el mismo largo y se evalúan
+            elemento a elemento
+
+    Returns:
+        (columns, gammas, alphas): columns es una lista de pares (nombre,
+        valores) con el valor de cada parámetro barrido en cada punto;
+        gammas y alphas son arrays (puntos, n) y (puntos, nnz)
+    """
+    names, targets, values, size = _swept(net, gamma, alpha, grid)
+    points, gammas, alphas = _points(net, targets, values, grid, 0, size)
+    return list(zip(names, points)), gammas, alphas
+
+
+def _evaluate(net, queries, gammas, alphas, kind, heuristic):
+    "Evalúa las consultas para un bloque de puntos."
+    ret = []
+    if kind == PROB_POS:
+        marg = ib_network.marginals(gammas, alphas, net.indptr, net.indices,
+                                    net.level_ptr)
+        for _, target, evidence in queries:
+            ret.append(net.joint_pos(net.event_ids(target), evidence,
+                                     gamma=gammas, alpha=alphas, marg=marg))
+    elif kind == QUERY:
+        for _, target, evidence in queries:
+            targets = net.event_ids(target)
+            ids = dict([(net.id_of(k), v) for k, v in evidence.items()])
+            table = ib_elimination.joint_table(net, targets, ids, heuristic,
+                                               gamma=gammas, alpha=alphas)
+            # Los puntos con evidencia imposible quedan en NaN
+            total = table.sum(axis=tuple(range(1, table.ndim)))
+            with np.errstate(invalid='ignore', divide='ignore'):
+                ret.append(np.where(total > 0, table[(Ellipsis,) +
+                                                     (1,) * len(targets)] /
+                                    total, np.nan))
+    else:
+        raise ValueError('Tipo de consulta desconocido: {}'.format(kind))
+    return ret
+
+
+def sweep(net, queries, gamma={}, alpha={}, grid=True, kind=QUERY,
+          heuristic=ib_elimination.MIN_FILL, chunk_size=65536):
+    """
+    Evalúa consultas para muchos valores de los parámetros a la vez.
+
+    Args:
+        net: ib_network.Network
+        queries: lista de tuplas (nombre, target, evidence)
+        gamma, alpha, grid: parámetros a barrer (ver parameter_grid)
+        kind: QUERY para probabilidades a posteriori exactas (como
+            Network.query) o PROB_POS para la semántica de
+            BinaryEvent.prob_pos (evidence condiciona sobre dependencias)
+        heuristic: orden de eliminación para QUERY
+        chunk_size: cantidad de puntos evaluados juntos, para acotar la
+            memoria: los parámetros de cada bloque se generan al evaluarlo
+
+    Returns:
+        array estructurado con una fila por punto, una columna por parámetro
+        barrido y una por consulta. Las consultas QUERY cuya evidencia tiene
+        probabilidad 0 en un punto valen NaN
+    """
+    names, targets, values, size = _swept(net, gamma, alpha, grid)
+    columns = names + [q[0] for q in queries]
+    ret = np.empty(size, dtype=[(str(name), np.float64) for name in columns])
+    for lo in range(0, size, chunk_size):
+        hi = min(lo + chunk_size, size)
+        points, gammas, alphas = _points(net, targets, values, grid, lo, hi)
+        results = _evaluate(net, queries, gammas, alphas, kind, heuristic)
+        for name, v in zip(columns, points + results):
+            ret[str(name)][lo:hi] = v
+    return ret
+
+
+def sweep_frame(*args, **kwargs):
+    """
+    Como sweep pero devuelve un pandas.DataFrame.
+    """
+    import pandas as pd
+    return pd.DataFrame.from_records(sweep(*args, **kwargs))
@@ -0,0 +1,92 @@
+#-*- coding: utf-8 -*-
+import pytest
+import numpy as np
+import ib
+import ib_network
+import ib_sweep
+import ejercicio
+
+
+def rebuild(fuma_gamma, canc_alpha):
+    "Reconstruye el modelo de ejercicio.py con otros parámetros."
+    Fuma = ib.BinaryEvent(gamma=fuma_gamma, name='Fuma')
+    Hosp = ib.BinaryEvent(gamma=0.01, name='Hosp')
+    TB = ib.BinaryEvent({Hosp: 0.01}, gamma=0.005, name='TB')
+    Canc = ib.BinaryEvent({Fuma: canc_alpha}, gamma=0.01, name='Canc')
+    Tos = ib.BinaryEvent({TB: 0.7, Canc: 0.3}, name='Tos')
+    return ib_network.Network([Tos]), Tos, Canc
+
+
+@pytest.mark.parametrize('kind', [ib_sweep.QUERY, ib_sweep.PROB_POS])
+def test_sweep_matches_rebuild(kind):
+    "El barrido coincide con reconstruir el modelo en cada punto."
+    net, Tos, Canc = rebuild(0.3, 0.05)
+    gammas = np.linspace(0.1, 0.5, 3)
+    alphas = np.linspace(0.02, 0.1, 4)
+    queries = [('tos', Tos, {}), ('tos_canc', Tos, {Canc: True}),
+               ('canc_tos', Canc, {Tos: True})]
+    if kind == ib_sweep.PROB_POS:
+        queries = queries[:2]
+    ret = ib_sweep.sweep(net, queries, gamma={'Fuma': gammas},
+                         alpha={(Canc, 'Fuma'): alphas}, kind=kind,
+                         chunk_size=5)
+
+    assert len(ret) == 12
+    assert ret.dtype.names[:2] == ('gamma[Fuma]', 'alpha[Canc<-Fuma]')
+    for row in ret:
+        other, o_tos, o_canc = rebuild(row['gamma[Fuma]'],
+                                       row['alpha[Canc<-Fuma]'])
+        same = {Tos: o_tos, Canc: o_canc}
+        for name, target, evidence in queries:
+            evidence = dict([(same[k], v) for k, v in evidence.items()])
+            if kind == ib_sweep.QUERY:
+                expected = other.query(same[target], evidence)
+            else:
+                expected = same[target].prob_pos(evidence)
+            assert row[name] == pytest.approx(expected)
+
+
+def test_sweep_zip():
+    "Sin grid los valores se toman elemento a elemento."
+    net = ib_network.Network([ejercicio.Sintomas])
+    ret = ib_sweep.sweep(net, [('tb', ejercicio.TB, {})],
+                         gamma={ejercicio.TB: [0.1, 0.2],
+                                ejercicio.Hosp: [0, 0]},
+                         grid=False)
+    assert list(ret['tb']) == pytest.approx([0.1, 0.2])
+    with pytest.raises(ValueError):
+        ib_sweep.sweep(net, [], gamma={ejercicio.TB: [0.1, 0.2],
+                                       ejercicio.Hosp: [0]}, grid=False)
+    with pytest.raises(KeyError):
+        ib_sweep.sweep(net, [], alpha={(ejercicio.TB, ejercicio.Fuma): [0]})
+
+
+def test_sweep_chunks():
+    "Los bloques generan sólo sus puntos y coinciden con parameter_grid."
+    net = ib_network.Network([ejercicio.Sintomas])
+    e = ejercicio
+    gamma = {e.Fuma: np.linspace(0.1, 0.5, 7), e.TB: [0.01, 0.02, 0.03]}
+    alpha = {(e.Canc, e.Fuma): np.linspace(0.02, 0.1, 5)}
+    queries = [('tb', e.TB, {e.Tos: True}), ('canc', e.Canc, {})]
+    whole = ib_sweep.sweep(net, queries, gamma, alpha)
+    chunked = ib_sweep.sweep(net, queries, gamma, alpha, chunk_size=4)
+    columns, _, _ = ib_sweep.parameter_grid(net, gamma, alpha)
+    assert len(whole) == 105
+    for name, values in columns:
+        assert list(chunked[name]) == list(values)
+    for name in whole.dtype.names:
+        assert list(chunked[name]) == pytest.approx(list(whole[name]))
+
+
+def test_sweep_impossible_evidence():
+    "Un punto con evidencia imposible vale NaN sin interrumpir el barrido."
+    net = ib_network.Network([ejercicio.Sintomas])
+    e = ejercicio
+    alpha = dict([((e.Tos, p), [0, 0.5]) for p in [e.TB, e.Canc, e.Gripe]])
+    ret = ib_sweep.sweep(net, [('tb', e.TB, {e.Tos: True})],
+                         gamma={e.Tos: [0, 0.5]}, alpha=alpha, grid=False)
+    assert np.isnan(ret['tb'][0])
+    _, gammas, alphas = ib_sweep.parameter_grid(net, {e.Tos: [0, 0.5]},
+                                                alpha, grid=False)
+    other = net.with_parameters(gammas[1], alphas[1])
+    assert ret['tb'][1] == pytest.approx(other.query('TB', {'Tos': True}))
@@ -1,6 +1,8 @@
 #-*- coding: utf-8 -*-
+import math
 import pytest
 import ib
+import ib_numeric
 import ejercicio
 import pdb
 from decimal import Decimal
@@ -93,3 +95,283 @@ def test_earthquake_partial_deps():
     assert (alarm_partial == pytest.approx(
         alarm_partial_b_true * Bulglar.prob_pos() +
         alarm_partial_b_false * Bulglar.prob_neg()))
+
+
+# Memoria de probabilidades
+
+def test_cache_hits():
+    "Las probabilidades de los padres se calculan una sola vez."
+    A = ib.BinaryEvent(gamma=0.1)
+    B = ib.BinaryEvent(gamma=0.2)
+    X = ib.BinaryEvent({A: 0.5, B: 0.5}, gamma=0.1)
+
+    X._prob_pos(method=ib.ENUMERATE)
+    assert A.cache_info().misses == 1
+    assert A.cache_info().hits > 0
+    X.cache_clear()
+
+    first = X._prob_pos()
+    assert X._prob_pos() == first
+    assert X.cache_info() == ib.CacheInfo(hits=1, misses=1, size=1)
+
+    # Las condiciones sobre eventos que no son dependencias no importan
+    X._prob_pos({X: True})
+    assert X.cache_info().hits == 2
+
+
+def test_cache_invalidation():
+    "Modificar gamma o deps de un ancestro invalida la memoria."
+    A = ib.BinaryEvent(gamma=0.1)
+    B = ib.BinaryEvent({A: 0.5}, gamma=0.2)
+    X = ib.BinaryEvent({B: 0.5})
+    Y = ib.JointProbability(X, B)
+
+    X.prob_pos()
+    Y.prob_pos()
+    A.gamma = 0.3
+    assert X.cache_info().size == 0
+    assert Y.cache_info().size == 0
+    assert X.prob_pos() == pytest.approx(
+        0.5 * (1 - 0.8 * (1 - 0.5 * 0.3)))
+
+    B.deps[A] = 1
+    assert X.prob_pos() == pytest.approx(0.5 * (1 - 0.8 * 0.7))
+
+    C = ib.BinaryEvent(gamma=1)
+    X.deps = {C: 1}
+    assert X.prob_pos() == 1
+    assert Y.deps_keys == {A, C}
+
+    # B ya no es dependencia de X: modificarlo no invalida a X
+    B.gamma = 0
+    assert X.cache_info().size == 1
+
+
+def test_joint_table(monkeypatch):
+    """
+    La tabla condicional de JointProbability se reutiliza entre consultas y
+    sólo se recalcula la fila del evento modificado.
+    """
+    F = ib.BinaryEvent(gamma=0.3)
+    A = ib.BinaryEvent({F: 0.2}, gamma=0.1)
+    B = ib.BinaryEvent(gamma=0.2)
+    C = ib.BinaryEvent(gamma=0.05)
+    X = ib.BinaryEvent({A: 0.5, B: 0.4}, gamma=0.01)
+    Y = ib.BinaryEvent({B: 0.3, C: 0.7})
+    Z = ib.BinaryEvent({A: 0.6, C: 0.2}, gamma=0.1)
+    J = ib.JointProbability(X, Y, Z)
+
+    calls = []
+    original = ib.BinaryEvent._p_pos_fw_full
+
+    def counted(self, full_config, backend=ib.DECIMAL):
+        calls.append(self)
+        return original(self, full_config, backend)
+
+    monkeypatch.setattr(ib.BinaryEvent, '_p_pos_fw_full', counted)
+
+    def check(*conditions):
+        for settings in conditions or ({}, {A: True}, {B: False, C: True}):
+            assert J.prob_pos(settings, ib.ENUMERATE) == pytest.approx(
+                J.prob_pos(settings))
+
+    def members():
+        "Eventos de J evaluados desde la última llamada."
+        ret = set(calls) & {X, Y, Z}
+        del calls[:]
+        return ret
+
+    check()
+    # Cada evento se evalúa una vez por configuración de sus dependencias
+    assert sorted(calls.count(x) for x in (X, Y, Z)) == [4, 4, 4]
+    members()
+    check({A: False}, {B: True, C: False})
+    assert members() == set()
+
+    Y.deps[C] = 0.9
+    check()
+    assert members() == {Y}
+
+    # Cambiar un ancestro más lejano no cambia la tabla condicional
+    F.gamma = 0.5
+    check()
+    assert members() == set()
+
+    # Si cambian las dependencias de la conjunción se rearma la tabla
+    D = ib.BinaryEvent(gamma=0.4)
+    Z.deps[D] = 0.3
+    check()
+    assert members() == {X, Y, Z}
+
+
+def test_joint_table_default(monkeypatch):
+    """
+    El método por defecto también usa la tabla condicional y coincide con
+    inclusión-exclusión.
+    """
+    A = ib.BinaryEvent(gamma=0.1)
+    B = ib.BinaryEvent(gamma=0.2)
+    C = ib.BinaryEvent({A: 0.3}, gamma=0.05)
+    X = ib.BinaryEvent({A: 0.5, B: 0.4}, gamma=0.01)
+    Y = ib.BinaryEvent({B: 0.3, C: 0.7})
+    Z = ib.BinaryEvent({A: 0.6, C: 0.2}, gamma=0.1)
+    J = ib.JointProbability(X, Y, Z)
+    conditions = [{}, {A: True}, {B: False, C: True}, {A: False, C: False}]
+
+    monkeypatch.setattr(ib, 'MAX_TABLE_DEPS', 0)
+    expected = [J._prob_pos(settings) for settings in conditions]
+    monkeypatch.undo()
+    J.cache_clear()
+
+    calls = []
+    original = ib.BinaryEvent._p_pos_fw_full
+
+    def counted(self, full_config, backend=ib.DECIMAL):
+        calls.append(self)
+        return original(self, full_config, backend)
+
+    monkeypatch.setattr(ib.BinaryEvent, '_p_pos_fw_full', counted)
+    for settings, value in zip(conditions, expected):
+        assert abs(J._prob_pos(settings) - value) < Decimal('1e-20')
+    # Cada evento se evalúa una vez por configuración de sus dependencias
+    assert sorted(calls.count(x) for x in (X, Y, Z)) == [4, 4, 4]
+    assert J.prob_pos({B: True}, backend='float') == pytest.approx(
+        J.prob_pos({B: True}))
+
+    # Con muchas dependencias y pocos eventos la tabla se arma recién en la
+    # segunda condición
+    parents = [ib.BinaryEvent(gamma=0.1 * i) for i in range(1, 9)]
+    U = ib.BinaryEvent(dict([(p, 0.3) for p in parents[:5]]), gamma=0.1)
+    V = ib.BinaryEvent(dict([(p, 0.2) for p in parents[3:]]))
+    K = ib.JointProbability(U, V)
+    del calls[:]
+    first = K._prob_pos()
+    assert calls == []
+    second = K._prob_pos({parents[0]: True})
+    assert len(calls) > 0
+    for settings, value in [({}, first), ({parents[0]: True}, second)]:
+        assert abs(K._prob_pos(settings, ib.ENUMERATE) - value) < \
+            Decimal('1e-20')
+
+
+# Marginalización factorizada
+
+def test_factorized_matches_enumerate():
+    "El cálculo factorizado coincide con la enumeración completa."
+    A = ib.BinaryEvent(gamma=0.3)
+    B = ib.BinaryEvent({A: 0.4}, gamma=0.1)
+    C = ib.BinaryEvent(gamma=0.6)
+    X = ib.BinaryEvent({A: 0.5, B: 0.9, C: 0.2}, gamma=0.05)
+    Y = ib.BinaryEvent({B: 0.3, C: 0.7})
+    XY = ib.JointProbability(X, Y)
+
+    for settings in [{}, {A: True}, {B: False, C: True},
+                     {A: False, B: True, C: False}]:
+        for ev in [X, Y, XY]:
+            assert (abs(ev._prob_pos(settings, ib.FACTORIZED) -
+                        ev._prob_pos(settings, ib.ENUMERATE)) <
+                    Decimal('1e-20'))
+
+
+def test_factorized_many_deps():
+    "Un evento con muchas dependencias se calcula sin enumerarlas."
+    parents = [ib.BinaryEvent(gamma=0.01 * i) for i in range(40)]
+    X = ib.BinaryEvent(dict([(p, 0.5) for p in parents]), gamma=0.1)
+
+    expected = 1 - 0.1
+    for i in range(40):
+        expected *= 1 - 0.5 * 0.01 * i
+    assert X.prob_neg() == pytest.approx(expected)
+    assert X.prob_neg({parents[1]: True}) == pytest.approx(
+        expected / (1 - 0.005) * 0.5)
+
+
+@pytest.mark.parametrize('max_table_deps', [0, ib.MAX_TABLE_DEPS])
+def test_joint_many_events(monkeypatch, max_table_deps):
+    "Una conjunción de muchos eventos con pocas dependencias no es exponencial."
+    monkeypatch.setattr(ib, 'MAX_TABLE_DEPS', max_table_deps)
+    A = ib.BinaryEvent(gamma=0.3)
+    B = ib.BinaryEvent(gamma=0.6)
+    findings = [ib.BinaryEvent({A: 0.5, B: 0.1 * (i % 9)}, gamma=0.01 * i)
+                for i in range(40)]
+    joint = ib.JointProbability(*findings)
+
+    for settings in [{}, {A: True}, {A: False, B: True}]:
+        expected = Decimal(0)
+        for a in [True, False]:
+            for b in [True, False]:
+                config = set([k for k, v in [(A, a), (B, b)] if v])
+                if not joint._is_compatible(config, settings):
+                    continue
+                p = joint._p_pos_fw_full(config)
+                for k, v in [(A, a), (B, b)]:
+                    if k not in settings:
+                        p *= k._prob_pos() if v else k._prob_neg()
+                expected += p
+        assert joint.prob_pos(settings) == pytest.approx(float(expected))
+
+
+# Backends numéricos
+
+@pytest.mark.parametrize('backend', ['float', 'log'])
+@pytest.mark.parametrize('method', [ib.FACTORIZED, ib.ENUMERATE])
+def test_backends(backend, method):
+    "Los backends de punto flotante coinciden con Decimal."
+    tolerance = ib_numeric.TOLERANCE[backend]
+    queries = [
+        (Earthquake, {}), (Bulglar, {}), (Alarm, {}),
+        (Alarm, {Bulglar: True}), (Alarm, {Bulglar: False}),
+        (Alarm, {Bulglar: True, Earthquake: True}),
+        (Alarm, {Bulglar: False, Earthquake: False}),
+        (Phonecall, {}), (Phonecall, {Alarm: True}),
+        (Phonecall, {Alarm: False}), (Radio, {Earthquake: True}),
+        (ejercicio.Tos, {}), (ejercicio.Tos, {ejercicio.TB: True}),
+        (ejercicio.Sintomas, {}), (ejercicio.Sintomas, {ejercicio.TB: True}),
+        (ejercicio.Sintomas, {ejercicio.Canc: True}),
+    ]
+    for ev, settings in queries:
+        for prob in ['prob_pos', 'prob_neg']:
+            expected = getattr(ev, prob)(settings, method)
+            result = getattr(ev, prob)(settings, method, backend)
+            assert result == pytest.approx(expected, rel=tolerance, abs=1e-300)
+
+
+def test_set_backend():
+    "El backend por defecto de una red se usa si la consulta no indica uno."
+    A = ib.BinaryEvent(gamma=0.3)
+    X = ib.BinaryEvent({A: 0.5}, gamma=0.1)
+    Y = ib.BinaryEvent({A: 0.2}, gamma=0.4)
+    XY = ib.JointProbability(X, Y)
+    ib.set_backend([XY], 'float')
+    assert [ev.backend for ev in [A, X, Y, XY]] == ['float'] * 4
+    assert X.prob_pos() == pytest.approx(X.prob_pos(backend='decimal'))
+    assert XY.prob_pos() == pytest.approx(XY.prob_pos(backend='decimal'))
+    assert sorted(key[1] for key in X._cache) == ['decimal', 'float']
+
+    ib.set_backend([XY], None)
+    X.cache_clear()
+    X.prob_pos()
+    assert [key[1] for key in X._cache] == ['decimal']
+    with pytest.raises(ValueError):
+        ib.set_backend([XY], 'otro')
+
+
+def test_log_prob_pos():
+    "log_prob_pos no da underflow con muchos eventos en la conjunción."
+    for ev, settings in [(Alarm, {Bulglar: True}), (Phonecall, {}),
+                         (ejercicio.Sintomas, {ejercicio.TB: True})]:
+        assert ev.log_prob_pos(settings) == pytest.approx(
+            math.log(ev.prob_pos(settings)), rel=1e-9)
+        assert ev.log_prob_neg(settings) == pytest.approx(
+            math.log(ev.prob_neg(settings)), rel=1e-9)
+
+    causes = [ib.BinaryEvent(gamma=0.5) for _ in range(3)]
+    findings = [ib.BinaryEvent(dict([(c, 0.01) for c in causes]), gamma=1e-4)
+                for _ in range(300)]
+    joint = ib.JointProbability(*findings)
+    assert joint.prob_pos(method=ib.ENUMERATE, backend='float') == 0
+    log_p = joint.log_prob_pos()
+    # Sólo la configuración con todas las causas aporta: las demás son más
+    # chicas en un factor de al menos (0.0298 / 0.0199)^300
+    single = math.log(0.125) + 300 * math.log(1 - 0.9999 * 0.99 ** 3)
+    assert log_p == pytest.approx(single, rel=1e-6)
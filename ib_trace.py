@@ -0,0 +1,304 @@
+#-*- coding: utf-8 -*-
+"""
+Instrumentación de las consultas sobre BinaryEvent y JointProbability.
+
+Para entender por qué una consulta es lenta, Trace registra por cada evento
+involucrado:
+
+    * calls: llamadas (recursivas) a _prob_pos
+    * hits, misses: aciertos y fallos de la memoria de probabilidades
+    * configurations: configuraciones de las dependencias enumeradas
+      (method=ENUMERATE), esto es, llamadas a _is_compatible
+    * rejections: configuraciones descartadas por _is_compatible
+    * total_time: tiempo en _prob_pos, incluyendo las llamadas a otros eventos
+    * self_time: tiempo en _prob_pos sin contar las llamadas a otros eventos
+
+La instrumentación no agrega ningún costo cuando no está activa: Trace
+reemplaza los métodos de BinaryEvent sólo mientras dura el bloque with y
+los restaura al salir. Como los métodos se reemplazan en la clase, puede
+haber un único Trace activo por proceso (activar otro, incluso desde otro
+thread, es un error) y sólo se registran las consultas del thread que lo
+activó; las de los demás threads se calculan sin registrar.
+
+Ej:
+    with ib_trace.Trace() as trace:
+        Sintomas.prob_pos({TB: True}, method=ib.ENUMERATE)
+    print(trace.summary())
+    trace.dump('trace.json', ib_trace.CHROME)  # ver en chrome://tracing
+
+Las estadísticas se agrupan por consulta: cada llamada de primer nivel a
+_prob_pos (por ejemplo un prob_pos del usuario) es una QueryRecord, que se
+pasa además al callback opcional de Trace.
+"""
+from __future__ import print_function, division, unicode_literals
+import io
+import json
+import threading
+import timeit
+
+import ib
+
+# Formatos de Trace.dump
+JSON = 'json'
+CHROME = 'chrome'
+
+_timer = timeit.default_timer
+_original = {}
+_active = None
+_lock = threading.Lock()
+
+
+def _label(ev):
+    "Nombre legible de un evento."
+    if isinstance(ev, ib.JointProbability) and ev.name is None:
+        return 'Joint({})'.format(', '.join(_label(x) for x in ev.events))
+    return repr(ev)
+
+
+class NodeStats(object):
+    "Estadísticas de un evento (ver la documentación del módulo)."
+    __slots__ = ('calls', 'hits', 'misses', 'configurations', 'rejections',
+                 'total_time', 'self_time')
+
+    def __init__(self):
+        for attr in self.__slots__:
+            setattr(self, attr, 0)
+
+    def merge(self, other):
+        for attr in self.__slots__:
+            setattr(self, attr, getattr(self, attr) + getattr(other, attr))
+
+    def as_dict(self):
+        return dict([(attr, getattr(self, attr)) for attr in self.__slots__])
+
+    def __repr__(self):
+        return 'NodeStats({})'.format(', '.join(
+            '{}={}'.format(attr, getattr(self, attr))
+            for attr in self.__slots__))
+
+
+class QueryRecord(object):
+    """
+    Estadísticas de una consulta.
+
+    Atributos:
+        event: evento consultado
+        deps_settings: condiciones de la consulta
+        method: método de marginalización
+        backend: nombre del backend numérico
+        seconds: duración de la consulta
+        nodes: diccionario evento -> NodeStats
+    """
+    __slots__ = ('event', 'deps_settings', 'method', 'backend', 'seconds',
+                 'nodes')
+
+    def __init__(self, event, deps_settings, method, backend):
+        self.event = event
+        self.deps_settings = dict(deps_settings)
+        self.method = method
+        self.backend = backend
+        self.seconds = 0.0
+        self.nodes = {}
+
+    def stats(self, ev):
+        try:
+            return self.nodes[ev]
+        except KeyError:
+            ret = self.nodes[ev] = NodeStats()
+            return ret
+
+    def as_dict(self):
+        return {
+            'event': _label(self.event),
+            'deps_settings': dict([(_label(k), bool(v))
+                                   for k, v in self.deps_settings.items()]),
+            'method': self.method,
+            'backend': self.backend,
+            'seconds': self.seconds,
+            'nodes': dict([(_label(k), v.as_dict())
+                           for k, v in self.nodes.items()]),
+        }
+
+
+def _recording():
+    "Trace activo si la llamada es del thread que lo activó, si no None."
+    trace = _active
+    if trace is not None and trace._thread is threading.current_thread():
+        return trace
+    return None
+
+
+def _traced_prob_pos(self, deps_settings={}, method=ib.FACTORIZED,
+                     backend=ib.DECIMAL):
+    trace = _recording()
+    if trace is None:
+        return _original['_prob_pos'](self, deps_settings, method, backend)
+    return trace._prob_pos(self, deps_settings, method, backend)
+
+
+def _traced_is_compatible(self, full_config, partial_config):
+    ret = _original['_is_compatible'](self, full_config, partial_config)
+    trace = _recording()
+    query = trace._query if trace is not None else None
+    if query is not None:
+        stats = query.stats(self)
+        stats.configurations += 1
+        if not ret:
+            stats.rejections += 1
+    return ret
+
+
+_TRACED = {
+    '_prob_pos': _traced_prob_pos,
+    '_is_compatible': _traced_is_compatible,
+}
+
+
+class Trace(object):
+    """
+    Contexto que instrumenta las consultas sobre eventos binarios.
+
+    Atributos:
+        queries: lista de QueryRecord, una por consulta de primer nivel
+        spans: lista de (evento, inicio, duración, profundidad) por cada
+            llamada a _prob_pos, con los tiempos en segundos desde que se
+            activó el Trace
+    """
+
+    def __init__(self, callback=None, spans=True):
+        """
+        Args:
+            callback: función que recibe cada QueryRecord al terminar la
+                consulta
+            spans: si es False no se registran las llamadas individuales
+                (ahorra memoria en consultas con muchas llamadas)
+        """
+        self.callback = callback
+        self.record_spans = spans
+        self.queries = []
+        self.spans = []
+        self._query = None
+        self._stack = []
+        self._origin = None
+        self._thread = None
+
+    def __enter__(self):
+        global _active
+        with _lock:
+            if _active is not None:
+                raise RuntimeError('Ya hay un Trace activo')
+            self._origin = _timer()
+            self._thread = threading.current_thread()
+            for name, func in _TRACED.items():
+                _original[name] = ib.BinaryEvent.__dict__[name]
+                setattr(ib.BinaryEvent, name, func)
+            _active = self
+        return self
+
+    def __exit__(self, *exc):
+        global _active
+        with _lock:
+            _active = None
+            # _original se conserva: otros threads pueden estar todavía
+            # dentro de un método instrumentado
+            for name in _TRACED:
+                setattr(ib.BinaryEvent, name, _original[name])
+        return False
+
+    def _prob_pos(self, ev, deps_settings, method, backend):
+        "Versión instrumentada de BinaryEvent._prob_pos."
+        stack = self._stack
+        if not stack:
+            self._query = QueryRecord(ev, deps_settings, method, backend.name)
+        hits = ev._cache_hits
+        children = [0.0]
+        stack.append(children)
+        start = _timer()
+        try:
+            return _original['_prob_pos'](ev, deps_settings, method, backend)
+        finally:
+            elapsed = _timer() - start
+            stack.pop()
+            query = self._query
+            stats = query.stats(ev)
+            stats.calls += 1
+            if ev._cache_hits > hits:
+                stats.hits += 1
+            else:
+                stats.misses += 1
+            stats.total_time += elapsed
+            stats.self_time += elapsed - children[0]
+            if self.record_spans:
+                self.spans.append((ev, start - self._origin, elapsed,
+                                   len(stack)))
+            if stack:
+                stack[-1][0] += elapsed
+            else:
+                query.seconds = elapsed
+                self.queries.append(query)
+                self._query = None
+                if self.callback is not None:
+                    self.callback(query)
+
+    def nodes(self):
+        "Diccionario evento -> NodeStats acumulado sobre todas las consultas."
+        ret = {}
+        for query in self.queries:
+            for ev, stats in query.nodes.items():
+                ret.setdefault(ev, NodeStats()).merge(stats)
+        return ret
+
+    def summary(self, key='self_time', limit=None):
+        """
+        Tabla con las estadísticas de cada evento, ordenada de mayor a menor
+        por key.
+        """
+        nodes = sorted(self.nodes().items(), key=lambda kv: -getattr(kv[1], key))
+        if limit is not None:
+            nodes = nodes[:limit]
+        header = '{:<30} {:>8} {:>8} {:>8} {:>10} {:>10} {:>11} {:>11}'
+        row = '{:<30} {:>8} {:>8} {:>8} {:>10} {:>10} {:>11.3f} {:>11.3f}'
+        lines = [header.format('evento', 'calls', 'hits', 'misses', 'configs',
+                               'rejected', 'total[ms]', 'self[ms]')]
+        for ev, s in nodes:
+            lines.append(row.format(_label(ev)[:30], s.calls, s.hits, s.misses,
+                                    s.configurations, s.rejections,
+                                    s.total_time * 1e3, s.self_time * 1e3))
+        return '\n'.join(lines)
+
+    def as_dict(self):
+        return {
+            'queries': [q.as_dict() for q in self.queries],
+            'nodes': dict([(_label(k), v.as_dict())
+                           for k, v in self.nodes().items()]),
+        }
+
+    def chrome_trace(self):
+        """
+        Las llamadas registradas en el formato de eventos de Chrome
+        (chrome://tracing, Perfetto o speedscope).
+        """
+        return {'traceEvents': [
+            {'name': _label(ev), 'ph': 'X', 'pid': 0, 'tid': 0,
+             'ts': start * 1e6, 'dur': elapsed * 1e6,
+             'args': {'depth': depth}}
+            for ev, start, elapsed, depth in self.spans]}
+
+    def dump(self, path, format=JSON):
+        """
+        Guarda el trace en un archivo.
+
+        Args:
+            path: ruta del archivo
+            format: JSON (estadísticas por consulta y por evento) o CHROME
+                (ver chrome_trace)
+        """
+        if format == JSON:
+            data = self.as_dict()
+        elif format == CHROME:
+            data = self.chrome_trace()
+        else:
+            raise ValueError('Formato desconocido: {}'.format(format))
+        with io.open(path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(data, indent=2, sort_keys=True,
+                               ensure_ascii=False))
@@ -0,0 +1,101 @@
+#-*- coding: utf-8 -*-
+import json
+import threading
+import pytest
+import ib
+import ib_trace
+
+
+def new_events():
+    robo = ib.BinaryEvent(gamma=0.01, name='Robo')
+    terremoto = ib.BinaryEvent(gamma=0.02, name='Terremoto')
+    alarma = ib.BinaryEvent({robo: 0.94, terremoto: 0.29}, gamma=0.001,
+                            name='Alarma')
+    return robo, terremoto, alarma
+
+
+def test_counts():
+    robo, terremoto, alarma = new_events()
+    queries = []
+    with ib_trace.Trace(callback=queries.append) as trace:
+        p = alarma.prob_pos({robo: True}, method=ib.ENUMERATE)
+        alarma.prob_pos({robo: True}, method=ib.ENUMERATE)
+    assert p == alarma.prob_pos({robo: True}, method=ib.ENUMERATE)
+    assert [q.event for q in queries] == [alarma, alarma]
+    assert trace.queries == queries
+
+    first = queries[0].nodes
+    # 4 configuraciones de (Robo, Terremoto), 2 incompatibles con Robo = 1
+    assert first[alarma].configurations == 4
+    assert first[alarma].rejections == 2
+    assert first[alarma].misses == 1
+    # Terremoto se consulta una vez por configuración compatible
+    assert first[terremoto].calls == 2
+    assert first[terremoto].hits == 1
+    assert robo not in first
+
+    second = queries[1].nodes
+    assert second[alarma].hits == 1
+    assert list(second) == [alarma]
+
+    nodes = trace.nodes()
+    assert nodes[alarma].calls == 2
+    assert nodes[alarma].total_time >= nodes[alarma].self_time >= 0
+    assert 'Bi(Alarma)' in trace.summary()
+
+
+def test_disabled():
+    "Fuera del bloque with los métodos originales quedan restaurados."
+    original = ib.BinaryEvent.__dict__['_prob_pos']
+    with pytest.raises(ZeroDivisionError):
+        with ib_trace.Trace():
+            assert ib.BinaryEvent.__dict__['_prob_pos'] is not original
+            1 / 0
+    assert ib.BinaryEvent.__dict__['_prob_pos'] is original
+    assert ib.BinaryEvent.__dict__['_is_compatible'] is \
+        ib.JointProbability._is_compatible
+
+    with ib_trace.Trace():
+        with pytest.raises(RuntimeError):
+            ib_trace.Trace().__enter__()
+
+
+def test_threads():
+    "Sólo se registran las consultas del thread que activó el Trace."
+    robo, terremoto, alarma = new_events()
+    errors = []
+
+    def other():
+        try:
+            alarma.prob_pos({terremoto: True})
+            ib_trace.Trace().__enter__()
+        except RuntimeError as e:
+            errors.append(e)
+
+    with ib_trace.Trace() as trace:
+        thread = threading.Thread(target=other)
+        thread.start()
+        thread.join()
+        alarma.prob_pos({robo: True})
+    assert len(errors) == 1
+    assert [(q.event, q.deps_settings) for q in trace.queries] == \
+        [(alarma, {robo: True})]
+
+
+def test_dump(tmpdir):
+    robo, terremoto, alarma = new_events()
+    # Alarma y Radio no dependen entre si: comparten a Terremoto
+    radio = ib.BinaryEvent({terremoto: 0.5}, name='Radio')
+    joint = ib.JointProbability(alarma, radio)
+    with ib_trace.Trace() as trace:
+        joint.prob_pos()
+    path = str(tmpdir.join('trace.json'))
+    trace.dump(path)
+    data = json.load(open(path))
+    assert data['queries'][0]['event'] == 'Joint(Bi(Alarma), Bi(Radio))'
+    assert 'Bi(Terremoto)' in data['nodes']
+
+    trace.dump(path, ib_trace.CHROME)
+    events = json.load(open(path))['traceEvents']
+    assert len(events) == len(trace.spans)
+    assert all(e['ph'] == 'X' for e in events)